@@ -123,7 +123,11 @@ declare
 begin
     _opclass = config operator(pg_catalog.->>) 'opclass';
     if _opclass is not null
-    and not (_opclass operator(pg_catalog.=) any(array['vector_ip_ops', 'vector_cosine_ops', 'vector_l1_ops'])) then
+    and not (_opclass operator(pg_catalog.=) any(array
+        [ 'vector_ip_ops', 'vector_cosine_ops', 'vector_l1_ops'
+        , 'halfvec_ip_ops', 'halfvec_cosine_ops', 'halfvec_l1_ops'
+        , 'bit_hamming_ops', 'bit_jaccard_ops'
+        ])) then
         raise exception 'invalid opclass';
     end if;
 end
@@ -167,3 +171,114 @@ $func$ language plpgsql immutable security invoker
 set search_path to pg_catalog, pg_temp
 ;
 
+
+-------------------------------------------------------------------------------
+-- storage_vector
+create or replace function ai.storage_vector() returns pg_catalog.jsonb
+as $func$
+    select jsonb_build_object
+    ( 'implementation', 'vector'
+    , 'config_type', 'storage'
+    )
+$func$ language sql immutable security invoker
+set search_path to pg_catalog, pg_temp
+;
+
+-------------------------------------------------------------------------------
+-- storage_halfvec
+create or replace function ai.storage_halfvec() returns pg_catalog.jsonb
+as $func$
+    select jsonb_build_object
+    ( 'implementation', 'halfvec'
+    , 'config_type', 'storage'
+    )
+$func$ language sql immutable security invoker
+set search_path to pg_catalog, pg_temp
+;
+
+-------------------------------------------------------------------------------
+-- storage_bit
+create or replace function ai.storage_bit() returns pg_catalog.jsonb
+as $func$
+    select jsonb_build_object
+    ( 'implementation', 'bit'
+    , 'config_type', 'storage'
+    )
+$func$ language sql immutable security invoker
+set search_path to pg_catalog, pg_temp
+;
+
+-------------------------------------------------------------------------------
+-- _validate_storage
+create or replace function ai._validate_storage(config pg_catalog.jsonb) returns void
+as $func$
+declare
+    _config_type pg_catalog.text;
+    _implementation pg_catalog.text;
+begin
+    if pg_catalog.jsonb_typeof(config) operator(pg_catalog.!=) 'object' then
+        raise exception 'storage config is not a jsonb object';
+    end if;
+
+    _config_type = config operator(pg_catalog.->>) 'config_type';
+    if _config_type is null or _config_type operator(pg_catalog.!=) 'storage' then
+        raise exception 'invalid config_type for storage config';
+    end if;
+    _implementation = config operator(pg_catalog.->>) 'implementation';
+    case _implementation
+        when 'vector' then
+            -- ok
+        when 'halfvec' then
+            -- ok
+        when 'bit' then
+            -- ok
+        else
+            if _implementation is null then
+                raise exception 'storage implementation not specified';
+            else
+                raise exception 'invalid storage implementation: "%"', _implementation;
+            end if;
+    end case;
+end
+$func$ language plpgsql immutable security invoker
+set search_path to pg_catalog, pg_temp
+;
+
+-------------------------------------------------------------------------------
+-- _resolve_indexing_storage
+create or replace function ai._resolve_indexing_storage
+( indexing pg_catalog.jsonb
+, storage pg_catalog.jsonb
+) returns pg_catalog.jsonb
+as $func$
+declare
+    _storage pg_catalog.text;
+    _opclass pg_catalog.text;
+begin
+    _storage = storage operator(pg_catalog.->>) 'implementation';
+    case indexing operator(pg_catalog.->>) 'implementation'
+        when 'diskann' then
+            if _storage operator(pg_catalog.!=) 'vector' then
+                raise exception 'diskann indexing requires ai.storage_vector()';
+            end if;
+        when 'hnsw' then
+            -- the opclasses of vector columns are translated to the matching
+            -- opclass of the storage type. bit columns only support hamming
+            -- and jaccard distances, vector distances translate to hamming
+            _opclass = coalesce(indexing operator(pg_catalog.->>) 'opclass', 'vector_cosine_ops');
+            if _opclass operator(pg_catalog.^@) 'vector_' and _storage operator(pg_catalog.=) 'halfvec' then
+                _opclass = pg_catalog.concat('halfvec_', pg_catalog.substr(_opclass, 8));
+            elsif _opclass operator(pg_catalog.^@) 'vector_' and _storage operator(pg_catalog.=) 'bit' then
+                _opclass = 'bit_hamming_ops';
+            elsif not (_opclass operator(pg_catalog.^@) pg_catalog.concat(_storage, '_')) then
+                raise exception 'opclass % does not support ai.storage_%()', _opclass, _storage;
+            end if;
+            indexing = pg_catalog.jsonb_set(indexing, array['opclass'], pg_catalog.to_jsonb(_opclass));
+        else
+            -- ok
+    end case;
+    return indexing;
+end
+$func$ language plpgsql immutable security invoker
+set search_path to pg_catalog, pg_temp
+;
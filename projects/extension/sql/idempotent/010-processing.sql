@@ -4,6 +4,11 @@
 create or replace function ai.processing_default
 ( batch_size pg_catalog.int4 default null
 , concurrency pg_catalog.int4 default null
+, max_in_flight pg_catalog.int4 default null
+, notify pg_catalog.bool default null
+, deduplicate_queue pg_catalog.bool default null
+, queue_partitions pg_catalog.int4 default null
+, lease_seconds pg_catalog.int4 default null
 ) returns pg_catalog.jsonb
 as $func$
     select json_object
@@ -11,6 +16,11 @@ as $func$
     , 'config_type': 'processing'
     , 'batch_size': batch_size
     , 'concurrency': concurrency
+    , 'max_in_flight': max_in_flight
+    , 'notify': notify
+    , 'deduplicate_queue': deduplicate_queue
+    , 'queue_partitions': queue_partitions
+    , 'lease_seconds': lease_seconds
     absent on null
     )
 $func$ language sql immutable security invoker
@@ -62,6 +72,59 @@ begin
                     raise exception 'concurrency must be greater than 0';
                 end if;
             end if;
+
+            _val = pg_catalog.jsonb_extract_path(config, 'max_in_flight');
+            if _val is not null then
+                if pg_catalog.jsonb_typeof(_val) operator(pg_catalog.!=) 'number' then
+                    raise exception 'max_in_flight must be a number';
+                end if;
+                if cast(_val as pg_catalog.int4) operator(pg_catalog.>) 50 then
+                    raise exception 'max_in_flight must be less than or equal to 50';
+                end if;
+                if cast(_val as pg_catalog.int4) operator(pg_catalog.<) 1 then
+                    raise exception 'max_in_flight must be greater than 0';
+                end if;
+            end if;
+
+            _val = pg_catalog.jsonb_extract_path(config, 'notify');
+            if _val is not null then
+                if pg_catalog.jsonb_typeof(_val) operator(pg_catalog.!=) 'boolean' then
+                    raise exception 'notify must be a boolean';
+                end if;
+            end if;
+
+            _val = pg_catalog.jsonb_extract_path(config, 'deduplicate_queue');
+            if _val is not null then
+                if pg_catalog.jsonb_typeof(_val) operator(pg_catalog.!=) 'boolean' then
+                    raise exception 'deduplicate_queue must be a boolean';
+                end if;
+            end if;
+
+            _val = pg_catalog.jsonb_extract_path(config, 'queue_partitions');
+            if _val is not null then
+                if pg_catalog.jsonb_typeof(_val) operator(pg_catalog.!=) 'number' then
+                    raise exception 'queue_partitions must be a number';
+                end if;
+                if cast(_val as pg_catalog.int4) operator(pg_catalog.>) 64 then
+                    raise exception 'queue_partitions must be less than or equal to 64';
+                end if;
+                if cast(_val as pg_catalog.int4) operator(pg_catalog.<) 1 then
+                    raise exception 'queue_partitions must be greater than 0';
+                end if;
+            end if;
+
+            _val = pg_catalog.jsonb_extract_path(config, 'lease_seconds');
+            if _val is not null then
+                if pg_catalog.jsonb_typeof(_val) operator(pg_catalog.!=) 'number' then
+                    raise exception 'lease_seconds must be a number';
+                end if;
+                if cast(_val as pg_catalog.int4) operator(pg_catalog.>) 86400 then
+                    raise exception 'lease_seconds must be less than or equal to 86400';
+                end if;
+                if cast(_val as pg_catalog.int4) operator(pg_catalog.<) 1 then
+                    raise exception 'lease_seconds must be greater than 0';
+                end if;
+            end if;
         else
             if _implementation is null then
                 raise exception 'processing implementation not specified';
@@ -21,6 +21,51 @@ language sql stable security invoker
 set search_path to pg_catalog, pg_temp
 ;
 
+-------------------------------------------------------------------------------
+-- _vectorizer_embedded_columns
+create or replace function ai._vectorizer_embedded_columns
+( source_schema pg_catalog.name
+, source_table pg_catalog.name
+, chunking pg_catalog.jsonb
+, formatting pg_catalog.jsonb
+) returns pg_catalog.name[] as
+$func$
+    -- the columns of the source table whose values end up in the embedded
+    -- text: the chunk column, and the columns referenced by $column or
+    -- ${column} placeholders of the formatting template ($$ is an escaped $)
+    -- returns null if they cannot be determined
+    select case
+        when chunking operator(pg_catalog.->>) 'chunk_column' is null then null
+        when formatting operator(pg_catalog.->>) 'implementation' operator(pg_catalog.!=) 'python_template' then null
+        else
+        (
+            select pg_catalog.array_agg(a.attname order by a.attnum)
+            from pg_catalog.pg_class k
+            inner join pg_catalog.pg_namespace n on (k.relnamespace operator(pg_catalog.=) n.oid)
+            inner join pg_catalog.pg_attribute a on (k.oid operator(pg_catalog.=) a.attrelid)
+            where n.nspname operator(pg_catalog.=) source_schema
+            and k.relname operator(pg_catalog.=) source_table
+            and a.attnum operator(pg_catalog.>) 0
+            and not a.attisdropped
+            and
+            ( a.attname operator(pg_catalog.=) chunking operator(pg_catalog.->>) 'chunk_column'
+            or a.attname operator(pg_catalog.=) any
+              (
+                select m[1]
+                from pg_catalog.regexp_matches
+                ( pg_catalog.replace(formatting operator(pg_catalog.->>) 'template', '$$', '')
+                , '\$\{?([_A-Za-z][_A-Za-z0-9]*)'
+                , 'g'
+                ) m
+              )
+            )
+        )
+    end
+$func$
+language sql stable security invoker
+set search_path to pg_catalog, pg_temp
+;
+
 -------------------------------------------------------------------------------
 -- _vectorizer_grant_to_source
 create or replace function ai._vectorizer_grant_to_source
@@ -105,6 +150,7 @@ create or replace function ai._vectorizer_create_target_table
 , target_schema pg_catalog.name
 , target_table pg_catalog.name
 , dimensions pg_catalog.int4
+, storage pg_catalog.jsonb
 , grant_to pg_catalog.name[]
 ) returns void as
 $func$
@@ -124,7 +170,7 @@ begin
     , %s
     , chunk_seq int not null
     , chunk text not null
-    , embedding @extschema:vector@.vector(%L) storage main not null
+    , embedding %s storage main not null
     , unique (%s, chunk_seq)
     , foreign key (%s) references %I.%I (%s) on delete cascade
     )
@@ -144,7 +190,11 @@ begin
         from pg_catalog.jsonb_to_recordset(source_pk)
             x(attnum int, attname name, typname name)
       )
-    , dimensions
+    , case storage operator(pg_catalog.->>) 'implementation'
+        when 'halfvec' then pg_catalog.format('@extschema:vector@.halfvec(%L)', dimensions)
+        when 'bit' then pg_catalog.format('pg_catalog.bit(%L)', dimensions)
+        else pg_catalog.format('@extschema:vector@.vector(%L)', dimensions)
+      end
     , _pk_cols
     , _pk_cols
     , source_schema, source_table
@@ -398,14 +448,27 @@ create or replace function ai._vectorizer_create_queue_table
 , queue_table pg_catalog.name
 , source_pk pg_catalog.jsonb
 , grant_to pg_catalog.name[]
+, deduplicate pg_catalog.bool default false
+, partitions pg_catalog.int4 default null
+, lease pg_catalog.bool default false
 ) returns void as
 $func$
 declare
     _sql pg_catalog.text;
+    _pk_columns pg_catalog.text;
+    _tables pg_catalog.name[];
+    _partition pg_catalog.name;
 begin
+    select pg_catalog.string_agg(pg_catalog.format('%I', x.attname), ', ' order by x.pknum)
+    into strict _pk_columns
+    from pg_catalog.jsonb_to_recordset(source_pk) x(pknum int, attname name)
+    ;
+
     -- create the table
+    -- with leases, workers mark the rows they claim instead of deleting them
+    -- until their embeddings are written
     select pg_catalog.format
-    ( $sql$create table %I.%I(%s, queued_at timestamptz not null default now())$sql$
+    ( $sql$create table %I.%I(%s, queued_at timestamptz not null default now()%s)%s$sql$
     , queue_schema, queue_table
     , (
         select pg_catalog.string_agg
@@ -420,22 +483,57 @@ begin
         )
         from pg_catalog.jsonb_to_recordset(source_pk) x(attnum int, attname name, typname name)
       )
+    , case when lease then ', claim_id uuid, claimed_until timestamptz' else '' end
+    , case when partitions is not null
+        then pg_catalog.format(' partition by hash (%s)', _pk_columns)
+        else ''
+      end
     ) into strict _sql
     ;
     execute _sql;
+    _tables = array[queue_table];
+
+    -- create the partitions, one per worker slot
+    -- the suffix fits in the name when the queue table's name is truncated
+    for _i in 0..coalesce(partitions, 0) operator(pg_catalog.-) 1
+    loop
+        _partition = pg_catalog.format('%s_%s', pg_catalog.left(queue_table, 60), _i);
+        select pg_catalog.format
+        ( $sql$create table %I.%I partition of %I.%I for values with (modulus %s, remainder %s)$sql$
+        , queue_schema, _partition
+        , queue_schema, queue_table
+        , partitions
+        , _i
+        ) into strict _sql
+        ;
+        execute _sql;
+        _tables = pg_catalog.array_append(_tables, _partition);
+    end loop;
 
     -- create the index
+    -- a deduplicated queue holds each row of the source table at most once
     select pg_catalog.format
-    ( $sql$create index on %I.%I (%s)$sql$
+    ( $sql$create %sindex on %I.%I (%s)$sql$
+    , case when deduplicate then 'unique ' else '' end
     , queue_schema, queue_table
-    , (
-        select pg_catalog.string_agg(pg_catalog.format('%I', x.attname), ', ' order by x.pknum)
-        from pg_catalog.jsonb_to_recordset(source_pk) x(pknum int, attname name)
-      )
+    , _pk_columns
     ) into strict _sql
     ;
     execute _sql;
 
+    -- workers claim the rows of a partition in the order they were queued
+    -- and ai.vectorizer_status reads the oldest queued_at without a scan
+    -- other queues are claimed in no particular order, and don't pay for
+    -- maintaining the index on every enqueue
+    if partitions is not null then
+        select pg_catalog.format
+        ( $sql$create index on %I.%I (queued_at)$sql$
+        , queue_schema, queue_table
+        ) into strict _sql
+        ;
+        execute _sql;
+    end if;
+
     if grant_to is not null then
         -- grant usage on queue schema to grant_to roles
         select pg_catalog.format
@@ -448,11 +546,14 @@ begin
         ) into strict _sql;
         execute _sql;
 
-        -- grant select, update, delete on queue table to grant_to roles
+        -- grant select, update, delete on queue table and its partitions to grant_to roles
+        -- the partitions are claimed from directly, bypassing the privileges of the queue table
         select pg_catalog.format
-        ( $sql$grant select, insert, update, delete on %I.%I to %s$sql$
-        , queue_schema
-        , queue_table
+        ( $sql$grant select, insert, update, delete on %s to %s$sql$
+        , (
+            select pg_catalog.string_agg(pg_catalog.format('%I.%I', queue_schema, x), ', ')
+            from pg_catalog.unnest(_tables) x
+          )
         , (
             select pg_catalog.string_agg(pg_catalog.quote_ident(x), ', ')
             from pg_catalog.unnest(grant_to) x
@@ -475,11 +576,33 @@ create or replace function ai._vectorizer_create_source_trigger
 , source_schema pg_catalog.name
 , source_table pg_catalog.name
 , source_pk pg_catalog.jsonb
+, notify_channel pg_catalog.text default null
+, embedded_columns pg_catalog.name[] default null
+, deduplicate_queue pg_catalog.bool default false
+, lease pg_catalog.bool default false
 ) returns void as
 $func$
 declare
+    _on_conflict pg_catalog.text = '';
     _sql pg_catalog.text;
 begin
+    -- rows already in a deduplicated queue keep their queued_at, so that rows
+    -- updated more often than the queue is drained aren't starved. their
+    -- claim is released, so that a worker processing them doesn't write
+    -- embeddings of the old values
+    if deduplicate_queue then
+        select pg_catalog.format
+        ( $sql$
+        on conflict (%s) do %s$sql$
+        , (
+            select pg_catalog.string_agg(pg_catalog.format('%I', x.attname), ', ' order by x.pknum)
+            from pg_catalog.jsonb_to_recordset(source_pk) x(pknum int, attname name)
+          )
+        , case when lease then 'update set claim_id = null, claimed_until = null' else 'nothing' end
+        ) into strict _on_conflict
+        ;
+    end if;
+
     -- create the trigger function
     -- the trigger function is security definer
     -- the owner of the source table is creating the trigger function
@@ -488,28 +611,89 @@ begin
     -- this means anyone with insert/update on the source is able
     -- to enqueue rows in the queue table automatically
     -- since the trigger function only does inserts, this should be safe
+    -- (on a deduplicated queue with leases, it also releases the claim of
+    -- the rows it conflicts with)
+    -- the triggers are statement-level: the rows modified by a statement are
+    -- enqueued by a single insert from the new_rows transition table
+    -- if the embedded columns are given, updates only enqueue the rows where
+    -- one of them, or the primary key, changed. values are compared as text
+    -- since not every type has an equality operator
+    -- if a notify channel is given, the trigger function also notifies it so
+    -- that listening workers wake up. notifications with the same payload
+    -- are delivered only once per transaction
     select pg_catalog.format
     ( $sql$
     create function %I.%I() returns trigger
     as $plpgsql$
-    begin
+    begin%s
         insert into %I.%I (%s)
-        values (%s);
+        select %s
+        from new_rows%s;%s%s
         return null;
     end;
     $plpgsql$ language plpgsql volatile parallel safe security definer
     set search_path to pg_catalog, pg_temp
     $sql$
     , queue_schema, trigger_name
+    , case when embedded_columns is not null then
+        pg_catalog.format
+        ( $update$
+        if tg_op = 'UPDATE' then
+            insert into %I.%I (%s)
+            select %s
+            from new_rows n
+            where not exists
+            ( select 1
+              from old_rows o
+              where %s
+              and %s
+            )%s;
+        else$update$
+        , queue_schema, queue_table
+        , (
+            select pg_catalog.string_agg(pg_catalog.format('%I', x.attname), ', ' order by x.attnum)
+            from pg_catalog.jsonb_to_recordset(source_pk) x(attnum int, attname name)
+          )
+        , (
+            select pg_catalog.string_agg(pg_catalog.format('n.%I', x.attname), ', ' order by x.attnum)
+            from pg_catalog.jsonb_to_recordset(source_pk) x(attnum int, attname name)
+          )
+        , (
+            select pg_catalog.string_agg(pg_catalog.format('o.%1$I = n.%1$I', x.attname), ' and ' order by x.attnum)
+            from pg_catalog.jsonb_to_recordset(source_pk) x(attnum int, attname name)
+          )
+        , (
+            select pg_catalog.string_agg(pg_catalog.format('o.%1$I::text is not distinct from n.%1$I::text', c), ' and ')
+            from pg_catalog.unnest(embedded_columns) c
+          )
+        , _on_conflict
+        )
+      else ''
+      end
     , queue_schema, queue_table
     , (
         select pg_catalog.string_agg(pg_catalog.format('%I', x.attname), ', ' order by x.attnum)
         from pg_catalog.jsonb_to_recordset(source_pk) x(attnum int, attname name)
       )
     , (
-        select pg_catalog.string_agg(pg_catalog.format('new.%I', x.attname), ', ' order by x.attnum)
+        select pg_catalog.string_agg(pg_catalog.format('%I', x.attname), ', ' order by x.attnum)
         from pg_catalog.jsonb_to_recordset(source_pk) x(attnum int, attname name)
       )
+    , _on_conflict
+    , case when embedded_columns is not null then $update$
+        end if;$update$
+      else ''
+      end
+    , case when notify_channel is not null then
+        pg_catalog.format
+        ( $notify$
+        if found then
+            perform pg_catalog.pg_notify(%L, '');
+        end if;$notify$
+        , notify_channel
+        )
+      else ''
+      end
     ) into strict _sql
     ;
     execute _sql;
@@ -524,13 +708,16 @@ begin
     ;
     execute _sql;
 
-    -- create the trigger on the source table
+    -- create the triggers on the source table
+    -- a trigger with a transition table handles a single event, so inserts
+    -- and updates each get a trigger, both executing the trigger function
     select pg_catalog.format
     ( $sql$
     create trigger %I
-    after insert or update
+    after insert
     on %I.%I
-    for each row execute function %I.%I();
+    referencing new table as new_rows
+    for each statement execute function %I.%I();
     $sql$
     , trigger_name
     , source_schema, source_table
@@ -538,6 +725,22 @@ begin
     ) into strict _sql
     ;
     execute _sql;
+
+    select pg_catalog.format
+    ( $sql$
+    create trigger %I
+    after update
+    on %I.%I
+    referencing %snew table as new_rows
+    for each statement execute function %I.%I();
+    $sql$
+    , pg_catalog.concat(trigger_name, '_upd')
+    , source_schema, source_table
+    , case when embedded_columns is not null then 'old table as old_rows ' else '' end
+    , queue_schema, trigger_name
+    ) into strict _sql
+    ;
+    execute _sql;
 end;
 $func$
 language plpgsql volatile security invoker
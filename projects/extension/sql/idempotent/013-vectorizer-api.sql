@@ -31,6 +31,7 @@ create or replace function ai.create_vectorizer
 , queue_table pg_catalog.name default null
 , grant_to pg_catalog.name[] default ai.grant_to()
 , enqueue_existing pg_catalog.bool default true
+, storage pg_catalog.jsonb default ai.storage_vector()
 ) returns pg_catalog.int4
 as $func$
 declare
@@ -147,6 +148,12 @@ begin
     -- validate the indexing config
     perform ai._validate_indexing(indexing);
 
+    -- validate the storage config
+    perform ai._validate_storage(storage);
+
+    -- match the indexing config to the storage type
+    indexing = ai._resolve_indexing_storage(indexing, storage);
+
     -- validate the formatting config
     perform ai._validate_formatting(formatting, _source_schema, _source_table);
 
@@ -182,6 +189,7 @@ begin
     , target_schema
     , target_table
     , _dimensions
+    , storage
     , grant_to
     );
 
@@ -191,6 +199,9 @@ begin
     , queue_table
     , _source_pk
     , grant_to
+    , processing operator(pg_catalog.@>) '{"deduplicate_queue": true}'
+    , cast(processing operator(pg_catalog.->>) 'queue_partitions' as pg_catalog.int4)
+    , processing operator(pg_catalog.?) 'lease_seconds'
     );
 
     -- create trigger on source table to populate queue
@@ -201,6 +212,17 @@ begin
     , _source_schema
     , _source_table
     , _source_pk
+    , case when processing operator(pg_catalog.@>) '{"notify": true}'
+        then pg_catalog.concat('ai_vectorizer_', _vectorizer_id)
+      end
+    , ai._vectorizer_embedded_columns
+      ( _source_schema
+      , _source_table
+      , chunking
+      , formatting
+      )
+    , processing operator(pg_catalog.@>) '{"deduplicate_queue": true}'
+    , processing operator(pg_catalog.?) 'lease_seconds'
     );
 
     -- create view
@@ -259,6 +281,7 @@ begin
       , 'formatting', formatting
       , 'scheduling', scheduling
       , 'processing', processing
+      , 'storage', storage
       )
     );
 
@@ -462,6 +485,17 @@ begin
         ;
         execute _sql;
 
+        -- drop the update trigger, vectorizers created by older versions
+        -- have a single row-level trigger
+        select pg_catalog.format
+        ( $sql$drop trigger if exists %I on %I.%I$sql$
+        , pg_catalog.concat(_vec.trigger_name, '_upd')
+        , _vec.source_schema
+        , _vec.source_table
+        ) into strict _sql
+        ;
+        execute _sql;
+
         -- drop the function/procedure backing the trigger
         select pg_catalog.format
         ( $sql$drop %s %I.%I()$sql$
@@ -577,8 +611,90 @@ $func$ language plpgsql stable security invoker
 set search_path to pg_catalog, pg_temp
 ;
 
+-------------------------------------------------------------------------------
+-- vectorizer_queue_oldest
+create or replace function ai.vectorizer_queue_oldest
+( vectorizer_id pg_catalog.int4
+) returns pg_catalog.timestamptz
+as $func$
+declare
+    _queue_schema pg_catalog.name;
+    _queue_table pg_catalog.name;
+    _sql pg_catalog.text;
+    _queued_at pg_catalog.timestamptz;
+begin
+    select v.queue_schema, v.queue_table into _queue_schema, _queue_table
+    from ai.vectorizer v
+    where v.id operator(pg_catalog.=) vectorizer_id
+    ;
+    if _queue_schema is null or _queue_table is null then
+        raise exception 'vectorizer has no queue table';
+    end if;
+    -- reads a single entry of the index on queued_at
+    -- only partitioned queues have the index, the others would be scanned
+    if not exists
+    ( select 1
+      from pg_catalog.pg_index i
+      inner join pg_catalog.pg_attribute a
+      on (a.attrelid operator(pg_catalog.=) i.indrelid
+      and a.attnum operator(pg_catalog.=) i.indkey[0])
+      where i.indrelid operator(pg_catalog.=) pg_catalog.to_regclass
+        (pg_catalog.format('%I.%I', _queue_schema, _queue_table))
+      and a.attname operator(pg_catalog.=) 'queued_at'
+    ) then
+        return null;
+    end if;
+    select pg_catalog.format
+    ( $sql$select queued_at from %I.%I order by queued_at limit 1$sql$
+    , _queue_schema, _queue_table
+    ) into strict _sql
+    ;
+    execute _sql into _queued_at;
+    return _queued_at;
+end;
+$func$ language plpgsql stable security invoker
+set search_path to pg_catalog, pg_temp
+;
+
+-------------------------------------------------------------------------------
+-- _vectorizer_queue_stats
+-- estimates from the cumulative statistics of a queue table and its
+-- partitions, which are read without scanning the queue
+-- rows queued again onto an existing row of a deduplicated queue, and the
+-- claims of a queue with leases, are counted as updates, not inserts
+create or replace function ai._vectorizer_queue_stats
+( queue_schema pg_catalog.name
+, queue_table pg_catalog.name
+, out pending_items_estimate pg_catalog.int8
+, out enqueued_items pg_catalog.int8
+, out updated_items pg_catalog.int8
+, out dequeued_items pg_catalog.int8
+)
+as $func$
+    select
+      pg_catalog.sum(t.n_live_tup)::pg_catalog.int8
+    , pg_catalog.sum(t.n_tup_ins)::pg_catalog.int8
+    , pg_catalog.sum(t.n_tup_upd)::pg_catalog.int8
+    , pg_catalog.sum(t.n_tup_del)::pg_catalog.int8
+    from pg_catalog.pg_stat_all_tables t
+    where t.schemaname operator(pg_catalog.=) queue_schema
+    and
+    ( t.relname operator(pg_catalog.=) queue_table
+    or t.relid operator(pg_catalog.=) any
+      ( select i.inhrelid
+        from pg_catalog.pg_inherits i
+        where i.inhparent operator(pg_catalog.=) pg_catalog.to_regclass
+          (pg_catalog.format('%I.%I', queue_schema, queue_table))
+      )
+    )
+$func$ language sql stable strict security invoker
+set search_path to pg_catalog, pg_temp
+;
+
 -------------------------------------------------------------------------------
 -- vectorizer_status
+-- apart from pending_items, every column is read from statistics or a single
+-- index entry, so that monitoring them doesn't scan the queues
 create or replace view ai.vectorizer_status as
 select
   v.id
@@ -594,7 +710,21 @@ select
     then ai.vectorizer_queue_pending(v.id)
   else null
   end as pending_items
+, s.pending_items_estimate
+, case when v.queue_table is not null and
+    pg_catalog.has_table_privilege
+    ( current_user
+    , pg_catalog.format('%I.%I', v.queue_schema, v.queue_table)
+    , 'select'
+    )
+    then ai.vectorizer_queue_oldest(v.id)
+  else null
+  end as oldest_queued_at
+, s.enqueued_items
+, s.updated_items
+, s.dequeued_items
 from ai.vectorizer v
+left outer join lateral ai._vectorizer_queue_stats(v.queue_schema, v.queue_table) s on (true)
 ;
 
 -------------------------------------------------------------------------------
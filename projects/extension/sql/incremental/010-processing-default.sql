@@ -0,0 +1,11 @@
+
+-- we added new parameters which change the signature producing a new function
+-- drop the old function if it exists from a prior extension version
+-- we cascade drop because ai.create_vectorizer uses this function as a default
+-- we'll immediately recreate ai.create_vectorizer, so we should be good
+drop function if exists ai.processing_default(int, int) cascade;
+
+-- we added parameters to the internal functions creating the queue table and
+-- the source trigger, drop the old signatures
+drop function if exists ai._vectorizer_create_queue_table(name, name, jsonb, name[]);
+drop function if exists ai._vectorizer_create_source_trigger(name, name, name, name, name, jsonb);
@@ -0,0 +1,8 @@
+
+-- embeddings computed by the vectorizer worker, keyed by a hash of the
+-- embedding configuration and the formatted chunk
+create table ai.vectorizer_embedding_cache
+( cache_key bytea not null primary key
+, embedding @extschema:vector@.vector storage main not null
+, created_at timestamptz not null default now()
+);
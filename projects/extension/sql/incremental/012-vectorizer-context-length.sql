@@ -0,0 +1,10 @@
+
+-- the maximum number of tokens per input of embedding models, as found by
+-- the vectorizer worker
+create table ai.vectorizer_context_length
+( implementation text not null
+, model text not null
+, context_length int4 not null
+, updated_at timestamptz not null default now()
+, primary key (implementation, model)
+);
@@ -0,0 +1,10 @@
+
+-- the requests and tokens left in the rate limit buckets of the api keys used
+-- by vectorizer workers, shared by all the workers of the database. a bucket
+-- is null until the provider reports its limit
+create table ai.vectorizer_rate_limit
+( api_key_name text not null primary key
+, requests float8
+, tokens float8
+, updated_at timestamptz not null default now()
+);
@@ -0,0 +1,16 @@
+
+-- the openai batch api jobs submitted by vectorizer workers to backfill the
+-- embeddings of a vectorizer, until their results are ingested
+-- a job is recorded, with the items it embeds, before it is submitted. until
+-- then it has a placeholder id and the submitting status, and its items are
+-- queued again if the submission doesn't complete
+create table ai.vectorizer_batch_job
+( id text not null primary key
+, vectorizer_id int4 not null
+, input_file_id text
+, status text not null
+, request_count int4 not null
+, items text[]
+, created_at timestamptz not null default now()
+, updated_at timestamptz not null default now()
+);
@@ -0,0 +1,7 @@
+-- we added a storage parameter which changes the signature producing a new function
+-- drop the old function if it exists from a prior extension version
+drop function if exists ai.create_vectorizer(regclass, name, jsonb, jsonb, jsonb, jsonb, jsonb, jsonb, name, name, name, name, name, name, name[], bool);
+
+-- we added a storage parameter to the internal function creating the target
+-- table, drop the old signature
+drop function if exists ai._vectorizer_create_target_table(name, name, jsonb, name, name, int4, name[]);
@@ -0,0 +1,3 @@
+-- ai.vectorizer_status has new columns after pending_items, which
+-- create or replace view doesn't allow. drop it, it is immediately recreated
+drop view if exists ai.vectorizer_status;
@@ -12,7 +12,7 @@ select objtype, objnames, objargs, description from ai.semantic_catalog_obj orde
 select * from ai.semantic_catalog_sql order by id;
 select objtype, objnames, objargs from ai._vectorizer_q_1 order by objtype, objnames, objargs;
 select id from ai._vectorizer_q_2 order by id;
-select * from ai.vectorizer_status order by id;
+select id, source_table, target_table, "view", pending_items from ai.vectorizer_status order by id;
 
 select jsonb_pretty
 ( to_jsonb(x)
@@ -207,6 +207,8 @@ def test_validate_indexing():
         "select ai._validate_indexing(ai.indexing_hnsw(opclass=>'vector_ip_ops'))",
         "select ai._validate_indexing(ai.indexing_hnsw(opclass=>'vector_cosine_ops'))",
         "select ai._validate_indexing(ai.indexing_hnsw(opclass=>'vector_l1_ops'))",
+        "select ai._validate_indexing(ai.indexing_hnsw(opclass=>'halfvec_cosine_ops'))",
+        "select ai._validate_indexing(ai.indexing_hnsw(opclass=>'bit_hamming_ops'))",
         "select ai._validate_indexing(ai.indexing_hnsw(opclass=>null))",
         "select ai._validate_indexing(ai.indexing_hnsw(create_when_queue_empty=>false))",
         "select ai._validate_indexing(ai.indexing_diskann())",
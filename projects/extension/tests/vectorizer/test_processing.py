@@ -47,6 +47,46 @@ def test_processing_default():
                 "concurrency": 3,
             },
         ),
+        (
+            "select ai.processing_default(max_in_flight=>4)",
+            {
+                "implementation": "default",
+                "config_type": "processing",
+                "max_in_flight": 4,
+            },
+        ),
+        (
+            "select ai.processing_default(notify=>true)",
+            {
+                "implementation": "default",
+                "config_type": "processing",
+                "notify": True,
+            },
+        ),
+        (
+            "select ai.processing_default(deduplicate_queue=>true)",
+            {
+                "implementation": "default",
+                "config_type": "processing",
+                "deduplicate_queue": True,
+            },
+        ),
+        (
+            "select ai.processing_default(queue_partitions=>4)",
+            {
+                "implementation": "default",
+                "config_type": "processing",
+                "queue_partitions": 4,
+            },
+        ),
+        (
+            "select ai.processing_default(lease_seconds=>300)",
+            {
+                "implementation": "default",
+                "config_type": "processing",
+                "lease_seconds": 300,
+            },
+        ),
     ]
     with psycopg.connect(db_url("test")) as con:
         with con.cursor() as cur:
@@ -65,6 +105,11 @@ def test_validate_processing():
         "select ai._validate_processing(ai.processing_default(batch_size=>2048))",
         "select ai._validate_processing(ai.processing_default(batch_size=>2048, concurrency=>1))",
         "select ai._validate_processing(ai.processing_default(concurrency=>10))",
+        "select ai._validate_processing(ai.processing_default(max_in_flight=>50))",
+        "select ai._validate_processing(ai.processing_default(notify=>false))",
+        "select ai._validate_processing(ai.processing_default(deduplicate_queue=>true))",
+        "select ai._validate_processing(ai.processing_default(queue_partitions=>64))",
+        "select ai._validate_processing(ai.processing_default(lease_seconds=>86400))",
     ]
     bad = [
         (
@@ -115,6 +160,54 @@ def test_validate_processing():
             """,
             "concurrency must be less than or equal to 50",
         ),
+        (
+            """
+            select ai._validate_processing
+            ( ai.processing_default(max_in_flight=>0)
+            )
+            """,
+            "max_in_flight must be greater than 0",
+        ),
+        (
+            """
+            select ai._validate_processing
+            ( ai.processing_default(max_in_flight=>51)
+            )
+            """,
+            "max_in_flight must be less than or equal to 50",
+        ),
+        (
+            """
+            select ai._validate_processing
+            ( '{"config_type": "processing", "implementation": "default", "notify": 1}'::jsonb
+            )
+            """,
+            "notify must be a boolean",
+        ),
+        (
+            """
+            select ai._validate_processing
+            ( '{"config_type": "processing", "implementation": "default", "deduplicate_queue": "yes"}'::jsonb
+            )
+            """,
+            "deduplicate_queue must be a boolean",
+        ),
+        (
+            "select ai._validate_processing(ai.processing_default(queue_partitions=>0))",
+            "queue_partitions must be greater than 0",
+        ),
+        (
+            "select ai._validate_processing(ai.processing_default(queue_partitions=>65))",
+            "queue_partitions must be less than or equal to 64",
+        ),
+        (
+            "select ai._validate_processing(ai.processing_default(lease_seconds=>0))",
+            "lease_seconds must be greater than 0",
+        ),
+        (
+            "select ai._validate_processing(ai.processing_default(lease_seconds=>86401))",
+            "lease_seconds must be less than or equal to 86400",
+        ),
     ]
     with psycopg.connect(db_url("test"), autocommit=True) as con:
         with con.cursor() as cur:
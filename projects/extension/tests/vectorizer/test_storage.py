@@ -0,0 +1,135 @@
+import os
+
+import psycopg
+import pytest
+
+# skip tests in this module if disabled
+enable_vectorizer_tests = os.getenv("ENABLE_VECTORIZER_TESTS")
+if enable_vectorizer_tests == "0":
+    pytest.skip(allow_module_level=True)
+
+
+def db_url(user: str) -> str:
+    return f"postgres://{user}@127.0.0.1:5432/test"
+
+
+def test_storage():
+    tests = [
+        (
+            "select ai.storage_vector()",
+            {
+                "implementation": "vector",
+                "config_type": "storage",
+            },
+        ),
+        (
+            "select ai.storage_halfvec()",
+            {
+                "implementation": "halfvec",
+                "config_type": "storage",
+            },
+        ),
+        (
+            "select ai.storage_bit()",
+            {
+                "implementation": "bit",
+                "config_type": "storage",
+            },
+        ),
+    ]
+    with psycopg.connect(db_url("test")) as con:
+        with con.cursor() as cur:
+            for query, expected in tests:
+                cur.execute(query)
+                actual = cur.fetchone()[0]
+                assert actual == expected
+
+
+def test_validate_storage():
+    ok = [
+        "select ai._validate_storage(ai.storage_vector())",
+        "select ai._validate_storage(ai.storage_halfvec())",
+        "select ai._validate_storage(ai.storage_bit())",
+    ]
+    bad = [
+        (
+            """
+            select ai._validate_storage
+            ( '{"config_type": "storage", "implementation": "sparsevec"}'::jsonb
+            )
+            """,
+            'invalid storage implementation: "sparsevec"',
+        ),
+        (
+            "select ai._validate_storage(ai.indexing_none())",
+            "invalid config_type for storage config",
+        ),
+    ]
+    with psycopg.connect(db_url("test"), autocommit=True) as con:
+        with con.cursor() as cur:
+            for query in ok:
+                cur.execute(query)
+                assert True
+            for query, err in bad:
+                try:
+                    cur.execute(query)
+                except psycopg.ProgrammingError as ex:
+                    msg = str(ex.args[0])
+                    assert len(msg) >= len(err) and msg[: len(err)] == err
+                else:
+                    pytest.fail(f"expected exception: {err}")
+
+
+def test_resolve_indexing_storage():
+    tests = [
+        (
+            "select ai._resolve_indexing_storage(ai.indexing_hnsw(), ai.storage_vector())",
+            "vector_cosine_ops",
+        ),
+        (
+            "select ai._resolve_indexing_storage(ai.indexing_hnsw(), ai.storage_halfvec())",
+            "halfvec_cosine_ops",
+        ),
+        (
+            "select ai._resolve_indexing_storage(ai.indexing_hnsw(opclass=>'vector_ip_ops'), ai.storage_halfvec())",
+            "halfvec_ip_ops",
+        ),
+        (
+            "select ai._resolve_indexing_storage(ai.indexing_hnsw(), ai.storage_bit())",
+            "bit_hamming_ops",
+        ),
+        (
+            "select ai._resolve_indexing_storage(ai.indexing_hnsw(opclass=>'bit_jaccard_ops'), ai.storage_bit())",
+            "bit_jaccard_ops",
+        ),
+    ]
+    bad = [
+        (
+            "select ai._resolve_indexing_storage(ai.indexing_diskann(), ai.storage_halfvec())",
+            "diskann indexing requires ai.storage_vector()",
+        ),
+        (
+            "select ai._resolve_indexing_storage(ai.indexing_hnsw(opclass=>'bit_hamming_ops'), ai.storage_vector())",
+            "opclass bit_hamming_ops does not support ai.storage_vector()",
+        ),
+    ]
+    with psycopg.connect(db_url("test"), autocommit=True) as con:
+        with con.cursor() as cur:
+            for query, opclass in tests:
+                cur.execute(query)
+                assert cur.fetchone()[0]["opclass"] == opclass
+            cur.execute(
+                "select ai._resolve_indexing_storage(ai.indexing_none(), ai.storage_bit())"
+            )
+            assert cur.fetchone()[0] == {
+                "implementation": "none",
+                "config_type": "indexing",
+            }
+            for query, err in bad:
+                try:
+                    cur.execute(query)
+                except psycopg.ProgrammingError as ex:
+                    msg = str(ex.args[0])
+                    assert len(msg) >= len(err) and msg[: len(err)] == err
+                else:
+                    pytest.fail(f"expected exception: {err}")
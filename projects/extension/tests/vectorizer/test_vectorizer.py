@@ -45,6 +45,10 @@ VECTORIZER_ROW = r"""
             "config_type": "processing",
             "implementation": "default"
         },
+        "storage": {
+            "config_type": "storage",
+            "implementation": "vector"
+        },
         "scheduling": {
             "job_id": 1000,
             "timezone": "America/Chicago",
@@ -94,7 +98,8 @@ Indexes:
 Referenced by:
     TABLE "website.blog_embedding_store" CONSTRAINT "blog_embedding_store_title_published_fkey" FOREIGN KEY (title, published) REFERENCES website.blog(title, published) ON DELETE CASCADE
 Triggers:
-    _vectorizer_src_trg_1 AFTER INSERT OR UPDATE ON website.blog FOR EACH ROW EXECUTE FUNCTION ai._vectorizer_src_trg_1()
+    _vectorizer_src_trg_1 AFTER INSERT ON website.blog REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION ai._vectorizer_src_trg_1()
+    _vectorizer_src_trg_1_upd AFTER UPDATE ON website.blog REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION ai._vectorizer_src_trg_1()
 Access method: heap
 """.strip()
 
@@ -1257,6 +1262,128 @@ def test_hnsw_index():
             index_creation_tester(cur, vectorizer_id)
 
 
+@pytest.mark.parametrize(
+    "storage,column_type,embedding,opclass",
+    [
+        ("ai.storage_halfvec()", "halfvec(3)", "'[1,2,3]'::halfvec", "halfvec_l1_ops"),
+        ("ai.storage_bit()", "bit(3)", "B'101'", "bit_hamming_ops"),
+    ],
+)
+def test_hnsw_index_storage(
+    storage: str, column_type: str, embedding: str, opclass: str
+):
+    with psycopg.connect(
+        db_url("test"), autocommit=True, row_factory=namedtuple_row
+    ) as con:
+        with con.cursor() as cur:
+            cur.execute("create extension if not exists ai cascade")
+            cur.execute("create extension if not exists timescaledb")
+            cur.execute("create schema if not exists vec")
+            source_table = f"note_{column_type[:3]}"
+            cur.execute(f"drop table if exists vec.{source_table}")
+            cur.execute(f"""
+                create table vec.{source_table}
+                ( id bigint not null primary key generated always as identity
+                , note text not null
+                )
+            """)
+            cur.execute(f"insert into vec.{source_table} (note) values ('i am a note')")
+
+            # create a vectorizer for the table
+            # language=PostgreSQL
+            cur.execute(f"""
+            select ai.create_vectorizer
+            ( 'vec.{source_table}'::regclass
+            , embedding=>ai.embedding_openai('text-embedding-3-small', 3)
+            , chunking=>ai.chunking_character_text_splitter('note')
+            , scheduling=>
+                ai.scheduling_timescaledb
+                ( interval '5m'
+                , initial_start=>'2050-01-06'::timestamptz
+                , timezone=>'America/Chicago'
+                )
+            , indexing=>ai.indexing_hnsw(min_rows=>1, opclass=>'vector_l1_ops')
+            , grant_to=>null
+            , enqueue_existing=>false
+            , storage=>{storage}
+            );
+            """)
+            vectorizer_id = cur.fetchone()[0]
+            cur.execute("select * from ai.vectorizer where id = %s", (vectorizer_id,))
+            vectorizer = cur.fetchone()
+            # the opclass is translated to the storage type
+            assert vectorizer.config["indexing"]["opclass"] == opclass
+
+            cur.execute(
+                """
+                select pg_catalog.format_type(a.atttypid, a.atttypmod)
+                from pg_catalog.pg_attribute a
+                where a.attrelid = pg_catalog.format('%%I.%%I', %s, %s)::regclass
+                and a.attname = 'embedding'
+                """,
+                (vectorizer.target_schema, vectorizer.target_table),
+            )
+            assert cur.fetchone()[0] == column_type
+
+            cur.execute(f"""
+                insert into {vectorizer.target_schema}.{vectorizer.target_table}
+                (id, chunk_seq, chunk, embedding)
+                values (1, 0, 'i am a chunk', {embedding})
+            """)
+            cur.execute(
+                "call ai._vectorizer_job(null, jsonb_build_object('vectorizer_id', %s))",
+                (vectorizer_id,),
+            )
+            cur.execute(
+                """
+                select pg_catalog.pg_get_indexdef(i.indexrelid)
+                from pg_catalog.pg_index i
+                where i.indrelid = pg_catalog.format('%%I.%%I', %s, %s)::regclass
+                and not i.indisprimary and not i.indisunique
+                """,
+                (vectorizer.target_schema, vectorizer.target_table),
+            )
+            index_def = cur.fetchone()[0]
+            assert "USING hnsw" in index_def and opclass in index_def
+
+
+def test_hnsw_index_storage_mismatch():
+    with psycopg.connect(
+        db_url("test"), autocommit=True, row_factory=namedtuple_row
+    ) as con:
+        with con.cursor() as cur:
+            cur.execute("create extension if not exists ai cascade")
+            cur.execute("create extension if not exists timescaledb")
+            cur.execute("create schema if not exists vec")
+            cur.execute("drop table if exists vec.note_mismatch")
+            cur.execute("""
+                create table vec.note_mismatch
+                ( id bigint not null primary key generated always as identity
+                , note text not null
+                )
+            """)
+            with pytest.raises(
+                psycopg.errors.RaiseException,
+                match="opclass halfvec_cosine_ops does not support ai.storage_bit()",
+            ):
+                cur.execute("""
+                select ai.create_vectorizer
+                ( 'vec.note_mismatch'::regclass
+                , embedding=>ai.embedding_openai('text-embedding-3-small', 3)
+                , chunking=>ai.chunking_character_text_splitter('note')
+                , scheduling=>
+                    ai.scheduling_timescaledb
+                    ( interval '5m'
+                    , initial_start=>'2050-01-06'::timestamptz
+                    , timezone=>'America/Chicago'
+                    )
+                , indexing=>ai.indexing_hnsw(opclass=>'halfvec_cosine_ops')
+                , grant_to=>null
+                , storage=>ai.storage_bit()
+                );
+                """)
+
+
 def test_index_create_concurrency():
     # pgvectorscale must be installed by a superuser
     with psycopg.connect(
@@ -1664,6 +1791,503 @@ def test_queue_pending():
             assert cur.fetchone()[0] == 9223372036854775807
 
 
+def test_queue_notify():
+    with psycopg.connect(
+        db_url("test"), autocommit=True, row_factory=namedtuple_row
+    ) as con:
+        with con.cursor() as cur:
+            cur.execute("create extension if not exists ai cascade")
+            cur.execute("create extension if not exists timescaledb")
+            cur.execute("create schema if not exists vec")
+            cur.execute("drop table if exists vec.note7")
+            cur.execute("""
+                create table vec.note7
+                ( id bigint not null primary key generated always as identity
+                , note text not null
+                )
+            """)
+
+            # create a vectorizer whose trigger notifies the workers
+            # language=PostgreSQL
+            cur.execute("""
+            select ai.create_vectorizer
+            ( 'vec.note7'::regclass
+            , embedding=>ai.embedding_openai('text-embedding-3-small', 3)
+            , chunking=>ai.chunking_character_text_splitter('note')
+            , processing=>ai.processing_default(notify=>true)
+            , scheduling=> ai.scheduling_none()
+            , indexing=>ai.indexing_none()
+            , grant_to=>null
+            , enqueue_existing=>false
+            );
+            """)
+            vectorizer_id = cur.fetchone()[0]
+            cur.execute(f'listen "ai_vectorizer_{vectorizer_id}"')
+
+            # several rows in one transaction are coalesced in one notification
+            with con.transaction():
+                cur.execute("insert into vec.note7 (note) values ('a'), ('b')")
+                cur.execute("update vec.note7 set note = 'c'")
+
+            notifies = list(con.notifies(timeout=1.0))
+            assert [n.channel for n in notifies] == [f"ai_vectorizer_{vectorizer_id}"]
+
+            cur.execute(
+                "select ai.vectorizer_queue_pending(%s, true)", (vectorizer_id,)
+            )
+            assert cur.fetchone()[0] == 4
+
+
+def test_queue_statement_trigger():
+    with psycopg.connect(
+        db_url("test"), autocommit=True, row_factory=namedtuple_row
+    ) as con:
+        with con.cursor() as cur:
+            cur.execute("create extension if not exists ai cascade")
+            cur.execute("create extension if not exists timescaledb")
+            cur.execute("create schema if not exists vec")
+            cur.execute("drop table if exists vec.note8")
+            cur.execute("""
+                create table vec.note8
+                ( id bigint not null primary key generated always as identity
+                , note text not null
+                )
+            """)
+
+            # language=PostgreSQL
+            cur.execute("""
+            select ai.create_vectorizer
+            ( 'vec.note8'::regclass
+            , embedding=>ai.embedding_openai('text-embedding-3-small', 3)
+            , chunking=>ai.chunking_character_text_splitter('note')
+            , processing=>ai.processing_default(notify=>true)
+            , scheduling=> ai.scheduling_none()
+            , indexing=>ai.indexing_none()
+            , grant_to=>null
+            , enqueue_existing=>false
+            );
+            """)
+            vectorizer_id = cur.fetchone()[0]
+            cur.execute(f'listen "ai_vectorizer_{vectorizer_id}"')
+
+            # bulk statements enqueue every row they modify
+            cur.execute(
+                "insert into vec.note8 (note) select 'note' from generate_series(1, 100)"
+            )
+            cur.execute("update vec.note8 set note = 'updated' where id <= 50")
+            cur.execute(
+                "select ai.vectorizer_queue_pending(%s, true)", (vectorizer_id,)
+            )
+            assert cur.fetchone()[0] == 150
+            assert len(list(con.notifies(timeout=1.0))) == 2
+
+            # statements that modify no rows neither enqueue nor notify
+            cur.execute("update vec.note8 set note = 'updated' where id < 0")
+            cur.execute(
+                "select ai.vectorizer_queue_pending(%s, true)", (vectorizer_id,)
+            )
+            assert cur.fetchone()[0] == 150
+            assert list(con.notifies(timeout=1.0)) == []
+
+            # dropping the vectorizer drops both triggers
+            cur.execute("select ai.drop_vectorizer(%s)", (vectorizer_id,))
+            cur.execute(
+                """
+                select count(*) from pg_trigger
+                where tgrelid = 'vec.note8'::regclass and not tgisinternal
+                """
+            )
+            assert cur.fetchone()[0] == 0
+
+
+def test_embedded_columns():
+    with psycopg.connect(
+        db_url("test"), autocommit=True, row_factory=namedtuple_row
+    ) as con:
+        with con.cursor() as cur:
+            cur.execute("create extension if not exists ai cascade")
+            cur.execute("create schema if not exists vec")
+            cur.execute("drop table if exists vec.note9")
+            cur.execute("""
+                create table vec.note9
+                ( id bigint not null primary key generated always as identity
+                , title text not null
+                , "Author" text
+                , note text not null
+                , view_count int not null default 0
+                )
+            """)
+            tests = [
+                ("ai.formatting_python_template()", ["note"]),
+                (
+                    "ai.formatting_python_template('$title by ${Author}: $chunk')",
+                    ["title", "Author", "note"],
+                ),
+                # $$ is an escaped $, and placeholders of missing columns are ignored
+                (
+                    "ai.formatting_python_template('$$title $missing $chunk')",
+                    ["note"],
+                ),
+            ]
+            for formatting, expected in tests:
+                cur.execute(f"""
+                    select ai._vectorizer_embedded_columns
+                    ( 'vec'
+                    , 'note9'
+                    , ai.chunking_character_text_splitter('note')
+                    , {formatting}
+                    )
+                """)
+                assert cur.fetchone()[0] == expected
+
+
+def test_queue_embedded_columns_changed():
+    with psycopg.connect(
+        db_url("test"), autocommit=True, row_factory=namedtuple_row
+    ) as con:
+        with con.cursor() as cur:
+            cur.execute("create extension if not exists ai cascade")
+            cur.execute("create extension if not exists timescaledb")
+            cur.execute("create schema if not exists vec")
+            cur.execute("drop table if exists vec.note10")
+            cur.execute("""
+                create table vec.note10
+                ( id bigint not null primary key generated always as identity
+                , title text not null
+                , note text not null
+                , meta json
+                , view_count int not null default 0
+                )
+            """)
+
+            # language=PostgreSQL
+            cur.execute("""
+            select ai.create_vectorizer
+            ( 'vec.note10'::regclass
+            , embedding=>ai.embedding_openai('text-embedding-3-small', 3)
+            , chunking=>ai.chunking_character_text_splitter('note')
+            , formatting=>ai.formatting_python_template('$title $meta $chunk')
+            , scheduling=> ai.scheduling_none()
+            , indexing=>ai.indexing_none()
+            , grant_to=>null
+            , enqueue_existing=>false
+            );
+            """)
+            vectorizer_id = cur.fetchone()[0]
+            cur.execute(
+                "insert into vec.note10 (title, note) select 'title', 'note' from generate_series(1, 10)"
+            )
+
+            def queue_pending() -> int:
+                cur.execute(
+                    "select ai.vectorizer_queue_pending(%s, true)", (vectorizer_id,)
+                )
+                return cur.fetchone()[0]
+
+            assert queue_pending() == 10
+            # updates of columns that are not embedded are not enqueued
+            cur.execute("update vec.note10 set view_count = view_count + 1")
+            cur.execute("update vec.note10 set title = title, note = note")
+            assert queue_pending() == 10
+            # updates of the embedded columns are
+            cur.execute("update vec.note10 set note = 'changed' where id <= 2")
+            cur.execute("update vec.note10 set title = 'changed' where id = 3")
+            cur.execute("""update vec.note10 set meta = '{"a": 1}' where id = 4""")
+            assert queue_pending() == 14
+
+
+def test_queue_deduplicated():
+    with psycopg.connect(
+        db_url("test"), autocommit=True, row_factory=namedtuple_row
+    ) as con:
+        with con.cursor() as cur:
+            cur.execute("create extension if not exists ai cascade")
+            cur.execute("create extension if not exists timescaledb")
+            cur.execute("create schema if not exists vec")
+            cur.execute("drop table if exists vec.note11")
+            cur.execute("""
+                create table vec.note11
+                ( id bigint not null primary key generated always as identity
+                , note text not null
+                )
+            """)
+
+            # language=PostgreSQL
+            cur.execute("""
+            select ai.create_vectorizer
+            ( 'vec.note11'::regclass
+            , embedding=>ai.embedding_openai('text-embedding-3-small', 3)
+            , chunking=>ai.chunking_character_text_splitter('note')
+            , processing=>ai.processing_default(deduplicate_queue=>true)
+            , scheduling=> ai.scheduling_none()
+            , indexing=>ai.indexing_none()
+            , grant_to=>null
+            , enqueue_existing=>false
+            );
+            """)
+            vectorizer_id = cur.fetchone()[0]
+            cur.execute(
+                "select queue_schema, queue_table from ai.vectorizer where id = %s",
+                (vectorizer_id,),
+            )
+            queue = cur.fetchone()
+
+            cur.execute(
+                "insert into vec.note11 (note) select 'note' from generate_series(1, 10)"
+            )
+            cur.execute(
+                f"select max(queued_at) from {queue.queue_schema}.{queue.queue_table}"
+            )
+            queued_at = cur.fetchone()[0]
+            # updating rows that are already queued does not queue them again
+            for i in range(5):
+                cur.execute("update vec.note11 set note = %s", (f"note {i}",))
+            cur.execute(
+                "select ai.vectorizer_queue_pending(%s, true)", (vectorizer_id,)
+            )
+            assert cur.fetchone()[0] == 10
+            # and they keep their place in the queue
+            cur.execute(
+                f"select max(queued_at) from {queue.queue_schema}.{queue.queue_table}"
+            )
+            assert cur.fetchone()[0] == queued_at
+
+
+def test_queue_partitioned():
+    with psycopg.connect(
+        db_url("test"), autocommit=True, row_factory=namedtuple_row
+    ) as con:
+        with con.cursor() as cur:
+            cur.execute("create extension if not exists ai cascade")
+            cur.execute("create extension if not exists timescaledb")
+            cur.execute("create schema if not exists vec")
+            cur.execute("drop table if exists vec.note12")
+            cur.execute("""
+                create table vec.note12
+                ( id bigint not null primary key generated always as identity
+                , note text not null
+                )
+            """)
+
+            # language=PostgreSQL
+            cur.execute("""
+            select ai.create_vectorizer
+            ( 'vec.note12'::regclass
+            , embedding=>ai.embedding_openai('text-embedding-3-small', 3)
+            , chunking=>ai.chunking_character_text_splitter('note')
+            , processing=>ai.processing_default(queue_partitions=>4)
+            , scheduling=> ai.scheduling_none()
+            , indexing=>ai.indexing_none()
+            , grant_to=>null
+            , enqueue_existing=>false
+            );
+            """)
+            vectorizer_id = cur.fetchone()[0]
+            cur.execute(
+                "select queue_schema, queue_table from ai.vectorizer where id = %s",
+                (vectorizer_id,),
+            )
+            queue = cur.fetchone()
+
+            # the queue table is hash partitioned on the primary key
+            cur.execute(
+                """
+                select c.relname, pg_catalog.pg_get_expr(c.relpartbound, c.oid) as bound
+                from pg_catalog.pg_inherits i
+                inner join pg_catalog.pg_class c on (c.oid = i.inhrelid)
+                where i.inhparent = pg_catalog.to_regclass(%s)
+                order by c.relname
+                """,
+                (f"{queue.queue_schema}.{queue.queue_table}",),
+            )
+            partitions = cur.fetchall()
+            assert [p.relname for p in partitions] == [
+                f"{queue.queue_table}_{i}" for i in range(4)
+            ]
+            assert [p.bound for p in partitions] == [
+                f"FOR VALUES WITH (modulus 4, remainder {i})" for i in range(4)
+            ]
+
+            # the partitions are indexed on queued_at
+            cur.execute(
+                """
+                select pg_catalog.count(*)
+                from pg_catalog.pg_indexes
+                where schemaname = %s
+                and tablename like %s
+                and indexdef like '%%(queued_at)'
+                """,
+                (queue.queue_schema, f"{queue.queue_table}\\_%"),
+            )
+            assert cur.fetchone()[0] == 4
+
+            cur.execute(
+                "insert into vec.note12 (note) select 'note' from generate_series(1, 100)"
+            )
+            cur.execute(
+                "select ai.vectorizer_queue_pending(%s, true)", (vectorizer_id,)
+            )
+            assert cur.fetchone()[0] == 100
+            cur.execute(
+                f"select pg_catalog.count(*) from {queue.queue_schema}.{queue.queue_table}_0"
+            )
+            assert 0 < cur.fetchone()[0] < 100
+
+
+def test_queue_leased():
+    with psycopg.connect(
+        db_url("test"), autocommit=True, row_factory=namedtuple_row
+    ) as con:
+        with con.cursor() as cur:
+            cur.execute("create extension if not exists ai cascade")
+            cur.execute("create extension if not exists timescaledb")
+            cur.execute("create schema if not exists vec")
+            cur.execute("drop table if exists vec.note13")
+            cur.execute("""
+                create table vec.note13
+                ( id bigint not null primary key generated always as identity
+                , note text not null
+                )
+            """)
+
+            # language=PostgreSQL
+            cur.execute("""
+            select ai.create_vectorizer
+            ( 'vec.note13'::regclass
+            , embedding=>ai.embedding_openai('text-embedding-3-small', 3)
+            , chunking=>ai.chunking_character_text_splitter('note')
+            , processing=>ai.processing_default
+              ( deduplicate_queue=>true
+              , lease_seconds=>300
+              )
+            , scheduling=> ai.scheduling_none()
+            , indexing=>ai.indexing_none()
+            , grant_to=>null
+            , enqueue_existing=>false
+            );
+            """)
+            vectorizer_id = cur.fetchone()[0]
+            cur.execute(
+                "select queue_schema, queue_table from ai.vectorizer where id = %s",
+                (vectorizer_id,),
+            )
+            queue = cur.fetchone()
+            queue_table = f"{queue.queue_schema}.{queue.queue_table}"
+
+            # the queue table has the claim columns
+            cur.execute(
+                """
+                select a.attname, pg_catalog.format_type(a.atttypid, a.atttypmod) as type
+                from pg_catalog.pg_attribute a
+                where a.attrelid = pg_catalog.to_regclass(%s)
+                and a.attnum > 0
+                order by a.attnum
+                """,
+                (queue_table,),
+            )
+            assert [(a.attname, a.type) for a in cur.fetchall()] == [
+                ("id", "bigint"),
+                ("queued_at", "timestamp with time zone"),
+                ("claim_id", "uuid"),
+                ("claimed_until", "timestamp with time zone"),
+            ]
+
+            cur.execute("insert into vec.note13 (note) values ('note')")
+            cur.execute(f"""
+                update {queue_table}
+                set claim_id = gen_random_uuid()
+                , claimed_until = now() + interval '5 minutes'
+            """)
+
+            # queueing a claimed row again releases the claim
+            cur.execute("update vec.note13 set note = 'changed'")
+            cur.execute(f"select claim_id, claimed_until from {queue_table}")
+            row = cur.fetchone()
+            assert row.claim_id is None
+            assert row.claimed_until is None
+
+
+def test_vectorizer_status_estimates():
+    with psycopg.connect(
+        db_url("test"), autocommit=True, row_factory=namedtuple_row
+    ) as con:
+        with con.cursor() as cur:
+            cur.execute("create extension if not exists ai cascade")
+            cur.execute("create extension if not exists timescaledb")
+            cur.execute("create schema if not exists vec")
+            cur.execute("drop table if exists vec.note14")
+            cur.execute("""
+                create table vec.note14
+                ( id bigint not null primary key generated always as identity
+                , note text not null
+                )
+            """)
+
+            # language=PostgreSQL
+            cur.execute("""
+            select ai.create_vectorizer
+            ( 'vec.note14'::regclass
+            , embedding=>ai.embedding_openai('text-embedding-3-small', 3)
+            , chunking=>ai.chunking_character_text_splitter('note')
+            , processing=>ai.processing_default(queue_partitions=>2)
+            , scheduling=> ai.scheduling_none()
+            , indexing=>ai.indexing_none()
+            , grant_to=>null
+            , enqueue_existing=>false
+            );
+            """)
+            vectorizer_id = cur.fetchone()[0]
+            cur.execute(
+                "select queue_schema, queue_table from ai.vectorizer where id = %s",
+                (vectorizer_id,),
+            )
+            queue = cur.fetchone()
+            queue_table = f"{queue.queue_schema}.{queue.queue_table}"
+
+            cur.execute(
+                "insert into vec.note14 (note) select 'note' from generate_series(1, 10)"
+            )
+            cur.execute(f"delete from {queue_table} where id <= 3")
+            cur.execute("select pg_catalog.pg_stat_force_next_flush()")
+
+            # the estimates add up the statistics of the partitions
+            cur.execute(
+                """
+                select pending_items, pending_items_estimate, oldest_queued_at
+                , enqueued_items, updated_items, dequeued_items
+                from ai.vectorizer_status
+                where id = %s
+                """,
+                (vectorizer_id,),
+            )
+            status = cur.fetchone()
+            assert status.pending_items == 7
+            assert status.pending_items_estimate == 7
+            assert status.enqueued_items == 10
+            assert status.updated_items == 0
+            assert status.dequeued_items == 3
+            cur.execute(f"select min(queued_at) from {queue_table}")
+            assert status.oldest_queued_at == cur.fetchone()[0]
+
+            cur.execute("select ai.vectorizer_queue_oldest(%s)", (vectorizer_id,))
+            assert cur.fetchone()[0] == status.oldest_queued_at
+
+            # queues without an index on queued_at are not scanned
+            cur.execute(
+                """
+                select i.indexrelid::regclass::text
+                from pg_catalog.pg_index i
+                inner join pg_catalog.pg_attribute a
+                on (a.attrelid = i.indrelid and a.attnum = i.indkey[0])
+                where i.indrelid = %s::regclass and a.attname = 'queued_at'
+                """,
+                (queue_table,),
+            )
+            cur.execute(f"drop index {cur.fetchone()[0]}")
+            cur.execute("select ai.vectorizer_queue_oldest(%s)", (vectorizer_id,))
+            assert cur.fetchone()[0] is None
+
+
 def test_grant_to_public():
     with psycopg.connect(
         db_url("test"), autocommit=True, row_factory=namedtuple_row
@@ -6,7 +6,7 @@ import random
 import signal
 import sys
 import time
-from collections.abc import Sequence
+from collections.abc import Awaitable, Callable, Sequence
 from typing import Any
 
 import click
@@ -15,10 +15,40 @@ import structlog
 from ddtrace import tracer
 from dotenv import load_dotenv
 from psycopg.rows import dict_row, namedtuple_row
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
 from pytimeparse import parse  # type: ignore
 
 from .__init__ import __version__
-from .vectorizer.vectorizer import Vectorizer, Worker
+from .vectorizer.batch_size import (
+    DEFAULT_MAX_BATCH_CHUNKS,
+    DEFAULT_MAX_BATCH_DURATION,
+    DEFAULT_TARGET_EMBED_LATENCY,
+    AdaptiveBatchSize,
+    BatchSizeLimits,
+)
+from .vectorizer.embedders import OpenAI
+from .vectorizer.embedding_cache import (
+    DEFAULT_LRU_SIZE,
+    DEFAULT_MAX_AGE,
+    EmbeddingCache,
+    LruCache,
+)
+from .vectorizer.listener import DEFAULT_NOTIFY_DEBOUNCE, QueueListener
+from .vectorizer.metrics import DEFAULT_METRICS_HOST, worker_metrics
+from .vectorizer.metrics import serve as serve_metrics
+from .vectorizer.process_pool import ProcessPool
+from .vectorizer.rate_limiter import rate_limits
+from .vectorizer.scheduler import (
+    DEFAULT_QUANTUM_BATCHES,
+    FairScheduler,
+    VectorizerQueue,
+)
+from .vectorizer.vectorizer import (
+    DEFAULT_BACKFILL_BATCH_SIZE,
+    DEFAULT_PIPELINE_DEPTH,
+    Vectorizer,
+    Worker,
+)
 
 load_dotenv()
 
@@ -55,50 +85,89 @@ def get_bool_env(name: str | None) -> bool:
 tracer.enabled = get_bool_env("DD_TRACE_ENABLED")
 
 
-def get_pgai_version(cur: psycopg.Cursor) -> str | None:
-    cur.execute("select extversion from pg_catalog.pg_extension where extname = 'ai'")
-    row = cur.fetchone()
-    return row[0] if row is not None else None
+async def get_pgai_version(pool: AsyncConnectionPool) -> str | None:
+    async with pool.connection() as con, con.cursor() as cur:
+        await cur.execute(
+            "select extversion from pg_catalog.pg_extension where extname = 'ai'"
+        )
+        row = await cur.fetchone()
+        return row[0] if row is not None else None
 
 
-def get_vectorizer_ids(
-    db_url: str, vectorizer_ids: Sequence[int] | None = None
+async def get_vectorizer_ids(
+    pool: AsyncConnectionPool, vectorizer_ids: Sequence[int] | None = None
 ) -> list[int]:
-    with (
-        psycopg.Connection.connect(db_url) as con,
+    async with (
+        pool.connection() as con,
         con.cursor(row_factory=namedtuple_row) as cur,
     ):
         valid_vectorizer_ids: list[int] = []
         if vectorizer_ids is None or len(vectorizer_ids) == 0:
-            cur.execute("select id from ai.vectorizer")
+            await cur.execute("select id from ai.vectorizer")
         else:
-            cur.execute(
+            await cur.execute(
                 "select id from ai.vectorizer where id = any(%s)",
                 [
                     list(vectorizer_ids),
                 ],
             )
-        for row in cur.fetchall():
+        for row in await cur.fetchall():
             valid_vectorizer_ids.append(row[0])
         random.shuffle(valid_vectorizer_ids)
         return valid_vectorizer_ids
 
 
-def get_vectorizer(db_url: str, vectorizer_id: int) -> Vectorizer:
-    with (
-        psycopg.Connection.connect(db_url) as con,
+async def get_queue_pending(
+    pool: AsyncConnectionPool, vectorizer_ids: Sequence[int]
+) -> dict[int, int]:
+    """
+    Estimates the number of items in the queues of the given vectorizers.
+    """
+    async with (
+        pool.connection() as con,
+        con.cursor(row_factory=namedtuple_row) as cur,
+    ):
+        await cur.execute(
+            "select id, ai.vectorizer_queue_pending(id) from ai.vectorizer where id = any(%s)",  # noqa
+            [
+                list(vectorizer_ids),
+            ],
+        )
+        return {row[0]: row[1] for row in await cur.fetchall()}
+
+
+# Vectorizers already built by get_vectorizer, with the row and API key they
+# were built from, by vectorizer id.
+KnownVectorizers = dict[int, tuple[tuple[dict[str, Any], str | None], Vectorizer]]
+
+
+async def get_vectorizer(
+    pool: AsyncConnectionPool,
+    vectorizer_id: int,
+    known_vectorizers: KnownVectorizers | None = None,
+) -> Vectorizer:
+    """
+    Loads a vectorizer and the API key of its embedder.
+
+    When `known_vectorizers` is given and neither the vectorizer row nor its
+    API key changed since the vectorizer was last loaded, the same Vectorizer
+    is returned, so that its embedder's clients and tokenizer are reused.
+    """
+    async with (
+        pool.connection() as con,
         con.cursor(row_factory=dict_row) as cur,
     ):
-        cur.execute(
+        await cur.execute(
             "select pg_catalog.to_jsonb(v) as vectorizer from ai.vectorizer v where v.id = %s",  # noqa
             (vectorizer_id,),
         )
-        row = cur.fetchone()
+        row = await cur.fetchone()
         if row is None:
             raise VectorizerNotFoundError(f"vectorizer_id={vectorizer_id}")
-        vectorizer = row["vectorizer"]
-        embedding = vectorizer["config"]["embedding"]
-        vectorizer = Vectorizer(**vectorizer)
+        vectorizer_row = row["vectorizer"]
+        embedding = vectorizer_row["config"]["embedding"]
+        api_key_name: str | None = None
+        api_key: str | None = None
         # The Ollama API doesn't need a key, so `api_key_name` may be unset
         if "api_key_name" in embedding:
             api_key_name = embedding["api_key_name"]
@@ -106,11 +175,11 @@ def get_vectorizer(db_url: str, vectorizer_id: int) -> Vectorizer:
             if api_key is not None:
                 log.debug(f"obtained secret '{api_key_name}' from environment")
             else:
-                cur.execute(
+                await cur.execute(
                     "select ai.reveal_secret(%s)",
                     (api_key_name,),
                 )
-                row = cur.fetchone()
+                row = await cur.fetchone()
                 api_key = row["reveal_secret"] if row is not None else None
                 if api_key is not None:
                     log.debug(f"obtained secret '{api_key_name}' from database")
@@ -118,31 +187,144 @@ def get_vectorizer(db_url: str, vectorizer_id: int) -> Vectorizer:
                 raise ApiKeyNotFoundError(
                     f"api_key_name={api_key_name} vectorizer_id={vectorizer_id}"
                 )
-            secrets: dict[str, str | None] = {api_key_name: api_key}
-            # The Ollama API doesn't need a key, so doesn't support `set_api_key`
-            set_api_key = getattr(vectorizer.config.embedding, "set_api_key", None)
-            if callable(set_api_key):
-                set_api_key(secrets)
-            else:
-                log.error(
-                    f"cannot set secret value '{api_key_name}' for vectorizer with id: '{vectorizer.id}'"  # noqa
-                )
-        return vectorizer
 
+    if known_vectorizers is not None and vectorizer_id in known_vectorizers:
+        built_from, vectorizer = known_vectorizers[vectorizer_id]
+        if built_from == (vectorizer_row, api_key):
+            return vectorizer
+        await vectorizer.config.embedding.close()
+
+    vectorizer = Vectorizer(**vectorizer_row)
+    if api_key_name is not None:
+        secrets: dict[str, str | None] = {api_key_name: api_key}
+        # The Ollama API doesn't need a key, so doesn't support `set_api_key`
+        set_api_key = getattr(vectorizer.config.embedding, "set_api_key", None)
+        if callable(set_api_key):
+            set_api_key(secrets)
+        else:
+            log.error(
+                f"cannot set secret value '{api_key_name}' for vectorizer with id: '{vectorizer.id}'"  # noqa
+            )
+    if known_vectorizers is not None:
+        known_vectorizers[vectorizer_id] = ((vectorizer_row, api_key), vectorizer)
+    return vectorizer
+
+
+async def run_vectorizers(
+    pool: AsyncConnectionPool,
+    workers: dict[int, Worker],
+    max_concurrency: int,
+    tasks_per_vectorizer: int = 1,
+    quantum_batches: int = DEFAULT_QUANTUM_BATCHES,
+    fail_fast: bool = False,
+) -> dict[int, int]:
+    """
+    Processes the queues of the given vectorizers concurrently, until they
+    are empty, sharing the tasks between them with a FairScheduler.
 
-def run_vectorizer(db_url: str, vectorizer: Vectorizer, concurrency: int) -> None:
-    async def run_workers(
-        db_url: str, vectorizer: Vectorizer, concurrency: int
-    ) -> list[int]:
-        tasks = [
-            asyncio.create_task(Worker(db_url, vectorizer).run())
-            for _ in range(concurrency)
-        ]
-        return await asyncio.gather(*tasks)
+    Every turn the scheduler gives a vectorizer is a run of the same Worker,
+    so that its embedder is set up and its queue table looked up only once.
 
-    results = asyncio.run(run_workers(db_url, vectorizer, concurrency))
-    items = sum(results)
-    log.info("finished processing vectorizer", items=items, vectorizer_id=vectorizer.id)
+    Returns:
+        dict[int, int]: The number of items processed, by vectorizer id.
+    """
+    # The next worker slot of each vectorizer. Turns of the same vectorizer
+    # running concurrently are given consecutive slots, and so claim from
+    # different partitions of a partitioned queue table.
+    next_slots: dict[int, int] = {}
+
+    async def run_turn(vectorizer_id: int, max_items: int) -> int:
+        slot = next_slots.get(vectorizer_id, 0)
+        next_slots[vectorizer_id] = slot + 1
+        return await workers[vectorizer_id].run(
+            continue_processing=lambda _loops, res: res < max_items, slot=slot
+        )
+
+    scheduler = FairScheduler(
+        run_turn,
+        max_concurrency,
+        tasks_per_vectorizer=tasks_per_vectorizer,
+        quantum_batches=quantum_batches,
+        fail_fast=fail_fast,
+    )
+    pending = await get_queue_pending(pool, list(workers.keys()))
+    queues: list[VectorizerQueue] = []
+    for vectorizer_id, worker in workers.items():
+        vectorizer = worker.vectorizer
+        pending_items = pending.get(vectorizer_id, 0)
+        worker_metrics.queue_pending.set(pending_items, vectorizer_id)
+        if pending_items == 0:
+            log.debug("no pending items", vectorizer_id=vectorizer_id)
+            continue
+        log.info(
+            "running vectorizer",
+            vectorizer_id=vectorizer_id,
+            pending_items=pending_items,
+        )
+        queues.append(
+            VectorizerQueue(
+                vectorizer_id,
+                vectorizer.config.processing.batch_size,
+                pending_items,
+            )
+        )
+    processed = await scheduler.run(queues)
+    for queue in queues:
+        log.info(
+            "finished processing vectorizer",
+            items=processed[queue.vectorizer_id],
+            vectorizer_id=queue.vectorizer_id,
+        )
+    return processed
+
+
+async def get_batch_job_vectorizer_ids(pool: AsyncConnectionPool) -> set[int]:
+    """
+    The ids of the vectorizers with Batch API jobs to ingest.
+    """
+    async with pool.connection() as con, con.cursor() as cur:
+        await cur.execute("select distinct vectorizer_id from ai.vectorizer_batch_job")
+        return {row[0] for row in await cur.fetchall()}
+
+
+async def run_backfills(
+    pool: AsyncConnectionPool,
+    vectorizers: dict[int, Vectorizer],
+    threshold: int,
+    backfill: Callable[[Vectorizer, bool], Awaitable[int]],
+    exit_on_error: bool | None,
+) -> None:
+    """
+    Ingests the finished Batch API jobs of the given OpenAI vectorizers, and
+    submits the queued items of the ones with at least `threshold` pending
+    items as new jobs, before their queues are processed.
+    """
+    openai_vectorizers = {
+        vectorizer_id: vectorizer
+        for vectorizer_id, vectorizer in vectorizers.items()
+        if isinstance(vectorizer.config.embedding, OpenAI)
+    }
+    if not openai_vectorizers:
+        return
+    pending = await get_queue_pending(pool, list(openai_vectorizers.keys()))
+    with_jobs = await get_batch_job_vectorizer_ids(pool)
+    for vectorizer_id, vectorizer in openai_vectorizers.items():
+        submit = pending.get(vectorizer_id, 0) >= threshold
+        if not submit and vectorizer_id not in with_jobs:
+            continue
+        try:
+            submitted = await backfill(vectorizer, submit)
+        except Exception as e:
+            if exit_on_error:
+                raise e
+            log.error(f"unexpected error: {str(e)}", vectorizer_id=vectorizer_id)
+            continue
+        if submitted:
+            log.info(
+                "submitted items to batch jobs",
+                items=submitted,
+                vectorizer_id=vectorizer_id,
+            )
 
 
 class TimeDurationParamType(click.ParamType):
@@ -211,6 +393,169 @@ def shutdown_handler(signum: int, _frame: Any):
     default=1,
     show_default=True,
 )
+@click.option(
+    "--max-concurrency",
+    type=click.IntRange(1),
+    default=None,
+    help="The number of asynchronous tasks shared by all the vectorizers, which are run concurrently. Each vectorizer still uses at most --concurrency tasks. Defaults to --concurrency.",  # noqa
+)
+@click.option(
+    "--scheduler-quantum",
+    type=click.IntRange(1),
+    default=DEFAULT_QUANTUM_BATCHES,
+    show_default=True,
+    help="The number of batches each vectorizer with pending items may process before the other vectorizers get their turn.",  # noqa
+)
+@click.option(
+    "--pipeline-depth",
+    type=click.IntRange(1),
+    default=DEFAULT_PIPELINE_DEPTH,
+    show_default=True,
+    help="The number of batches each task keeps in flight. Values greater than 1 enable pipelined mode: the next batch is fetched and chunked while the current one is being embedded and written. Each batch in flight uses its own database connection.",  # noqa
+)
+@click.option(
+    "--embedding-cache",
+    type=click.BOOL,
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help="Reuse the embeddings of chunks that were already embedded with the same embedding configuration, instead of sending them to the embedding provider again. Embeddings are cached in the ai.vectorizer_embedding_cache table.",  # noqa
+)
+@click.option(
+    "--embedding-cache-lru-size",
+    type=click.IntRange(0),
+    default=DEFAULT_LRU_SIZE,
+    show_default=True,
+    help="The number of cached embeddings the worker also keeps in memory.",
+)
+@click.option(
+    "--embedding-cache-max-age",
+    type=TimeDurationParamType(),
+    default=f"{DEFAULT_MAX_AGE // 86400}d",
+    show_default=True,
+    help="The age, in duration string or integer (seconds), after which cached embeddings are deleted from the ai.vectorizer_embedding_cache table. 0 keeps them forever.",  # noqa
+)
+@click.option(
+    "--incremental-writes",
+    type=click.BOOL,
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help="Compare the chunks of updated items with the ones already in the embedding store, and only embed, delete and insert the chunks that changed, instead of replacing all the embeddings of the items.",  # noqa
+)
+@click.option(
+    "--share-context-lengths",
+    type=click.BOOL,
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help="Store the maximum number of tokens per chunk of the embedding models, as found by the worker, in the ai.vectorizer_context_length table, so that every worker leaves out the chunks that are too long before sending them to the embedding provider.",  # noqa
+)
+@click.option(
+    "--share-rate-limits",
+    type=click.BOOL,
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help="Share the requests and tokens per minute sent with each API key, in the ai.vectorizer_rate_limit table, so that all the workers of the database stay within the rate limits of the embedding provider together.",  # noqa
+)
+@click.option(
+    "--adaptive-batch-size",
+    type=click.BOOL,
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help="Adapt the number of items claimed per batch to the latency of the embedding requests, the duration of the batches, the number of chunks they produce and the rate limit errors of the embedding provider, starting from the batch size of each vectorizer.",  # noqa
+)
+@click.option(
+    "--min-batch-size",
+    type=click.IntRange(1),
+    default=1,
+    show_default=True,
+    help="With --adaptive-batch-size, the smallest number of items claimed per batch.",  # noqa
+)
+@click.option(
+    "--max-batch-size",
+    type=click.IntRange(1, 2048),
+    default=2048,
+    show_default=True,
+    help="With --adaptive-batch-size, the largest number of items claimed per batch.",  # noqa
+)
+@click.option(
+    "--target-embed-latency",
+    type=click.FloatRange(0, min_open=True),
+    default=DEFAULT_TARGET_EMBED_LATENCY,
+    show_default=True,
+    help="With --adaptive-batch-size, the time in seconds an embedding request should take at most.",  # noqa
+)
+@click.option(
+    "--max-batch-duration",
+    type=click.FloatRange(0, min_open=True),
+    default=DEFAULT_MAX_BATCH_DURATION,
+    show_default=True,
+    help="With --adaptive-batch-size, the time in seconds a batch should hold the locks on its queue rows at most.",  # noqa
+)
+@click.option(
+    "--max-batch-chunks",
+    type=click.IntRange(1),
+    default=DEFAULT_MAX_BATCH_CHUNKS,
+    show_default=True,
+    help="With --adaptive-batch-size, the number of chunks a batch should produce at most.",  # noqa
+)
+@click.option(
+    "--backfill-threshold",
+    type=click.IntRange(0),
+    default=0,
+    show_default=True,
+    help="Embed the queued items of OpenAI vectorizers with at least this number of pending items, such as after ai.create_vectorizer with enqueue_existing, through the OpenAI Batch API instead of the embeddings endpoint. Batch jobs cost less and have separate rate limits, but take up to 24 hours to complete. 0 disables it.",  # noqa
+)
+@click.option(
+    "--backfill-batch-size",
+    type=click.IntRange(1),
+    default=DEFAULT_BACKFILL_BATCH_SIZE,
+    show_default=True,
+    help="With --backfill-threshold, the number of items claimed from the queue per batch job.",  # noqa
+)
+@click.option(
+    "--process-pool-size",
+    type=click.IntRange(0),
+    default=0,
+    show_default=True,
+    help="The number of processes used to chunk and format items, and to tokenize documents. By default this work is done by the worker's own process, where it delays every other task while a large document is processed.",  # noqa
+)
+@click.option(
+    "--pool-min-size",
+    type=click.IntRange(0),
+    default=1,
+    show_default=True,
+    help="The number of database connections the worker keeps open between vectorizer runs.",  # noqa
+)
+@click.option(
+    "--pool-max-size",
+    type=click.IntRange(1),
+    default=None,
+    help="The maximum number of database connections the worker opens. Defaults to --max-concurrency * --pipeline-depth, which is also the minimum.",  # noqa
+)
+@click.option(
+    "--notify-debounce",
+    type=click.FloatRange(0),
+    default=DEFAULT_NOTIFY_DEBOUNCE,
+    show_default=True,
+    help="For vectorizers created with ai.processing_default(notify => true), the time in seconds to keep collecting notifications after the first one, before processing the new work. The poll interval still applies to all the vectorizers.",  # noqa
+)
+@click.option(
+    "--metrics-port",
+    type=click.IntRange(0, 65535),
+    default=None,
+    help="Serve Prometheus metrics of the worker, by vectorizer, at http://<metrics-host>:<metrics-port>/metrics. Disabled by default.",  # noqa
+)
+@click.option(
+    "--metrics-host",
+    type=str,
+    default=DEFAULT_METRICS_HOST,
+    show_default=True,
+    help="The address to serve metrics on, with --metrics-port.",
+)
 @click.option(
     "--log-level",
     type=click.Choice(
@@ -244,6 +589,29 @@ def vectorizer_worker(
     db_url: str,
     vectorizer_ids: Sequence[int],
     concurrency: int,
+    max_concurrency: int | None,
+    scheduler_quantum: int,
+    pipeline_depth: int,
+    embedding_cache: bool,
+    embedding_cache_lru_size: int,
+    embedding_cache_max_age: int,
+    incremental_writes: bool,
+    share_context_lengths: bool,
+    share_rate_limits: bool,
+    adaptive_batch_size: bool,
+    min_batch_size: int,
+    max_batch_size: int,
+    target_embed_latency: float,
+    max_batch_duration: float,
+    max_batch_chunks: int,
+    backfill_threshold: int,
+    backfill_batch_size: int,
+    process_pool_size: int,
+    pool_min_size: int,
+    pool_max_size: int | None,
+    notify_debounce: float,
+    metrics_port: int | None,
+    metrics_host: str,
     log_level: str,
     poll_interval: int,
     once: bool,
@@ -257,75 +625,315 @@ def vectorizer_worker(
         wrapper_class=structlog.make_filtering_bound_logger(get_log_level(log_level))
     )
     log.debug("starting vectorizer worker")
+
+    if max_concurrency is None:
+        max_concurrency = concurrency
+
+    # Every task holds one connection per batch in flight.
+    min_pool_max_size = max_concurrency * pipeline_depth
+    if pool_max_size is None:
+        pool_max_size = min_pool_max_size
+    elif pool_max_size < min_pool_max_size:
+        raise click.BadParameter(
+            f"must be at least --max-concurrency * --pipeline-depth ({min_pool_max_size})",  # noqa
+            param_hint="--pool-max-size",
+        )
+
+    if once and exit_on_error is None:
+        # --once implies --exit-on-error
+        exit_on_error = True
+
+    if share_rate_limits:
+        rate_limits.share(db_url)
+
+    if min_batch_size > max_batch_size:
+        raise click.BadParameter(
+            "must be at most --max-batch-size", param_hint="--min-batch-size"
+        )
+
+    asyncio.run(
+        run_worker(
+            vectorizer_ids,
+            concurrency,
+            max_concurrency,
+            scheduler_quantum,
+            pipeline_depth,
+            # The in-memory part of the cache outlives the vectorizer runs.
+            EmbeddingCache(LruCache(embedding_cache_lru_size), embedding_cache_max_age)
+            if embedding_cache
+            else None,
+            incremental_writes,
+            share_context_lengths,
+            BatchSizeLimits(
+                min_batch_size,
+                max_batch_size,
+                target_embed_latency,
+                max_batch_duration,
+                max_batch_chunks,
+            )
+            if adaptive_batch_size
+            else None,
+            backfill_threshold,
+            backfill_batch_size,
+            ProcessPool(process_pool_size) if process_pool_size > 0 else None,
+            AsyncConnectionPool(
+                db_url,
+                min_size=min(pool_min_size, pool_max_size),
+                max_size=pool_max_size,
+                # Connections idle in the pool may have been closed by the
+                # server or by a connection pooler in between.
+                check=AsyncConnectionPool.check_connection,
+                open=False,
+            ),
+            QueueListener(db_url, notify_debounce),
+            metrics_port,
+            metrics_host,
+            poll_interval,
+            once,
+            exit_on_error,
+        )
+    )
+
+
+async def wait_for_work(
+    listener: QueueListener, poll_deadline: float
+) -> set[int] | None:
+    """
+    Waits for rows to be queued, until the poll deadline at the latest.
+
+    Notifications only shorten the wait: once the deadline has passed, every
+    vectorizer is polled, even if notifications keep coming in, so that the
+    vectorizers that don't notify, and the rows queued while the listener was
+    reconnecting, are still processed every poll interval.
+
+    Args:
+        listener (QueueListener): The listener of the notifying vectorizers.
+        poll_deadline (float): When to poll every vectorizer, in
+            `time.monotonic()` seconds.
+
+    Returns:
+        set[int] | None: The ids of the vectorizers that were notified, or
+            None if every vectorizer should be polled.
+    """
+    notified_ids = await listener.wait(max(0.0, poll_deadline - time.monotonic()))
+    if time.monotonic() >= poll_deadline:
+        return None
+    return notified_ids
+
+
+async def run_worker(
+    vectorizer_ids: Sequence[int],
+    concurrency: int,
+    max_concurrency: int,
+    scheduler_quantum: int,
+    pipeline_depth: int,
+    embedding_cache: EmbeddingCache | None,
+    incremental_writes: bool,
+    share_context_lengths: bool,
+    batch_size_limits: BatchSizeLimits | None,
+    backfill_threshold: int,
+    backfill_batch_size: int,
+    process_pool: ProcessPool | None,
+    pool: AsyncConnectionPool,
+    listener: QueueListener,
+    metrics_port: int | None,
+    metrics_host: str,
+    poll_interval: int,
+    once: bool,
+    exit_on_error: bool | None,
+) -> None:
     poll_interval_str = datetime.timedelta(seconds=poll_interval)
 
     dynamic_mode = len(vectorizer_ids) == 0
     valid_vectorizer_ids = []
+    # The vectorizers to run in the next cycle, None for all of them.
+    notified_ids: set[int] | None = None
+    # When every vectorizer is polled next, whatever the notifications.
+    poll_deadline = 0.0
+    # Vectorizers, and so their embedders, are kept across poll cycles.
+    known_vectorizers: KnownVectorizers = {}
+    # Adaptive batch sizes, with the vectorizer they started from, by
+    # vectorizer id. They start over when the vectorizer is reloaded.
+    batch_sizes: dict[int, tuple[Vectorizer, AdaptiveBatchSize]] = {}
+    # Workers by vectorizer id, so that their set up is kept across poll
+    # cycles. They start over when the vectorizer is reloaded.
+    workers: dict[int, Worker] = {}
+
+    def get_batch_size(vectorizer: Vectorizer) -> AdaptiveBatchSize | None:
+        if batch_size_limits is None:
+            return None
+        known = batch_sizes.get(vectorizer.id)
+        if known is None or known[0] is not vectorizer:
+            known = (
+                vectorizer,
+                AdaptiveBatchSize(
+                    vectorizer.config.processing.batch_size, batch_size_limits
+                ),
+            )
+            batch_sizes[vectorizer.id] = known
+        return known[1]
+
+    def get_worker(vectorizer: Vectorizer) -> Worker:
+        known = workers.get(vectorizer.id)
+        if known is not None and known.vectorizer is vectorizer:
+            return known
+        worker = Worker(
+            pool.conninfo,
+            vectorizer,
+            pipeline_depth=pipeline_depth,
+            embedding_cache=embedding_cache,
+            incremental_writes=incremental_writes,
+            pool=pool,
+            process_pool=process_pool,
+            share_context_lengths=share_context_lengths,
+            batch_size=get_batch_size(vectorizer),
+        )
+        workers[vectorizer.id] = worker
+        return worker
+
+    async def backfill(vectorizer: Vectorizer, submit: bool) -> int:
+        return await Worker(
+            pool.conninfo,
+            vectorizer,
+            pool=pool,
+            process_pool=process_pool,
+        ).backfill(backfill_batch_size, submit)
 
     can_connect = False
     pgai_version = None
-    if once and exit_on_error is None:
-        # --once implies --exit-on-error
-        exit_on_error = True
 
-    while True:
-        try:
-            if not can_connect or pgai_version is None:
-                with (
-                    psycopg.Connection.connect(db_url) as con,
-                    con.cursor(row_factory=namedtuple_row) as cur,
-                ):
-                    pgai_version = get_pgai_version(cur)
+    # The pool is shared by every vectorizer run, connections are opened in
+    # the background and reused across poll cycles.
+    await pool.open()
+    metrics_server = (
+        await serve_metrics(metrics_port, metrics_host)
+        if metrics_port is not None
+        else None
+    )
+    try:
+        while True:
+            try:
+                if not can_connect or pgai_version is None:
+                    pgai_version = await get_pgai_version(pool)
                     can_connect = True
                     if pgai_version is None:
                         log.error("the pgai extension is not installed")
                         if exit_on_error:
                             sys.exit(1)
 
-            if can_connect and pgai_version is not None:
-                if not dynamic_mode and len(valid_vectorizer_ids) != len(
-                    vectorizer_ids
-                ):
-                    valid_vectorizer_ids = get_vectorizer_ids(db_url, vectorizer_ids)
-                    if len(valid_vectorizer_ids) != len(vectorizer_ids):
-                        log.error(
-                            f"invalid vectorizers, wanted: {list(vectorizer_ids)}, got: {valid_vectorizer_ids}"  # noqa: E501 (line too long)
+                if can_connect and pgai_version is not None:
+                    if not dynamic_mode and len(valid_vectorizer_ids) != len(
+                        vectorizer_ids
+                    ):
+                        valid_vectorizer_ids = await get_vectorizer_ids(
+                            pool, vectorizer_ids
                         )
-                        if exit_on_error:
-                            sys.exit(1)
-                else:
-                    valid_vectorizer_ids = get_vectorizer_ids(db_url, vectorizer_ids)
-                    if len(valid_vectorizer_ids) == 0:
-                        log.warning("no vectorizers found")
-
-                for vectorizer_id in valid_vectorizer_ids:
-                    try:
-                        vectorizer = get_vectorizer(db_url, vectorizer_id)
-                        log.info("running vectorizer", vectorizer_id=vectorizer_id)
-                        run_vectorizer(db_url, vectorizer, concurrency)
-                    except (VectorizerNotFoundError, ApiKeyNotFoundError) as e:
-                        log.error(
-                            f"error getting vectorizer: {type(e).__name__}: {str(e)} "
+                        if len(valid_vectorizer_ids) != len(vectorizer_ids):
+                            log.error(
+                                f"invalid vectorizers, wanted: {list(vectorizer_ids)}, got: {valid_vectorizer_ids}"  # noqa: E501 (line too long)
+                            )
+                            if exit_on_error:
+                                sys.exit(1)
+                    else:
+                        valid_vectorizer_ids = await get_vectorizer_ids(
+                            pool, vectorizer_ids
                         )
-                        if exit_on_error:
-                            sys.exit(1)
-        except psycopg.OperationalError as e:
-            if "connection failed" in str(e):
+                        if len(valid_vectorizer_ids) == 0:
+                            log.warning("no vectorizers found")
+                        # Forget the vectorizers that were dropped.
+                        for dropped_id in known_vectorizers.keys() - set(
+                            valid_vectorizer_ids
+                        ):
+                            _, dropped = known_vectorizers.pop(dropped_id)
+                            batch_sizes.pop(dropped_id, None)
+                            workers.pop(dropped_id, None)
+                            worker_metrics.queue_pending.remove(dropped_id)
+                            await dropped.config.embedding.close()
+
+                    vectorizers: dict[int, Vectorizer] = {}
+                    for vectorizer_id in valid_vectorizer_ids:
+                        if (
+                            notified_ids is not None
+                            and vectorizer_id not in notified_ids
+                        ):
+                            continue
+                        try:
+                            vectorizer = await get_vectorizer(
+                                pool, vectorizer_id, known_vectorizers
+                            )
+                            # Listen before running, so that rows queued during
+                            # the run wake the worker up again.
+                            if not once:
+                                await listener.listen(vectorizer)
+                            vectorizers[vectorizer_id] = vectorizer
+                        except (VectorizerNotFoundError, ApiKeyNotFoundError) as e:
+                            log.error(
+                                f"error getting vectorizer: {type(e).__name__}: {str(e)} "  # noqa: E501 (line too long)
+                            )
+                            if exit_on_error:
+                                sys.exit(1)
+                    if vectorizers and embedding_cache is not None:
+                        async with pool.connection() as conn:
+                            pruned = await embedding_cache.prune(conn)
+                        if pruned:
+                            log.info("pruned embedding cache", entries=pruned)
+                    if vectorizers and backfill_threshold > 0:
+                        await run_backfills(
+                            pool,
+                            vectorizers,
+                            backfill_threshold,
+                            backfill,
+                            exit_on_error,
+                        )
+                    if vectorizers:
+                        await run_vectorizers(
+                            pool,
+                            {
+                                vectorizer_id: get_worker(vectorizer)
+                                for vectorizer_id, vectorizer in vectorizers.items()
+                            },
+                            max_concurrency,
+                            tasks_per_vectorizer=concurrency,
+                            quantum_batches=scheduler_quantum,
+                            fail_fast=bool(exit_on_error),
+                        )
+            except PoolTimeout as e:
                 log.error(f"unable to connect to database: {str(e)}")
-            else:
+                if exit_on_error:
+                    sys.exit(1)
+            except psycopg.OperationalError as e:
+                if "connection failed" in str(e):
+                    log.error(f"unable to connect to database: {str(e)}")
+                else:
+                    log.error(f"unexpected error: {str(e)}")
+                if exit_on_error:
+                    sys.exit(1)
+            except Exception as e:
+                # catch any exceptions, log them, and keep on going
                 log.error(f"unexpected error: {str(e)}")
-            if exit_on_error:
-                sys.exit(1)
-        except Exception as e:
-            # catch any exceptions, log them, and keep on going
-            log.error(f"unexpected error: {str(e)}")
-            if exit_on_error:
-                sys.exit(1)
-
-        if once:
-            return
-        log.info(f"sleeping for {poll_interval_str} before polling for new work")
-        time.sleep(poll_interval)
+                if exit_on_error:
+                    sys.exit(1)
+
+            log.info("connection pool stats", **pool.get_stats())
+            if once:
+                return
+            if notified_ids is None:
+                poll_deadline = time.monotonic() + poll_interval
+                log.info(
+                    f"sleeping for {poll_interval_str} before polling for new work"
+                )
+            notified_ids = await wait_for_work(listener, poll_deadline)
+    finally:
+        if metrics_server is not None:
+            metrics_server.close()
+            await metrics_server.wait_closed()
+        for _, vectorizer in known_vectorizers.values():
+            await vectorizer.config.embedding.close()
+        await rate_limits.close()
+        await listener.close()
+        await pool.close()
+        if process_pool is not None:
+            process_pool.close()
 
 
 @click.group()
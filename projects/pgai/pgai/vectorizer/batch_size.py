@@ -0,0 +1,129 @@
+import dataclasses
+
+import structlog
+
+logger = structlog.get_logger()
+
+DEFAULT_TARGET_EMBED_LATENCY = 10.0
+DEFAULT_MAX_BATCH_DURATION = 60.0
+DEFAULT_MAX_BATCH_CHUNKS = 2048
+
+# The fraction of the batch size kept after a rate limit error.
+RATE_LIMITED_DECREASE = 0.5
+# The fraction of the initial batch size added after each full batch that
+# stayed within the limits.
+INCREASE_FRACTION = 0.1
+
+
+@dataclasses.dataclass
+class BatchSizeLimits:
+    """
+    The bounds and targets of adaptive batch sizes.
+
+    Attributes:
+        min_size (int): The smallest number of items claimed per batch.
+        max_size (int): The largest number of items claimed per batch.
+        target_embed_latency (float): The time in seconds an embedding
+            request should take at most.
+        max_duration (float): The time in seconds a batch should hold its
+            transaction, and so the locks on its queue rows, at most.
+        max_chunks (int): The number of chunks a batch should produce at most.
+    """
+
+    min_size: int = 1
+    max_size: int = 2048
+    target_embed_latency: float = DEFAULT_TARGET_EMBED_LATENCY
+    max_duration: float = DEFAULT_MAX_BATCH_DURATION
+    max_chunks: int = DEFAULT_MAX_BATCH_CHUNKS
+
+
+class AdaptiveBatchSize:
+    """
+    Adapts the number of items a vectorizer claims per batch to the measured
+    cost of its batches, with additive increase and multiplicative decrease.
+
+    Every batch that claimed as many items as it asked for and stayed within
+    the limits grows the size by a tenth of the initial size. A batch whose
+    embedding request took longer than the target, that held its transaction
+    for too long, or that produced too many chunks shrinks the size in
+    proportion to the overshoot, and a rate limit error halves it.
+
+    The same instance is shared by all the Workers of a vectorizer, so that
+    what a batch measures applies to the following ones.
+
+    Attributes:
+        limits (BatchSizeLimits): The bounds and targets of the size.
+        size (int): The number of items to claim in the next batch.
+    """
+
+    def __init__(self, initial: int, limits: BatchSizeLimits):
+        self.limits = limits
+        self.size = self._clamp(initial)
+        self._step = max(1, round(initial * INCREASE_FRACTION))
+
+    def observe_embed(self, chunks: int, seconds: float):
+        """
+        Records the latency of an embedding request.
+
+        Args:
+            chunks (int): The number of chunks sent.
+            seconds (float): The time the request took.
+        """
+        target = self.limits.target_embed_latency
+        if seconds > target:
+            self._decrease(
+                target / seconds,
+                f"embedding {chunks} chunks took {seconds:.2f}s",
+            )
+
+    def observe_batch(self, full: bool, chunks: int, seconds: float):
+        """
+        Records a batch that was written and committed.
+
+        Args:
+            full (bool): Whether the batch claimed as many items as it asked
+                for. Batches that drained the queue say nothing about larger
+                sizes.
+            chunks (int): The number of chunks the batch produced.
+            seconds (float): The time the batch held its transaction.
+        """
+        if seconds > self.limits.max_duration:
+            self._decrease(
+                self.limits.max_duration / seconds,
+                f"batch held its transaction for {seconds:.2f}s",
+            )
+        elif chunks > self.limits.max_chunks:
+            self._decrease(
+                self.limits.max_chunks / chunks,
+                f"batch produced {chunks} chunks",
+            )
+        elif full:
+            self.size = self._clamp(self.size + self._step)
+
+    def observe_error(self, e: BaseException):
+        """
+        Records an error that made a batch fail.
+        """
+        if is_rate_limited(e):
+            self._decrease(RATE_LIMITED_DECREASE, "embedding provider rate limit")
+
+    def _decrease(self, factor: float, reason: str):
+        size = self._clamp(int(self.size * factor))
+        if size < self.size:
+            logger.debug(f"batch size decreased from {self.size} to {size}: {reason}")
+            self.size = size
+
+    def _clamp(self, size: int) -> int:
+        return max(self.limits.min_size, min(self.limits.max_size, size))
+
+
+def is_rate_limited(e: BaseException | None) -> bool:
+    """
+    Whether an error, or one of the errors that caused it, is an HTTP 429
+    response of an embedding provider.
+    """
+    while e is not None:
+        if 429 in (getattr(e, "status_code", None), getattr(e, "http_status", None)):
+            return True
+        e = e.__cause__
+    return False
@@ -0,0 +1,85 @@
+from psycopg import AsyncConnection
+
+# The maximum number of tokens per input of well-known models, by embedder
+# implementation. These are the lengths reported by the APIs' own errors.
+BUILTIN_CONTEXT_LENGTHS: dict[str, dict[str, int]] = {
+    "openai": {
+        "text-embedding-ada-002": 8192,
+        "text-embedding-3-small": 8192,
+        "text-embedding-3-large": 8192,
+    },
+}
+
+
+class ContextLengths:
+    """
+    Registry of the maximum number of tokens per input of embedding models,
+    so that embedders can leave out the chunks that are too long before
+    sending a request, instead of learning the limit from a failed request.
+
+    The registry starts from `BUILTIN_CONTEXT_LENGTHS` and is filled as
+    embedders find the context length of other models. It can be loaded from
+    and saved to the `ai.vectorizer_context_length` table, so that lengths
+    found by one worker are known to every worker of the database.
+
+    Attributes:
+        builtin (dict[str, dict[str, int]]): The lengths known in advance.
+    """
+
+    def __init__(self, builtin: dict[str, dict[str, int]] = BUILTIN_CONTEXT_LENGTHS):
+        self._lengths: dict[tuple[str, str], int] = {
+            (implementation, model): context_length
+            for implementation, models in builtin.items()
+            for model, context_length in models.items()
+        }
+        self._unsaved: set[tuple[str, str]] = set()
+
+    def get(self, implementation: str, model: str) -> int | None:
+        return self._lengths.get((implementation, model))
+
+    def set(self, implementation: str, model: str, context_length: int):
+        key = (implementation, model)
+        if self._lengths.get(key) != context_length:
+            self._lengths[key] = context_length
+            self._unsaved.add(key)
+
+    async def load(self, conn: AsyncConnection):
+        """
+        Adds the lengths stored in the database to the registry.
+
+        Args:
+            conn (AsyncConnection): The database connection.
+        """
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                "select implementation, model, context_length"
+                " from ai.vectorizer_context_length"
+            )
+            for implementation, model, context_length in await cursor.fetchall():
+                key = (implementation, model)
+                if key not in self._unsaved:
+                    self._lengths[key] = context_length
+
+    async def save(self, conn: AsyncConnection):
+        """
+        Stores the lengths found since the last save in the database.
+
+        Args:
+            conn (AsyncConnection): The database connection.
+        """
+        if not self._unsaved:
+            return
+        unsaved = sorted(self._unsaved)
+        async with conn.cursor() as cursor:
+            await cursor.executemany(
+                "insert into ai.vectorizer_context_length"
+                " (implementation, model, context_length) values (%s, %s, %s)"
+                " on conflict (implementation, model) do update"
+                " set context_length = excluded.context_length, updated_at = now()",
+                [key + (self._lengths[key],) for key in unsaved],
+            )
+        self._unsaved.difference_update(unsaved)
+
+
+# The registry of the process, shared by all the embedders.
+context_lengths = ContextLengths()
@@ -1,3 +1,4 @@
+import importlib.util
 import os
 from collections.abc import Mapping, Sequence
 from functools import cached_property
@@ -6,19 +7,25 @@ from typing import (
     Literal,
 )
 
+import httpx
 import ollama
 from pydantic import BaseModel
 from typing_extensions import TypedDict, override
 
+from ..context_lengths import context_lengths
 from ..embeddings import (
     BatchApiCaller,
+    ChunkEmbeddingError,
     Embedder,
     EmbeddingResponse,
     EmbeddingVector,
     StringDocument,
     Usage,
+    http_keepalive_expiry,
+    http_max_connections,
     logger,
 )
+from .openai import TOKEN_CONTEXT_LENGTH_ERROR
 
 
 # Note: this is a re-declaration of ollama.Options, which we are forced to do
@@ -80,10 +87,16 @@ class Ollama(BaseModel, Embedder):
     keep_alive: str | None = None  # this is only `str` because of the SQL API
 
     @override
-    async def embed(self, documents: list[str]) -> Sequence[EmbeddingVector]:
+    async def embed(
+        self, documents: list[str]
+    ) -> Sequence[EmbeddingVector | ChunkEmbeddingError]:
         """
         Embeds a list of documents into vectors using Ollama's embeddings API.
 
+        When the context length of the model is known, chunks that exceed it
+        are replaced in the response with a ChunkEmbeddingError, instead of
+        being truncated by Ollama.
+
         Args:
             documents (list[str]): A list of documents to be embedded.
 
@@ -92,11 +105,79 @@ class Ollama(BaseModel, Embedder):
             errors for each document.
         """
         await logger.adebug(f"Chunks produced: {len(documents)}")
-        return await self._batcher.batch_chunks_and_embed(documents)
+        context_length = self._known_context_length()
+        if context_length is None:
+            return await self._batcher.batch_chunks_and_embed(documents)
+
+        # There is no tokenizer for Ollama models, but every token is at least
+        # one byte long, so chunks with at most as many bytes as the context
+        # length fit. The others are sent without truncation, for Ollama to
+        # reject the ones that don't fit.
+        fits = [len(d.encode()) <= context_length for d in documents]
+        response = iter(
+            await self._batcher.batch_chunks_and_embed(
+                [d for d, fit in zip(documents, fits, strict=True) if fit]
+            )
+        )
+        untruncated = iter(
+            await self._embed_untruncated(
+                [d for d, fit in zip(documents, fits, strict=True) if not fit],
+                context_length,
+            )
+        )
+        embeddings = [next(response) if fit else next(untruncated) for fit in fits]
+        too_long = sum(1 for e in embeddings if isinstance(e, ChunkEmbeddingError))
+        if too_long:
+            await logger.awarning(
+                f"{too_long} chunks exceed the context length of the"
+                f" '{self.model}' model, {context_length} tokens"
+            )
+        return embeddings
+
+    async def _embed_untruncated(
+        self, documents: list[str], context_length: int
+    ) -> list[EmbeddingVector | ChunkEmbeddingError]:
+        """
+        Embeds documents that may exceed the context length of the model.
+
+        Ollama rejects a whole request when one of its documents is too long,
+        so a rejected request is split in halves until the documents that are
+        too long are found.
+        """
+        if not documents:
+            return []
+        try:
+            return list(
+                await self._untruncated_batcher.batch_chunks_and_embed(documents)
+            )
+        except ollama.ResponseError as e:
+            if "context length" not in e.error:
+                raise
+        if len(documents) == 1:
+            return [
+                ChunkEmbeddingError(
+                    error=TOKEN_CONTEXT_LENGTH_ERROR,
+                    error_details=f"chunk exceeds the {self.model} model context length of {context_length} tokens",  # noqa
+                )
+            ]
+        half = len(documents) // 2
+        return await self._embed_untruncated(
+            documents[:half], context_length
+        ) + await self._embed_untruncated(documents[half:], context_length)
 
     @cached_property
     def _batcher(self) -> BatchApiCaller[StringDocument]:
-        return BatchApiCaller(self._max_chunks_per_batch(), self.call_embed_api)
+        return BatchApiCaller(
+            self._max_chunks_per_batch(), self.call_embed_api, self._max_in_flight
+        )
+
+    @cached_property
+    def _untruncated_batcher(self) -> BatchApiCaller[StringDocument]:
+        return BatchApiCaller(
+            self._max_chunks_per_batch(),
+            lambda documents: self.call_embed_api(documents, truncate=False),
+            self._max_in_flight,
+        )
 
     @override
     def _max_chunks_per_batch(self) -> int:
@@ -105,22 +186,47 @@ class Ollama(BaseModel, Embedder):
             os.getenv("PGAI_VECTORIZER_OLLAMA_MAX_CHUNKS_PER_BATCH", default="2048")
         )
 
+    @cached_property
+    def _transport(self) -> httpx.AsyncHTTPTransport:
+        # The connections to the Ollama API are kept alive between requests.
+        # HTTP/2 is only negotiated over TLS, and if the h2 package is
+        # installed.
+        return httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=http_max_connections(),
+                max_keepalive_connections=http_max_connections(),
+                keepalive_expiry=http_keepalive_expiry(),
+            ),
+            http2=importlib.util.find_spec("h2") is not None,
+        )
+
+    @cached_property
+    def _client(self) -> ollama.AsyncClient:
+        # ollama builds its own httpx client, the transport it is given holds
+        # the connections and is closed by `close`.
+        return ollama.AsyncClient(host=self.base_url, transport=self._transport)
+
     @override
     async def setup(self):
-        client = ollama.AsyncClient(host=self.base_url)
+        client = self._client
         try:
-            await client.show(self.model)
+            model = await client.show(self.model)
+            if self._known_context_length() is None:
+                await self._model_context_length(model)
         except ollama.ResponseError as e:
             if f"model '{self.model}' not found" in e.error:
-                logger.warn(
+                await logger.awarning(
                     f"pulling ollama model '{self.model}', this may take a while"
                 )
                 await client.pull(self.model)
 
-    async def call_embed_api(self, documents: str | list[str]) -> EmbeddingResponse:
-        response = await ollama.AsyncClient(host=self.base_url).embed(
+    async def call_embed_api(
+        self, documents: str | list[str], truncate: bool = True
+    ) -> EmbeddingResponse:
+        response = await self._client.embed(
             model=self.model,
             input=documents,
+            truncate=truncate,
             options=self.options,
             keep_alive=self.keep_alive,
         )
@@ -135,24 +241,59 @@ class Ollama(BaseModel, Embedder):
         Gets the model details from the Ollama API
         :return:
         """
-        return await ollama.AsyncClient(host=self.base_url).show(self.model)
+        return await self._client.show(self.model)
+
+    @override
+    async def close(self):
+        self.__dict__.pop("_client", None)
+        if "_transport" in self.__dict__:
+            await self._transport.aclose()
+            self.__dict__.pop("_transport")
 
     async def _context_length(self) -> int | None:
         """
         Gets the context_length of the configured model, if available
         """
-        model = await self._model()
-        architecture = model["model_info"].get("general.architecture", None)
+        if self._known_context_length() is None:
+            await self._model_context_length(await self._model())
+        return self._known_context_length()
+
+    async def _model_context_length(self, model: Mapping[str, Any]) -> int | None:
+        """
+        Gets the context_length of the model from its details, and adds it to
+        the context length registry. Returns None, leaving the registry as it
+        is, when the details don't include it.
+        """
+        model_info: Mapping[str, Any] = model.get("model_info") or {}
+        architecture = model_info.get("general.architecture", None)
         if architecture is None:
-            logger.warn(f"unable to determine architecture for model '{self.model}'")
+            await logger.awarning(
+                f"unable to determine architecture for model '{self.model}'"
+            )
             return None
         context_key = f"{architecture}.context_length"
         # see https://github.com/ollama/ollama/blob/712d63c3f06f297e22b1ae32678349187dccd2e4/llm/ggml.go#L116-L118 # noqa
-        model_context_length = model["model_info"][context_key]
+        model_context_length = model_info.get(context_key, None)
+        if model_context_length is None:
+            await logger.awarning(
+                f"unable to determine context length for model '{self.model}'"
+            )
+            return None
+        context_lengths.set(self.implementation, self.model, model_context_length)
+        return model_context_length
+
+    def _known_context_length(self) -> int | None:
+        """
+        Gets the context_length of the configured model from the context
+        length registry, if it is known
+        """
+        model_context_length = context_lengths.get(self.implementation, self.model)
+        if model_context_length is None:
+            return None
         # the context window can be configured, so pull the value from the config
         num_ctx = (
             float("inf")
             if self.options is None
             else self.options.get("num_ctx", float("inf"))
         )
-        return min(model_context_length, num_ctx)
+        return int(min(model_context_length, num_ctx))
@@ -1,14 +1,21 @@
+import base64
+import contextlib
+import json
 import re
-from collections.abc import Sequence
+import tempfile
+from collections.abc import AsyncIterator, Sequence
 from functools import cached_property
 from typing import Any, Literal
 
+import numpy as np
+import numpy.typing as npt
 import openai
-import tiktoken
 from openai import resources
+from openai.types import Batch
 from pydantic import BaseModel
 from typing_extensions import override
 
+from ..context_lengths import context_lengths
 from ..embeddings import (
     ApiKeyMixin,
     BatchApiCaller,
@@ -21,8 +28,17 @@ from ..embeddings import (
     Usage,
     logger,
 )
+from ..process_pool import encode_documents
+from ..rate_limiter import rate_limits
 
 TOKEN_CONTEXT_LENGTH_ERROR = "chunk exceeds model context length"
+BATCH_JOB_REQUEST_ERROR = "batch job request failed"
+
+# See: https://platform.openai.com/docs/api-reference/embeddings/create
+OPENAI_MAX_TOKENS_PER_BATCH = 300_000
+
+# See: https://platform.openai.com/docs/guides/batch
+OPENAI_MAX_REQUESTS_PER_BATCH_JOB = 50_000
 
 openai_token_length_regex = re.compile(
     r"This model's maximum context length is (\d+) tokens"
@@ -58,33 +74,64 @@ class OpenAI(ApiKeyMixin, BaseModel, Embedder):
     def _openai_user(self) -> str | openai.NotGiven:
         return self.user if self.user is not None else openai.NOT_GIVEN
 
+    @cached_property
+    def _client(self) -> openai.AsyncOpenAI:
+        return openai.AsyncOpenAI(api_key=self._api_key, max_retries=3)
+
     @cached_property
     def _embedder(self) -> resources.AsyncEmbeddings:
-        return openai.AsyncOpenAI(api_key=self._api_key, max_retries=3).embeddings
+        return self._client.embeddings
+
+    @override
+    async def close(self):
+        if "_client" in self.__dict__:
+            await self._client.close()
+            self.__dict__.pop("_client")
+            self.__dict__.pop("_embedder", None)
 
     @override
     def _max_chunks_per_batch(self) -> int:
         return 2048
 
+    def _max_tokens_per_batch(self) -> int:
+        """
+        The maximum number of tokens, summed across all inputs, that can be
+        embedded per API call
+        """
+        return OPENAI_MAX_TOKENS_PER_BATCH
+
     async def call_embed_api(self, documents: list[TokenDocument]) -> EmbeddingResponse:
-        response = await self._embedder.create(
+        # Requests and tokens per minute are limited per API key, and the
+        # limits adapted to the rate limit headers of the responses.
+        rate_limiter = rate_limits.for_key(self.api_key_name)
+        await rate_limiter.acquire(sum(len(document) for document in documents))
+        raw_response = await self._embedder.with_raw_response.create(
             input=documents,
             model=self.model,
             dimensions=self._openai_dimensions,
             user=self._openai_user,
-            encoding_format="float",
+            encoding_format="base64",
         )
+        await rate_limiter.observe(raw_response.headers)
+        response = raw_response.parse()
         usage = Usage(
             prompt_tokens=response.usage.prompt_tokens,
             total_tokens=response.usage.total_tokens,
         )
         return EmbeddingResponse(
-            embeddings=[r.embedding for r in response.data], usage=usage
+            embeddings=[_decode_embedding(r.embedding) for r in response.data],
+            usage=usage,
         )
 
     @cached_property
     def _batcher(self) -> BatchApiCaller[TokenDocument]:
-        return BatchApiCaller(self._max_chunks_per_batch(), self.call_embed_api)
+        return BatchApiCaller(
+            self._max_chunks_per_batch(),
+            self.call_embed_api,
+            self._max_in_flight,
+            max_tokens_per_batch=self._max_tokens_per_batch(),
+            token_counter=len,
+        )
 
     @override
     async def embed(
@@ -98,7 +145,9 @@ class OpenAI(ApiKeyMixin, BaseModel, Embedder):
         exceed the model's token limit, the offending chunks are filtered out
         and the request is retried. The returned result will contain a
         ChunkEmbeddingError in place of an EmbeddingVector for the chunks that
-        exceeded the model's token limit.
+        exceeded the model's token limit. When the limit is known, from the
+        context length registry, chunks that exceed it are filtered out before
+        the first request.
 
         Args:
             documents (list[str]): A list of documents to be embedded.
@@ -109,6 +158,11 @@ class OpenAI(ApiKeyMixin, BaseModel, Embedder):
         """
         encoded_documents = await self._encode(documents)
         await logger.adebug(f"Chunks produced: {len(documents)}")
+        model_token_length = context_lengths.get(self.implementation, self.model)
+        if model_token_length is not None:
+            return await self._filter_by_length_and_embed(
+                model_token_length, encoded_documents
+            )
         try:
             return await self._batcher.batch_chunks_and_embed(encoded_documents)
         except openai.BadRequestError as e:
@@ -125,6 +179,7 @@ class OpenAI(ApiKeyMixin, BaseModel, Embedder):
             if not m:
                 raise e
             model_token_length = int(m.group(1))
+            context_lengths.set(self.implementation, self.model, model_token_length)
             return await self._filter_by_length_and_embed(
                 model_token_length, encoded_documents
             )
@@ -146,30 +201,26 @@ class OpenAI(ApiKeyMixin, BaseModel, Embedder):
             for the chunks that were successfully embedded, ChunkEmbeddingError
             for the chunks that exceeded the model's token limit.
         """
-        valid_documents: list[list[int]] = []
-        invalid_documents_idxs: list[int] = []
-        for i, doc in enumerate(encoded_documents):
-            if len(doc) > model_token_length:
-                invalid_documents_idxs.append(i)
-            else:
-                valid_documents.append(doc)
+        valid = [len(doc) <= model_token_length for doc in encoded_documents]
+        valid_documents = [
+            doc
+            for doc, is_valid in zip(encoded_documents, valid, strict=True)
+            if is_valid
+        ]
 
-        assert len(valid_documents) + len(invalid_documents_idxs) == len(
-            encoded_documents
-        )
-
-        response = await self._batcher.batch_chunks_and_embed(valid_documents)
+        response = iter(await self._batcher.batch_chunks_and_embed(valid_documents))
 
-        embeddings: list[ChunkEmbeddingError | list[float]] = []
-        for i in range(len(encoded_documents)):
-            if i in invalid_documents_idxs:
-                embedding = ChunkEmbeddingError(
-                    error=TOKEN_CONTEXT_LENGTH_ERROR,
-                    error_details=f"chunk exceeds the {self.model} model context length of {model_token_length} tokens",  # noqa
-                )
+        embeddings: list[ChunkEmbeddingError | EmbeddingVector] = []
+        for is_valid in valid:
+            if is_valid:
+                embeddings.append(next(response))
             else:
-                embedding = response.pop(0)
-            embeddings.append(embedding)
+                embeddings.append(
+                    ChunkEmbeddingError(
+                        error=TOKEN_CONTEXT_LENGTH_ERROR,
+                        error_details=f"chunk exceeds the {self.model} model context length of {model_token_length} tokens",  # noqa
+                    )
+                )
 
         return embeddings
 
@@ -184,19 +235,140 @@ class OpenAI(ApiKeyMixin, BaseModel, Embedder):
         Returns:
             list[list[int]]: A list of tokenized documents.
         """
-        total_tokens = 0
-        encoded_documents: list[list[int]] = []
-        for document in documents:
-            if self.model.endswith("001"):
-                # See: https://github.com/openai/openai-python/issues/418#issuecomment-1525939500
-                # replace newlines, which can negatively affect performance.
-                document = document.replace("\n", " ")
-            tokenized = self._encoder.encode_ordinary(document)
-            total_tokens += len(tokenized)
-            encoded_documents.append(tokenized)
+        if self._process_pool is not None:
+            encoded_documents = await self._process_pool.encode_documents(
+                self.model, documents
+            )
+        else:
+            encoded_documents = encode_documents(self.model, documents)
+        total_tokens = sum(len(tokenized) for tokenized in encoded_documents)
         await logger.adebug(f"Total tokens in batch: {total_tokens}")
         return encoded_documents
 
-    @cached_property
-    def _encoder(self) -> tiktoken.Encoding:
-        return tiktoken.encoding_for_model(self.model)
+    def _batch_job_request(self, custom_id: str, document: str) -> dict[str, Any]:
+        """
+        A line of the JSONL input file of a Batch API job, embedding a
+        single document.
+        """
+        body: dict[str, Any] = {
+            "model": self.model,
+            "input": document,
+            "encoding_format": "base64",
+        }
+        if not isinstance(self._openai_dimensions, openai.NotGiven):
+            body["dimensions"] = self._openai_dimensions
+        if not isinstance(self._openai_user, openai.NotGiven):
+            body["user"] = self._openai_user
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/embeddings",
+            "body": body,
+        }
+
+    async def create_batch_job(self, requests: list[tuple[str, str]]) -> Batch:
+        """
+        Writes the given documents to a JSONL file, uploads it, and creates a
+        Batch API job that embeds them.
+
+        Args:
+            requests (list[tuple[str, str]]): The custom id and the document
+                of each request, at most OPENAI_MAX_REQUESTS_PER_BATCH_JOB.
+
+        Returns:
+            Batch: The job.
+        """
+        with tempfile.TemporaryFile() as file:
+            for custom_id, document in requests:
+                file.write(
+                    json.dumps(self._batch_job_request(custom_id, document)).encode()
+                )
+                file.write(b"\n")
+            file.seek(0)
+            input_file = await self._client.files.create(
+                file=("embeddings.jsonl", file), purpose="batch"
+            )
+        return await self._client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/embeddings",
+            completion_window="24h",
+        )
+
+    async def retrieve_batch_job(self, batch_id: str) -> Batch:
+        return await self._client.batches.retrieve(batch_id)
+
+    async def cancel_batch_job(self, batch_id: str):
+        await self._client.batches.cancel(batch_id)
+
+    async def batch_job_inputs(self, batch: Batch) -> dict[str, str]:
+        """
+        Reads back the input file of a Batch API job.
+
+        Returns:
+            dict[str, str]: The document of each request, by custom id.
+        """
+        inputs: dict[str, str] = {}
+        async for request in self._batch_job_file(batch.input_file_id):
+            inputs[request["custom_id"]] = request["body"]["input"]
+        return inputs
+
+    async def batch_job_results(
+        self, batch: Batch
+    ) -> dict[str, EmbeddingVector | ChunkEmbeddingError]:
+        """
+        Reads the output and error files of a Batch API job. Requests that
+        were not processed, because the job failed, expired or was cancelled,
+        have no result.
+
+        Returns:
+            dict[str, EmbeddingVector | ChunkEmbeddingError]: The embedding,
+            or the error, of each request that was processed, by custom id.
+        """
+        results: dict[str, EmbeddingVector | ChunkEmbeddingError] = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id is None:
+                continue
+            async for result in self._batch_job_file(file_id):
+                custom_id = result["custom_id"]
+                response = result.get("response") or {}
+                body = response.get("body") or {}
+                if response.get("status_code") == 200:
+                    results[custom_id] = _decode_embedding(body["data"][0]["embedding"])
+                else:
+                    error = result.get("error") or body.get("error") or {}
+                    results[custom_id] = ChunkEmbeddingError(
+                        error=BATCH_JOB_REQUEST_ERROR,
+                        error_details=error.get("message", ""),
+                    )
+        return results
+
+    async def delete_batch_job_files(self, batch: Batch):
+        """
+        Deletes the input, output and error files of a Batch API job.
+        """
+        for file_id in (batch.input_file_id, batch.output_file_id, batch.error_file_id):
+            if file_id is None:
+                continue
+            with contextlib.suppress(openai.NotFoundError):
+                await self._client.files.delete(file_id)
+
+    async def _batch_job_file(self, file_id: str) -> AsyncIterator[dict[str, Any]]:
+        """
+        Streams the lines of a JSONL file of a Batch API job.
+        """
+        async with self._client.files.with_streaming_response.content(
+            file_id
+        ) as response:
+            async for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+
+def _decode_embedding(embedding: str | list[float]) -> npt.NDArray[np.float32]:
+    """
+    Decodes an embedding requested with encoding_format="base64", the raw
+    little-endian float32 values, without going through a list of floats.
+    """
+    if isinstance(embedding, str):
+        return np.frombuffer(base64.b64decode(embedding), dtype="<f4")
+    return np.asarray(embedding, dtype=np.float32)
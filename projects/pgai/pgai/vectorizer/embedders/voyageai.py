@@ -2,6 +2,7 @@ from collections.abc import Sequence
 from functools import cached_property
 from typing import Literal
 
+import aiohttp
 import voyageai
 import voyageai.error
 from pydantic import BaseModel
@@ -15,6 +16,8 @@ from ..embeddings import (
     EmbeddingVector,
     StringDocument,
     Usage,
+    http_keepalive_expiry,
+    http_max_connections,
     logger,
 )
 
@@ -53,20 +56,48 @@ class VoyageAI(ApiKeyMixin, BaseModel, Embedder):
 
     @cached_property
     def _batcher(self) -> BatchApiCaller[StringDocument]:
-        return BatchApiCaller(self._max_chunks_per_batch(), self.call_embed_api)
+        return BatchApiCaller(
+            self._max_chunks_per_batch(), self.call_embed_api, self._max_in_flight
+        )
 
     @override
     def _max_chunks_per_batch(self) -> int:
         return 128
 
-    async def call_embed_api(self, documents: list[str]) -> EmbeddingResponse:
-        response = await voyageai.AsyncClient(api_key=self._api_key).embed(
-            documents,
-            model=self.model,
-            input_type=self.input_type,
+    @cached_property
+    def _client(self) -> voyageai.AsyncClient:
+        return voyageai.AsyncClient(api_key=self._api_key)
+
+    @cached_property
+    def _session(self) -> aiohttp.ClientSession:
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=http_max_connections(),
+                keepalive_timeout=http_keepalive_expiry(),
+            )
         )
+
+    async def call_embed_api(self, documents: list[str]) -> EmbeddingResponse:
+        # The voyageai client opens a new session for every request, unless
+        # one is set in its context variable. The session is reused by every
+        # request, so that connections to the API are kept alive.
+        token = voyageai.aiosession.set(self._session)
+        try:
+            response = await self._client.embed(
+                documents,
+                model=self.model,
+                input_type=self.input_type,
+            )
+        finally:
+            voyageai.aiosession.reset(token)
         usage = Usage(
             prompt_tokens=response.total_tokens,
             total_tokens=response.total_tokens,
         )
         return EmbeddingResponse(embeddings=response.embeddings, usage=usage)
+
+    @override
+    async def close(self):
+        if "_session" in self.__dict__:
+            await self._session.close()
+            self.__dict__.pop("_session")
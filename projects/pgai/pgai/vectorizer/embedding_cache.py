@@ -0,0 +1,181 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import TypeAlias
+
+import numpy as np
+import numpy.typing as npt
+from psycopg import AsyncConnection
+from pydantic import BaseModel
+
+DEFAULT_LRU_SIZE = 4096
+# The age, in seconds, after which entries are deleted from the cache table.
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+# How often, in seconds, a worker deletes the expired entries.
+PRUNE_INTERVAL = 60 * 60
+
+CachedEmbedding: TypeAlias = npt.NDArray[np.float32]
+
+# Embedder fields that don't change the embeddings returned for a document.
+_NON_SEMANTIC_FIELDS = {"api_key_name", "user", "base_url", "keep_alive"}
+
+
+class LruCache:
+    """
+    A bounded, in-process least recently used cache of embeddings.
+
+    Attributes:
+        max_size (int): The maximum number of embeddings kept in memory.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_LRU_SIZE):
+        self.max_size = max_size
+        self._entries: OrderedDict[bytes, CachedEmbedding] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: bytes) -> CachedEmbedding | None:
+        embedding = self._entries.get(key)
+        if embedding is not None:
+            self._entries.move_to_end(key)
+        return embedding
+
+    def put(self, key: bytes, embedding: CachedEmbedding):
+        if self.max_size <= 0:
+            return
+        self._entries[key] = embedding
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+class EmbeddingCache:
+    """
+    Content-addressed cache of embeddings, so that identical chunks embedded
+    with the same embedding configuration are only sent to the provider once.
+
+    Lookups go to the in-process LRU first and then to the
+    `ai.vectorizer_embedding_cache` table, which is shared by every worker
+    and every vectorizer of the database. Entries older than `max_age` are
+    deleted from the table by `prune`.
+
+    Attributes:
+        lru (LruCache): The in-process cache, shared across vectorizers.
+        max_age (int): The age, in seconds, after which entries are deleted
+            from the table. 0 keeps them forever.
+    """
+
+    def __init__(self, lru: LruCache, max_age: int = DEFAULT_MAX_AGE):
+        self.lru = lru
+        self.max_age = max_age
+        self._pruned_at: float | None = None
+
+    @staticmethod
+    def keys(embedding: BaseModel, documents: Sequence[str]) -> list[bytes]:
+        """
+        Computes the cache keys of the given documents for an embedding
+        configuration.
+
+        Args:
+            embedding (BaseModel): The embedder the documents are embedded
+                with.
+            documents (Sequence[str]): The formatted chunks.
+
+        Returns:
+            list[bytes]: One sha256 digest per document.
+        """
+        config = embedding.model_dump(mode="json", exclude=_NON_SEMANTIC_FIELDS)
+        prefix = hashlib.sha256(
+            json.dumps(config, sort_keys=True).encode("utf-8")
+        ).digest()
+        return [
+            hashlib.sha256(prefix + document.encode("utf-8")).digest()
+            for document in documents
+        ]
+
+    async def get_many(
+        self, conn: AsyncConnection, keys: Sequence[bytes]
+    ) -> dict[bytes, CachedEmbedding]:
+        """
+        Looks up the embeddings of the given keys.
+
+        Args:
+            conn (AsyncConnection): The database connection.
+            keys (Sequence[bytes]): The keys to look up.
+
+        Returns:
+            dict[bytes, CachedEmbedding]: The embeddings found, by key.
+        """
+        found: dict[bytes, CachedEmbedding] = {}
+        missing: list[bytes] = []
+        for key in keys:
+            embedding = self.lru.get(key)
+            if embedding is not None:
+                found[key] = embedding
+            else:
+                missing.append(key)
+        if not missing:
+            return found
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                "select cache_key, embedding"
+                " from ai.vectorizer_embedding_cache"
+                " where cache_key = any(%s)",
+                (missing,),
+            )
+            for key, embedding in await cursor.fetchall():
+                key = bytes(key)
+                found[key] = embedding
+                self.lru.put(key, embedding)
+        return found
+
+    async def put_many(
+        self, conn: AsyncConnection, entries: dict[bytes, CachedEmbedding]
+    ):
+        """
+        Stores the given embeddings.
+
+        Args:
+            conn (AsyncConnection): The database connection.
+            entries (dict[bytes, CachedEmbedding]): The embeddings to store, by key.
+        """
+        if not entries:
+            return
+        for key, embedding in entries.items():
+            self.lru.put(key, embedding)
+        # Inserting in key order keeps concurrent workers from deadlocking on
+        # each other's uncommitted keys.
+        async with conn.cursor() as cursor:
+            await cursor.executemany(
+                "insert into ai.vectorizer_embedding_cache (cache_key, embedding)"
+                " values (%s, %s) on conflict (cache_key) do nothing",
+                sorted(entries.items(), key=lambda entry: entry[0]),
+            )
+
+    async def prune(self, conn: AsyncConnection) -> int:
+        """
+        Deletes the entries of the table older than `max_age`, at most once
+        per PRUNE_INTERVAL.
+
+        Args:
+            conn (AsyncConnection): The database connection.
+
+        Returns:
+            int: The number of entries deleted.
+        """
+        if self.max_age <= 0:
+            return 0
+        now = time.monotonic()
+        if self._pruned_at is not None and now - self._pruned_at < PRUNE_INTERVAL:
+            return 0
+        self._pruned_at = now
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                "delete from ai.vectorizer_embedding_cache"
+                " where created_at < now() - make_interval(secs => %s)",
+                (self.max_age,),
+            )
+            return cursor.rowcount
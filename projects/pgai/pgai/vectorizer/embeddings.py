@@ -1,13 +1,20 @@
-import math
+import asyncio
+import os
 import time
 from abc import ABC, abstractmethod
 from collections.abc import Awaitable, Callable, Sequence
 from dataclasses import dataclass
 from typing import Generic, TypeAlias, TypeVar
 
+import numpy as np
+import numpy.typing as npt
 import structlog
 from ddtrace import tracer
 
+from .batch_size import is_rate_limited
+from .metrics import worker_metrics
+from .process_pool import ProcessPool
+
 logger = structlog.get_logger()
 
 
@@ -25,7 +32,9 @@ class ChunkEmbeddingError:
     error_details: str = ""
 
 
-EmbeddingVector: TypeAlias = list[float]
+# Embedders that can decode their responses straight into float32 arrays
+# return arrays, which are copied to the database without conversion.
+EmbeddingVector: TypeAlias = list[float] | npt.NDArray[np.float32]
 
 StringDocument: TypeAlias = str
 TokenDocument: TypeAlias = list[int]
@@ -44,42 +53,110 @@ class Usage:
 class EmbeddingResponse:
     """A generic embedding response"""
 
-    embeddings: list[list[float]]
+    embeddings: list[EmbeddingVector]
     usage: Usage
 
 
 T = TypeVar("T", StringDocument, TokenDocument)
 
 
+DEFAULT_MAX_IN_FLIGHT = 1
+
+
 @dataclass
 class BatchApiCaller(Generic[T]):
+    """
+    Splits documents into batches that fit into a single request to an
+    embedding API, and sends the requests.
+
+    Attributes:
+        max_chunks_per_batch (int): The maximum number of documents per request.
+        api_callable (Callable[[list[T]], Awaitable[EmbeddingResponse]]): The
+            function that sends one request to the embedding API.
+        max_in_flight (int): The maximum number of requests sent concurrently.
+        max_tokens_per_batch (int | None): The maximum number of tokens, summed
+            across all documents, per request. Only enforced when
+            `token_counter` is set.
+        token_counter (Callable[[T], int] | None): Returns the number of tokens
+            of a document.
+    """
+
     max_chunks_per_batch: int
     api_callable: Callable[[list[T]], Awaitable[EmbeddingResponse]]
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT
+    max_tokens_per_batch: int | None = None
+    token_counter: Callable[[T], int] | None = None
+
+    def _pack_batches(self, documents: list[T]) -> list[list[int]]:
+        """
+        Splits the documents into batches, returning the indices of the
+        documents of each batch.
+
+        Without a token budget, documents are split in order into batches of
+        `max_chunks_per_batch` documents. With a token budget, documents are
+        packed first-fit decreasing, so that each batch is as full as possible
+        while staying within both `max_chunks_per_batch` documents and
+        `max_tokens_per_batch` tokens. A document that exceeds the token budget
+        on its own is sent in a batch of its own.
+
+        Within a batch, documents keep their original relative order.
+
+        Args:
+            documents (list[T]): A list of documents.
+
+        Returns:
+            list[list[int]]: The indices of the documents of each batch.
+        """
+        max_chunks = self.max_chunks_per_batch
+        if self.max_tokens_per_batch is None or self.token_counter is None:
+            return [
+                list(range(i, min(i + max_chunks, len(documents))))
+                for i in range(0, len(documents), max_chunks)
+            ]
+
+        max_tokens = self.max_tokens_per_batch
+        token_counts = [self.token_counter(doc) for doc in documents]
+        batches: list[list[int]] = []
+        batch_tokens: list[int] = []
+        by_size = sorted(range(len(documents)), key=lambda i: -token_counts[i])
+        for i in by_size:
+            tokens = token_counts[i]
+            for b, batch in enumerate(batches):
+                if len(batch) < max_chunks and batch_tokens[b] + tokens <= max_tokens:
+                    batch.append(i)
+                    batch_tokens[b] += tokens
+                    break
+            else:
+                batches.append([i])
+                batch_tokens.append(tokens)
+        for batch in batches:
+            batch.sort()
+        batches.sort(key=lambda batch: batch[0])
+        return batches
 
     async def batch_chunks_and_embed(self, documents: list[T]) -> list[EmbeddingVector]:
         """
         Performs the actual embedding of encoded documents by sending requests
         to the embedding API.
 
+        Up to `max_in_flight` requests are sent concurrently. The embeddings
+        are returned in the same order as the documents, regardless of the
+        order in which the requests complete.
+
         Args:
             documents (list[T]): A list of documents.
 
         Returns:
             list[EmbeddingVector]: A list of embedding vectors for each document.
         """
-        response: list[list[float]] = []
-        max_chunks_per_batch = self.max_chunks_per_batch
-        num_of_batches = math.ceil(len(documents) / max_chunks_per_batch)
-        total_duration = 0.0
-        embedding_stats = EmbeddingStats()
-        with tracer.trace("embeddings.do"):
-            current_span = tracer.current_span()
-            if current_span:
-                current_span.set_tag("batches.total", num_of_batches)
-            for i in range(0, len(documents), max_chunks_per_batch):
-                batch_num = i // max_chunks_per_batch + 1
-                batch = documents[i : i + max_chunks_per_batch]
-
+        batches = self._pack_batches(documents)
+        num_of_batches = len(batches)
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        request_times: list[float] = []
+        wall_start = time.perf_counter()
+
+        async def embed_batch(batch_num: int, batch: list[T]) -> EmbeddingResponse:
+            async with semaphore:
                 await logger.adebug(f"Batch {batch_num} of {num_of_batches}")
                 await logger.adebug(f"Chunks for this batch: {len(batch)}")
                 await logger.adebug(
@@ -91,7 +168,12 @@ class BatchApiCaller(Generic[T]):
                         current_span.set_tag("batch.id", batch_num)
                         current_span.set_tag("batch.chunks.total", len(batch))
                     start_time = time.perf_counter()
-                    response_ = await self.api_callable(batch)
+                    try:
+                        response = await self.api_callable(batch)
+                    except Exception as e:
+                        if is_rate_limited(e):
+                            worker_metrics.rate_limited.inc()
+                        raise
                     request_duration = time.perf_counter() - start_time
                     if current_span:
                         current_span.set_metric(
@@ -102,27 +184,55 @@ class BatchApiCaller(Generic[T]):
                     await logger.adebug(
                         f"Request {batch_num} of {num_of_batches} "
                         f"ended after: {request_duration} seconds. "
-                        f"Tokens usage: {response_.usage}"
+                        f"Tokens usage: {response.usage}"
                     )
-                    total_duration += request_duration
+                    request_times.append(request_duration)
+                    worker_metrics.embed_request_duration.observe(request_duration)
+                    worker_metrics.tokens.inc(response.usage.total_tokens)
+                    return response
 
-                    response += response_.embeddings
+        with tracer.trace("embeddings.do"):
+            current_span = tracer.current_span()
+            if current_span:
+                current_span.set_tag("batches.total", num_of_batches)
+            tasks = [
+                asyncio.create_task(
+                    embed_batch(batch_num, [documents[i] for i in batch])
+                )
+                for batch_num, batch in enumerate(batches, 1)
+            ]
+            try:
+                responses = await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+
+            # Put the embeddings back in the order of the documents. Every
+            # document is in exactly one batch, so no slot is left empty.
+            ordered: list[EmbeddingVector | None] = [None] * len(documents)
+            for batch, response_ in zip(batches, responses, strict=True):
+                for i, embedding in zip(batch, response_.embeddings, strict=True):
+                    ordered[i] = embedding
+            response = [embedding for embedding in ordered if embedding is not None]
 
-            embedding_stats.add_request_time(total_duration, len(documents))
-            await embedding_stats.print_stats()
             current_span = tracer.current_span()
             if current_span:
+                total_request_time = sum(request_times)
                 current_span.set_metric(
                     "embeddings.embedder.all_create_requests.time.seconds",
-                    embedding_stats.total_request_time,
+                    total_request_time,
                 )
                 current_span.set_metric(
                     "embeddings.embedder.all_create_requests.wall_time.seconds",
-                    embedding_stats.wall_time,
+                    time.perf_counter() - wall_start,
                 )
                 current_span.set_metric(
                     "embeddings.embedder.all_create_requests.chunks.rate",
-                    embedding_stats.chunks_per_second(),
+                    len(documents) / total_request_time
+                    if total_request_time > 0
+                    else 0,
                 )
 
             return response
@@ -136,6 +246,9 @@ class Embedder(ABC):
     or returning embedding errors.
     """
 
+    _max_in_flight: int = DEFAULT_MAX_IN_FLIGHT
+    _process_pool: ProcessPool | None = None
+
     @abstractmethod
     async def embed(
         self, documents: list[str]
@@ -164,6 +277,48 @@ class Embedder(ABC):
         Setup the embedder
         """
 
+    async def close(self) -> None:  # noqa: B027 empty on purpose
+        """
+        Closes the clients of the embedder, it can't be used afterwards
+        """
+
+    def set_max_in_flight(self, max_in_flight: int):
+        """
+        Sets the maximum number of concurrent requests sent to the embedding
+        API when a list of documents is split into several batches.
+
+        Must be called before the first call to `embed`.
+
+        Args:
+            max_in_flight (int): The maximum number of requests in flight.
+        """
+        self._max_in_flight = max_in_flight
+
+    def set_process_pool(self, process_pool: ProcessPool | None):
+        """
+        Sets the pool of processes used to tokenize documents, if the embedder
+        tokenizes them before sending them to the embedding API.
+
+        Args:
+            process_pool (ProcessPool | None): The pool, or None to tokenize
+                documents on the event loop.
+        """
+        self._process_pool = process_pool
+
+
+def http_max_connections() -> int:
+    """
+    The maximum number of connections an embedder opens to its API.
+    """
+    return int(os.getenv("PGAI_VECTORIZER_HTTP_MAX_CONNECTIONS", default="100"))
+
+
+def http_keepalive_expiry() -> float:
+    """
+    How long, in seconds, an embedder keeps an idle connection to its API open.
+    """
+    return float(os.getenv("PGAI_VECTORIZER_HTTP_KEEPALIVE_EXPIRY", default="30"))
+
 
 class ApiKeyMixin:
     """
@@ -206,73 +361,3 @@ class ApiKeyMixin:
         if api_key is None:
             raise ValueError(f"missing API key: {self.api_key_name}")
         self._api_key_ = api_key
-
-
-class EmbeddingStats:
-    """
-    Singleton class that tracks embedding statistics.
-
-    This class measures total request time, total chunks processed, and
-    calculates the number of chunks processed per second.
-
-    Attributes:
-        total_request_time (float): The total time spent on embedding requests.
-        total_chunks (int): The total number of chunks processed.
-        wall_time (float): The total elapsed time since the start of tracking.
-        wall_start (float): The time at which tracking started.
-    """
-
-    total_request_time: float
-    total_chunks: int
-    wall_time: float
-    wall_start: float
-
-    def __new__(cls):
-        if not hasattr(cls, "_instance"):
-            cls._instance = super().__new__(cls)
-
-            cls._instance.total_request_time = 0.0
-            cls._instance.total_chunks = 0
-            cls._instance.wall_time = 0
-            cls._instance.wall_start = time.perf_counter()
-        return cls._instance
-
-    def add_request_time(self, duration: float, chunk_count: int):
-        """
-        Adds the duration of an embedding request and the number of chunks
-        processed.
-
-        Args:
-            duration (float): The time taken for the request.
-            chunk_count (int): The number of chunks processed in the request.
-        """
-        self.total_request_time += duration
-        self.total_chunks += chunk_count
-
-    def chunks_per_second(self):
-        """
-        Calculates the number of chunks processed per second.
-
-        Returns:
-            float: The number of chunks processed per second. Returns 0 if no
-            requests have been processed.
-        """
-        return (
-            self.total_chunks / self.total_request_time
-            if self.total_request_time > 0
-            else 0
-        )
-
-    async def print_stats(self):
-        """
-        Logs embedding statistics, including request time, total chunks, and
-        chunks per second.
-        """
-        self.wall_time = time.perf_counter() - self.wall_start
-        await logger.adebug(
-            "Embedding stats",
-            total_request_time=self.total_request_time,
-            wall_time=self.wall_time,
-            total_chunks=self.total_chunks,
-            chunks_per_second=self.chunks_per_second(),
-        )
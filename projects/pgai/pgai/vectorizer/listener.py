@@ -0,0 +1,99 @@
+import asyncio
+
+import psycopg
+import structlog
+from psycopg import AsyncConnection, Notify, sql
+
+from .vectorizer import Vectorizer
+
+logger = structlog.get_logger()
+
+DEFAULT_NOTIFY_DEBOUNCE = 0.5
+
+
+class QueueListener:
+    """
+    Wakes the worker up when rows are queued for vectorizers whose source
+    trigger notifies their channel, see `ProcessingDefault.notify`.
+
+    Notifications are received on a dedicated connection, since a pooled
+    connection stops listening as soon as it is returned to the pool. The
+    connection is only opened once a vectorizer that notifies is found.
+
+    Attributes:
+        db_url (str): The URL of the database to connect to.
+        debounce (float): How long to keep collecting notifications after the
+            first one, in seconds, so that a burst of writes results in a
+            single wake up.
+    """
+
+    def __init__(self, db_url: str, debounce: float = DEFAULT_NOTIFY_DEBOUNCE):
+        self.db_url = db_url
+        self.debounce = debounce
+        self._conn: AsyncConnection | None = None
+        self._channels: dict[str, int] = {}
+        self._listening: set[str] = set()
+
+    async def listen(self, vectorizer: Vectorizer):
+        """
+        Starts listening to the channel of the given vectorizer, if its source
+        trigger notifies it.
+
+        Args:
+            vectorizer (Vectorizer): The vectorizer to listen for.
+        """
+        if not vectorizer.config.processing.notify:
+            return
+        self._channels[vectorizer.notify_channel] = vectorizer.id
+        if self._conn is None:
+            self._conn = await AsyncConnection.connect(self.db_url, autocommit=True)
+            self._listening = set()
+        for channel in self._channels.keys() - self._listening:
+            await self._conn.execute(
+                sql.SQL("LISTEN {}").format(sql.Identifier(channel))
+            )
+            self._listening.add(channel)
+
+    async def wait(self, timeout: float) -> set[int] | None:
+        """
+        Waits for rows to be queued, for at most `timeout` seconds.
+
+        Args:
+            timeout (float): The poll interval, in seconds.
+
+        Returns:
+            set[int] | None: The ids of the vectorizers that were notified, or
+                None if the timeout expired and every vectorizer should be
+                polled.
+        """
+        if self._conn is None:
+            await asyncio.sleep(timeout)
+            return None
+
+        notified: set[int] = set()
+        try:
+            async for notify in self._conn.notifies(timeout=timeout, stop_after=1):
+                self._add(notified, notify)
+            if not notified:
+                return None
+            # Coalesce the notifications sent right after the first one.
+            async for notify in self._conn.notifies(timeout=self.debounce):
+                self._add(notified, notify)
+        except psycopg.OperationalError as e:
+            # Notifications may have been missed, fall back to polling every
+            # vectorizer. The connection is opened again by the next listen.
+            await logger.awarning(f"stopped listening for notifications: {str(e)}")
+            await self.close()
+            return None
+        await logger.adebug("woken up by notifications", vectorizer_ids=notified)
+        return notified
+
+    def _add(self, notified: set[int], notify: Notify):
+        vectorizer_id = self._channels.get(notify.channel)
+        if vectorizer_id is not None:
+            notified.add(vectorizer_id)
+
+    async def close(self):
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
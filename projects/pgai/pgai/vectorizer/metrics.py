@@ -0,0 +1,310 @@
+import asyncio
+import contextlib
+import math
+from collections.abc import Iterator
+from contextvars import ContextVar
+
+import structlog
+
+logger = structlog.get_logger()
+
+DEFAULT_METRICS_HOST = "0.0.0.0"
+
+# The upper bounds, in seconds, of the buckets of the duration histograms.
+DURATION_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    math.inf,
+)
+
+# The vectorizer the current task works for. Set by the Worker around calls to
+# the embedders, which don't know which vectorizer they embed for.
+current_vectorizer_id: ContextVar[int | None] = ContextVar(
+    "current_vectorizer_id", default=None
+)
+
+
+@contextlib.contextmanager
+def for_vectorizer(vectorizer_id: int) -> Iterator[None]:
+    """
+    Attributes the measurements made in the block, and in the tasks it
+    creates, to the vectorizer.
+    """
+    token = current_vectorizer_id.set(vectorizer_id)
+    try:
+        yield
+    finally:
+        current_vectorizer_id.reset(token)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def _labels(vectorizer_id: int | None, **extra: str) -> str:
+    labels = dict(extra)
+    if vectorizer_id is not None:
+        labels = {"vectorizer_id": str(vectorizer_id), **labels}
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+class Counter:
+    """
+    A Prometheus counter, by vectorizer.
+
+    Attributes:
+        name (str): The name of the metric.
+        help (str): The description of the metric.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: dict[int | None, float] = {}
+
+    def inc(self, amount: float = 1, vectorizer_id: int | None = None):
+        """
+        Adds to the counter of the vectorizer, by default the current one.
+        """
+        if vectorizer_id is None:
+            vectorizer_id = current_vectorizer_id.get()
+        self._values[vectorizer_id] = self._values.get(vectorizer_id, 0) + amount
+
+    def value(self, vectorizer_id: int | None = None) -> float:
+        return self._values.get(vectorizer_id, 0)
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{_labels(vectorizer_id)} {_format_value(value)}"
+            for vectorizer_id, value in sorted(
+                self._values.items(), key=lambda item: item[0] or 0
+            )
+        ]
+
+
+class Gauge(Counter):
+    """
+    A Prometheus gauge, by vectorizer.
+    """
+
+    kind = "gauge"
+
+    def set(self, value: float, vectorizer_id: int | None = None):
+        """
+        Sets the gauge of the vectorizer, by default the current one.
+        """
+        if vectorizer_id is None:
+            vectorizer_id = current_vectorizer_id.get()
+        self._values[vectorizer_id] = value
+
+    def remove(self, vectorizer_id: int):
+        self._values.pop(vectorizer_id, None)
+
+
+class Histogram:
+    """
+    A Prometheus histogram, by vectorizer.
+
+    Attributes:
+        name (str): The name of the metric.
+        help (str): The description of the metric.
+        buckets (tuple[float, ...]): The upper bounds of the buckets, the
+            last one being infinity.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help: str, buckets: tuple[float, ...] = DURATION_BUCKETS
+    ):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # Per vectorizer: the count of each bucket, not cumulative, and the
+        # sum of the observed values.
+        self._counts: dict[int | None, list[int]] = {}
+        self._sums: dict[int | None, float] = {}
+
+    def observe(self, value: float, vectorizer_id: int | None = None):
+        """
+        Records a value for the vectorizer, by default the current one.
+        """
+        if vectorizer_id is None:
+            vectorizer_id = current_vectorizer_id.get()
+        counts = self._counts.setdefault(vectorizer_id, [0] * len(self.buckets))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        self._sums[vectorizer_id] = self._sums.get(vectorizer_id, 0) + value
+
+    def count(self, vectorizer_id: int | None = None) -> int:
+        return sum(self._counts.get(vectorizer_id, []))
+
+    def samples(self) -> list[str]:
+        samples: list[str] = []
+        for vectorizer_id, counts in sorted(
+            self._counts.items(), key=lambda item: item[0] or 0
+        ):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts, strict=True):
+                cumulative += count
+                labels = _labels(vectorizer_id, le=_format_value(bound))
+                samples.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(vectorizer_id)
+            samples.append(
+                f"{self.name}_sum{labels} {_format_value(self._sums[vectorizer_id])}"
+            )
+            samples.append(f"{self.name}_count{labels} {cumulative}")
+        return samples
+
+
+class WorkerMetrics:
+    """
+    The metrics of the vectorizer worker, labelled by vectorizer id.
+    """
+
+    def __init__(self):
+        self.items_claimed = Counter(
+            "pgai_vectorizer_items_claimed_total",
+            "Queue items claimed by the worker.",
+        )
+        self.chunks = Counter(
+            "pgai_vectorizer_chunks_total",
+            "Chunks written to the target table.",
+        )
+        self.tokens = Counter(
+            "pgai_vectorizer_tokens_total",
+            "Tokens sent to the embedding provider, as reported by it.",
+        )
+        self.rate_limited = Counter(
+            "pgai_vectorizer_rate_limited_total",
+            "Embedding requests rejected by the provider with HTTP 429.",
+        )
+        self.errors = Counter(
+            "pgai_vectorizer_errors_total",
+            "Batches that failed.",
+        )
+        self.queue_pending = Gauge(
+            "pgai_vectorizer_queue_pending_items",
+            "Estimated number of items in the queue, as of the last poll.",
+        )
+        self.embed_request_duration = Histogram(
+            "pgai_vectorizer_embed_request_duration_seconds",
+            "Duration of the requests to the embedding provider.",
+        )
+        self.copy_duration = Histogram(
+            "pgai_vectorizer_copy_duration_seconds",
+            "Duration of the COPY of the embeddings to the target table.",
+        )
+        self.transaction_duration = Histogram(
+            "pgai_vectorizer_transaction_duration_seconds",
+            "Duration of the transactions claiming or writing a batch.",
+        )
+
+    def render(self) -> str:
+        """
+        Renders the metrics in the Prometheus text exposition format.
+        """
+        lines: list[str] = []
+        for metric in (
+            self.items_claimed,
+            self.chunks,
+            self.tokens,
+            self.rate_limited,
+            self.errors,
+            self.queue_pending,
+            self.embed_request_duration,
+            self.copy_duration,
+            self.transaction_duration,
+        ):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+async def _handle_request(
+    metrics: WorkerMetrics, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+):
+    try:
+        request_line = await reader.readline()
+        # The headers of the request are not used.
+        while await reader.readline() not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        method = parts[0] if parts else ""
+        path = parts[1].split("?", 1)[0] if len(parts) > 1 else ""
+        if method in ("GET", "HEAD") and path == "/metrics":
+            status = "200 OK"
+            body = metrics.render().encode()
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            status = "404 Not Found"
+            body = b"not found\n"
+            content_type = "text/plain; charset=utf-8"
+        writer.write(
+            (
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n"
+                "\r\n"
+            ).encode()
+        )
+        if method != "HEAD":
+            writer.write(body)
+        await writer.drain()
+    except (ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(
+    port: int, host: str = DEFAULT_METRICS_HOST, metrics: WorkerMetrics | None = None
+) -> asyncio.Server:
+    """
+    Serves the metrics at http://host:port/metrics, on the running event loop.
+
+    Args:
+        port (int): The port to listen on, 0 for any free one.
+        host (str): The address to listen on.
+        metrics (WorkerMetrics | None): The metrics to serve, by default the
+            ones of the process.
+
+    Returns:
+        asyncio.Server: The server, to be closed when the worker exits.
+    """
+    served = metrics if metrics is not None else worker_metrics
+    server = await asyncio.start_server(
+        lambda reader, writer: _handle_request(served, reader, writer), host, port
+    )
+    await logger.ainfo(
+        "serving metrics",
+        addresses=[socket.getsockname() for socket in server.sockets],
+    )
+    return server
+
+
+# The metrics of the process, shared by all the Workers.
+worker_metrics = WorkerMetrics()
@@ -0,0 +1,163 @@
+import asyncio
+import math
+import multiprocessing
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache
+from typing import Any, TypeVar
+
+import tiktoken
+
+from .chunking import (
+    LangChainCharacterTextSplitter,
+    LangChainRecursiveCharacterTextSplitter,
+)
+from .formatting import ChunkValue, PythonTemplate
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Lists are only split into several tasks when each task gets at least this
+# number of items or documents, below that pickling costs more than running
+# them on another core saves.
+MIN_ITEMS_PER_TASK = 16
+
+
+def chunk_items(
+    chunking: LangChainCharacterTextSplitter | LangChainRecursiveCharacterTextSplitter,
+    formatting: PythonTemplate | ChunkValue,
+    pk_attnames: list[str],
+    items: list[dict[str, Any]],
+) -> tuple[list[list[Any]], list[str]]:
+    """
+    Splits the given items into chunks and formats them.
+
+    Args:
+        chunking: The chunking configuration of the vectorizer.
+        formatting: The formatting configuration of the vectorizer.
+        pk_attnames (list[str]): The primary key columns of the source table.
+        items (list[dict[str, Any]]): The items to chunk.
+
+    Returns:
+        tuple[list[list[Any]], list[str]]: A tuple of records without
+            embeddings and the formatted documents to embed.
+    """
+    records_without_embeddings: list[list[Any]] = []
+    documents: list[str] = []
+    for item in items:
+        pk = [item[pk] for pk in pk_attnames]
+        chunks = chunking.into_chunks(item)
+        for chunk_id, chunk in enumerate(chunks, 0):
+            formatted = formatting.format(chunk, item)
+            records_without_embeddings.append(pk + [chunk_id, formatted])
+            documents.append(formatted)
+    return records_without_embeddings, documents
+
+
+@cache
+def _encoder(model: str) -> tiktoken.Encoding:
+    return tiktoken.encoding_for_model(model)
+
+
+def encode_documents(model: str, documents: list[str]) -> list[list[int]]:
+    """
+    Encodes a list of documents into a list of tokenized documents, using the
+    tiktoken encoder of the given OpenAI model.
+
+    Args:
+        model (str): The name of the model.
+        documents (list[str]): A list of text documents to be tokenized.
+
+    Returns:
+        list[list[int]]: A list of tokenized documents.
+    """
+    encoder = _encoder(model)
+    encoded_documents: list[list[int]] = []
+    for document in documents:
+        if model.endswith("001"):
+            # See: https://github.com/openai/openai-python/issues/418#issuecomment-1525939500
+            # replace newlines, which can negatively affect performance.
+            document = document.replace("\n", " ")
+        encoded_documents.append(encoder.encode_ordinary(document))
+    return encoded_documents
+
+
+class ProcessPool:
+    """
+    Runs chunking, formatting and tokenization in worker processes, so that
+    large documents don't block the event loop, which every task of the
+    worker shares, and are processed on all the cores.
+
+    A list of items is split into at most one slice per process, each sent to
+    a process as a single task, so that pickling is amortized over many items.
+
+    Attributes:
+        max_workers (int): The number of processes.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor: ProcessPoolExecutor | None = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        # Processes are spawned rather than forked, since forking a process
+        # that runs an event loop and client threads is not safe.
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def chunk_items(
+        self,
+        chunking: LangChainCharacterTextSplitter
+        | LangChainRecursiveCharacterTextSplitter,
+        formatting: PythonTemplate | ChunkValue,
+        pk_attnames: list[str],
+        items: list[dict[str, Any]],
+    ) -> tuple[list[list[Any]], list[str]]:
+        """
+        Same as `chunk_items`, in the worker processes.
+        """
+        results = await self._map(
+            chunk_items, (chunking, formatting, pk_attnames), items
+        )
+        records: list[list[Any]] = []
+        documents: list[str] = []
+        for part_records, part_documents in results:
+            records.extend(part_records)
+            documents.extend(part_documents)
+        return records, documents
+
+    async def encode_documents(
+        self, model: str, documents: list[str]
+    ) -> list[list[int]]:
+        """
+        Same as `encode_documents`, in the worker processes.
+        """
+        results = await self._map(encode_documents, (model,), documents)
+        return [encoded for part in results for encoded in part]
+
+    async def _map(
+        self, fn: Callable[..., R], args: tuple[Any, ...], values: list[T]
+    ) -> list[R]:
+        """
+        Splits `values` into slices and calls `fn(*args, slice)` for each
+        slice in the worker processes.
+        """
+        if not values:
+            return []
+        slices = max(1, min(self.max_workers, len(values) // MIN_ITEMS_PER_TASK))
+        slice_size = math.ceil(len(values) / slices)
+        loop = asyncio.get_running_loop()
+        futures = [
+            loop.run_in_executor(self.executor, fn, *args, values[i : i + slice_size])
+            for i in range(0, len(values), slice_size)
+        ]
+        return list(await asyncio.gather(*futures))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
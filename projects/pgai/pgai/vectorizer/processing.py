@@ -20,6 +20,29 @@ class ProcessingDefault(BaseModel):
         concurrency (Annotated[int, Gt(gt=0), Le(le=10)]): The number of
             concurrent tasks allowed, constrained to be greater than 0 and less
             than or equal to 10. Default is 1.
+        max_in_flight (Annotated[int, Gt(gt=0), Le(le=50)]): The maximum
+            number of concurrent requests to the embedding provider when a
+            batch is split into several requests, constrained to be greater
+            than 0 and less than or equal to 50. Default is 1.
+        notify (bool): Whether the trigger on the source table notifies the
+            vectorizer's channel when rows are queued, so that listening
+            workers wake up without waiting for the poll interval. Default is
+            False.
+        deduplicate_queue (bool): Whether the queue table holds each row of
+            the source table at most once. Rows queued again keep their
+            place in the queue. Default is False.
+        queue_partitions (Annotated[int, Gt(gt=0), Le(le=64)] | None): The
+            number of hash partitions of the queue table. Each worker slot
+            claims items from its own partition in the order they were
+            queued, and from the other partitions when its own is empty.
+            Default is None, for a queue table that isn't partitioned.
+        lease_seconds (Annotated[int, Gt(gt=0), Le(le=86400)] | None): The
+            duration of the lease on the queue rows claimed by a worker.
+            Claimed items are embedded outside of any transaction, and their
+            queue rows are only deleted once the embeddings are written. The
+            items of an expired lease are claimed again. Default is None, for
+            a queue whose rows are deleted by the transaction that embeds
+            them.
         log_level (Literal["CRITICAL", "FATAL", "ERROR", "WARN",
             "WARNING", "INFO", "DEBUG"]): The log level for logging output.
             Default is "INFO".
@@ -28,6 +51,11 @@ class ProcessingDefault(BaseModel):
     implementation: Literal["default"]
     batch_size: Annotated[int, Gt(gt=0), Le(le=2048)] = 50
     concurrency: Annotated[int, Gt(gt=0), Le(le=10)] = 1
+    max_in_flight: Annotated[int, Gt(gt=0), Le(le=50)] = 1
+    notify: bool = False
+    deduplicate_queue: bool = False
+    queue_partitions: Annotated[int, Gt(gt=0), Le(le=64)] | None = None
+    lease_seconds: Annotated[int, Gt(gt=0), Le(le=86400)] | None = None
     log_level: Literal[
         "CRITICAL",
         "FATAL",
@@ -0,0 +1,290 @@
+import asyncio
+import time
+from collections.abc import Mapping
+
+import psycopg
+import structlog
+from psycopg import AsyncConnection
+
+logger = structlog.get_logger()
+
+
+class TokenBucket:
+    """
+    A bucket refilled at `per_minute` units per minute, up to `per_minute`.
+
+    Reservations are always granted, and may leave the bucket in debt: the
+    caller then waits until the bucket is refilled to zero. This way callers
+    are served in the order they reserve, and a reservation larger than the
+    bucket still goes through.
+
+    Attributes:
+        per_minute (float): The number of units per minute.
+    """
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.level = per_minute
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(
+            self.per_minute,
+            self.level + (now - self._updated) * self.per_minute / 60,
+        )
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        Takes `amount` units from the bucket.
+
+        Returns:
+            float: The number of seconds to wait before using them.
+        """
+        self._refill()
+        self.level -= amount
+        return max(0.0, -self.level * 60 / self.per_minute)
+
+    def observe(self, per_minute: float | None, remaining: float | None):
+        """
+        Adapts the bucket to the limit and remaining units reported by the
+        provider.
+        """
+        self._refill()
+        if per_minute is not None and per_minute > 0:
+            self.per_minute = per_minute
+            self.level = min(self.level, per_minute)
+        if remaining is not None:
+            self.level = min(self.level, remaining)
+
+
+class TableBuckets:
+    """
+    Token buckets stored in the `ai.vectorizer_rate_limit` table, so that
+    every worker using the same API key draws from the same buckets.
+
+    Buckets are updated with a single statement on a dedicated autocommit
+    connection, so the row lock is only held for the duration of the update.
+
+    Attributes:
+        db_url (str): The URL of the database to connect to.
+    """
+
+    def __init__(self, db_url: str):
+        self.db_url = db_url
+        self._conn: AsyncConnection | None = None
+        self._lock = asyncio.Lock()
+
+    async def reserve(
+        self,
+        api_key_name: str,
+        requests_per_minute: float | None,
+        tokens_per_minute: float | None,
+        tokens: float,
+    ) -> float:
+        """
+        Takes a request and `tokens` tokens from the buckets of an API key.
+
+        A limit that is not known yet is None, and its bucket is left null
+        until it is known.
+
+        Returns:
+            float: The number of seconds to wait before sending the request.
+        """
+        row = await self._execute(
+            """
+            insert into ai.vectorizer_rate_limit as b
+                (api_key_name, requests, tokens, updated_at)
+            values
+                (%(name)s, %(rpm)s - 1, %(tpm)s - %(tokens)s, clock_timestamp())
+            on conflict (api_key_name) do update set
+              requests = least(%(rpm)s, b.requests + %(rpm)s
+                * extract(epoch from clock_timestamp() - b.updated_at)::float8 / 60
+              ) - 1
+            , tokens = least(%(tpm)s, b.tokens + %(tpm)s
+                * extract(epoch from clock_timestamp() - b.updated_at)::float8 / 60
+              ) - %(tokens)s
+            , updated_at = clock_timestamp()
+            returning requests, tokens
+            """,
+            {
+                "name": api_key_name,
+                "rpm": requests_per_minute,
+                "tpm": tokens_per_minute,
+                "tokens": tokens,
+            },
+        )
+        requests_left, tokens_left = row if row is not None else (None, None)
+        return max(
+            0.0,
+            -requests_left * 60 / requests_per_minute
+            if requests_left is not None and requests_per_minute is not None
+            else 0.0,
+            -tokens_left * 60 / tokens_per_minute
+            if tokens_left is not None and tokens_per_minute is not None
+            else 0.0,
+        )
+
+    async def observe(
+        self,
+        api_key_name: str,
+        remaining_requests: float | None,
+        remaining_tokens: float | None,
+    ):
+        """
+        Lowers the buckets of an API key to the remaining requests and tokens
+        reported by the provider.
+        """
+        if remaining_requests is None and remaining_tokens is None:
+            return
+        await self._execute(
+            """
+            update ai.vectorizer_rate_limit set
+              requests = least(requests, coalesce(%(requests)s, requests))
+            , tokens = least(tokens, coalesce(%(tokens)s, tokens))
+            where api_key_name = %(name)s
+            """,
+            {
+                "name": api_key_name,
+                "requests": remaining_requests,
+                "tokens": remaining_tokens,
+            },
+        )
+
+    async def _execute(
+        self, query: str, params: Mapping[str, object]
+    ) -> tuple[float | None, float | None] | None:
+        async with self._lock:
+            if self._conn is None:
+                self._conn = await AsyncConnection.connect(self.db_url, autocommit=True)
+            async with self._conn.cursor() as cursor:
+                await cursor.execute(query, params)  # type: ignore
+                return await cursor.fetchone() if cursor.description else None
+
+    async def close(self):
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+
+class RateLimiter:
+    """
+    Limits the requests and tokens per minute sent with an API key.
+
+    The limits are learned from the `x-ratelimit-*` headers of the provider's
+    responses, and the buckets are lowered to the remaining requests and
+    tokens the provider reports, so that other clients using the same key are
+    accounted for. Until the first response, requests are not limited.
+
+    Attributes:
+        api_key_name (str): The name of the API key.
+        table (TableBuckets | None): When set, the buckets are shared with
+            the other workers of the database.
+    """
+
+    def __init__(self, api_key_name: str, table: TableBuckets | None = None):
+        self.api_key_name = api_key_name
+        self.table = table
+        self.requests: TokenBucket | None = None
+        self.tokens: TokenBucket | None = None
+
+    async def acquire(self, tokens: int):
+        """
+        Waits until a request with the given number of tokens can be sent.
+        """
+        if self.requests is None and self.tokens is None:
+            return
+        requests_per_minute = (
+            self.requests.per_minute if self.requests is not None else None
+        )
+        tokens_per_minute = self.tokens.per_minute if self.tokens is not None else None
+        wait = None
+        if self.table is not None:
+            try:
+                wait = await self.table.reserve(
+                    self.api_key_name, requests_per_minute, tokens_per_minute, tokens
+                )
+            except psycopg.Error as e:
+                await logger.awarning(f"using local rate limits: {str(e)}")
+                await self.table.close()
+        if wait is None:
+            wait = max(
+                self.requests.reserve(1) if self.requests is not None else 0.0,
+                self.tokens.reserve(tokens) if self.tokens is not None else 0.0,
+            )
+        if wait > 0:
+            await logger.adebug(
+                f"rate limited, waiting {wait:.2f}s", api_key_name=self.api_key_name
+            )
+            await asyncio.sleep(wait)
+
+    async def observe(self, headers: Mapping[str, str]):
+        """
+        Adapts the limits to the `x-ratelimit-*` headers of a response.
+        """
+        limit_requests = _header(headers, "x-ratelimit-limit-requests")
+        limit_tokens = _header(headers, "x-ratelimit-limit-tokens")
+        remaining_requests = _header(headers, "x-ratelimit-remaining-requests")
+        remaining_tokens = _header(headers, "x-ratelimit-remaining-tokens")
+        if limit_requests is not None and self.requests is None:
+            self.requests = TokenBucket(limit_requests)
+        if limit_tokens is not None and self.tokens is None:
+            self.tokens = TokenBucket(limit_tokens)
+        if self.requests is not None:
+            self.requests.observe(limit_requests, remaining_requests)
+        if self.tokens is not None:
+            self.tokens.observe(limit_tokens, remaining_tokens)
+        if self.table is not None:
+            try:
+                await self.table.observe(
+                    self.api_key_name, remaining_requests, remaining_tokens
+                )
+            except psycopg.Error as e:
+                await logger.awarning(f"using local rate limits: {str(e)}")
+                await self.table.close()
+
+
+def _header(headers: Mapping[str, str], name: str) -> float | None:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class RateLimits:
+    """
+    The rate limiters of the process, by API key name, so that all the
+    embedders using the same key share its limits.
+    """
+
+    def __init__(self):
+        self._limiters: dict[str, RateLimiter] = {}
+        self._table: TableBuckets | None = None
+
+    def share(self, db_url: str):
+        """
+        Shares the rate limits with the other workers of the database, through
+        the `ai.vectorizer_rate_limit` table.
+        """
+        self._table = TableBuckets(db_url)
+        for limiter in self._limiters.values():
+            limiter.table = self._table
+
+    def for_key(self, api_key_name: str) -> RateLimiter:
+        limiter = self._limiters.get(api_key_name)
+        if limiter is None:
+            limiter = RateLimiter(api_key_name, self._table)
+            self._limiters[api_key_name] = limiter
+        return limiter
+
+    async def close(self):
+        if self._table is not None:
+            await self._table.close()
+
+
+# The rate limiters of the process, shared by all the embedders.
+rate_limits = RateLimits()
@@ -0,0 +1,188 @@
+import asyncio
+import dataclasses
+import math
+from collections.abc import Awaitable, Callable
+
+import structlog
+
+logger = structlog.get_logger()
+
+DEFAULT_QUANTUM_BATCHES = 4
+
+
+@dataclasses.dataclass
+class VectorizerQueue:
+    """
+    The work queue of a vectorizer, as seen by the FairScheduler.
+
+    Attributes:
+        vectorizer_id (int): The id of the vectorizer.
+        batch_size (int): The number of items the vectorizer claims per batch.
+        pending (int): The estimated number of items in the queue, as
+            returned by ai.vectorizer_queue_pending.
+        deficit (int): The number of items the vectorizer may still process
+            in the current round.
+        running (int): The number of turns of the vectorizer in progress.
+        processed (int): The number of items processed so far.
+        done (bool): Whether the queue was found empty, or a turn failed.
+            A turn that processes fewer items than it was given, while
+            items are still pending, doesn't mean the queue is empty: the
+            other items may be locked by a concurrent turn.
+    """
+
+    vectorizer_id: int
+    batch_size: int
+    pending: int
+    deficit: int = 0
+    running: int = 0
+    processed: int = 0
+    done: bool = False
+
+
+class FairScheduler:
+    """
+    Runs the vectorizers of a worker concurrently, sharing a global number of
+    tasks between them with deficit round-robin.
+
+    Every round, each vectorizer with pending items is credited a quantum of
+    `quantum_batches` batches. A vectorizer is given turns, each processing
+    at most the items it has been credited, and the items processed beyond
+    its credit are carried over to the next round. Queues are served from
+    the smallest to the largest, so vectorizers with a few pending items are
+    done after their first turn, while large backfills keep getting their
+    share of the tasks, and all the tasks when they are the only ones left.
+
+    Attributes:
+        run_turn (Callable[[int, int], Awaitable[int]]): Processes at most
+            the given number of items, give or take a batch, from the queue
+            of the vectorizer with the given id, and returns the number of
+            items processed. Processing no items means the queue is empty.
+        max_concurrency (int): The number of turns running at the same time,
+            across all the vectorizers.
+        tasks_per_vectorizer (int): The number of turns of a single
+            vectorizer running at the same time.
+        quantum_batches (int): The number of batches credited to each
+            vectorizer per round.
+        fail_fast (bool): When set, the first turn that fails cancels the
+            others and its error is raised. Otherwise the error is logged and
+            only the vectorizer that failed is stopped.
+    """
+
+    def __init__(
+        self,
+        run_turn: Callable[[int, int], Awaitable[int]],
+        max_concurrency: int,
+        tasks_per_vectorizer: int = 1,
+        quantum_batches: int = DEFAULT_QUANTUM_BATCHES,
+        fail_fast: bool = False,
+    ):
+        self.run_turn = run_turn
+        self.max_concurrency = max_concurrency
+        self.tasks_per_vectorizer = tasks_per_vectorizer
+        self.quantum_batches = quantum_batches
+        self.fail_fast = fail_fast
+
+    async def run(self, queues: list[VectorizerQueue]) -> dict[int, int]:
+        """
+        Processes the given queues until they are all empty.
+
+        Args:
+            queues (list[VectorizerQueue]): The queues to process. Queues
+                without pending items are skipped.
+
+        Returns:
+            dict[int, int]: The number of items processed, by vectorizer id.
+        """
+        active = sorted((q for q in queues if q.pending > 0), key=lambda q: q.pending)
+        turns: dict[asyncio.Task[int], tuple[VectorizerQueue, int]] = {}
+        # Where the search for the next queue to serve starts.
+        position = 0
+        try:
+            while True:
+                while len(turns) < self.max_concurrency:
+                    queue, position = self._next_queue(active, position)
+                    if queue is None:
+                        break
+                    max_items = queue.deficit
+                    queue.deficit = 0
+                    queue.running += 1
+                    task = asyncio.create_task(
+                        self.run_turn(queue.vectorizer_id, max_items)
+                    )
+                    turns[task] = (queue, max_items)
+                if not turns:
+                    break
+                done, _ = await asyncio.wait(
+                    turns.keys(), return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    queue, max_items = turns.pop(task)
+                    self._end_turn(queue, max_items, task)
+        finally:
+            for task in turns:
+                task.cancel()
+            await asyncio.gather(*turns, return_exceptions=True)
+        return {q.vectorizer_id: q.processed for q in queues}
+
+    def _next_queue(
+        self, active: list[VectorizerQueue], position: int
+    ) -> tuple[VectorizerQueue | None, int]:
+        """
+        Finds the next queue to give a turn to, in round-robin order,
+        starting a new round when every queue used up its credit.
+
+        Returns:
+            tuple[VectorizerQueue | None, int]: The queue, or None if no
+                queue can be given a turn right now, and where to start the
+                next search.
+        """
+        runnable = [q for q in active if not q.done]
+        if not runnable:
+            return None, position
+        while True:
+            for offset in range(len(active)):
+                index = (position + offset) % len(active)
+                queue = active[index]
+                if (
+                    not queue.done
+                    and queue.deficit > 0
+                    and queue.running < self._max_running(queue)
+                ):
+                    return queue, index + 1
+            if any(q.deficit > 0 for q in runnable):
+                # The queues with credit left are waiting for a task.
+                return None, position
+            # Queues that went over their credit may need several rounds.
+            for q in runnable:
+                q.deficit += self.quantum_batches * q.batch_size
+
+    def _max_running(self, queue: VectorizerQueue) -> int:
+        """
+        The number of turns a queue can use at the same time: there is no
+        point in claiming more batches than the queue holds.
+        """
+        return max(
+            1,
+            min(self.tasks_per_vectorizer, math.ceil(queue.pending / queue.batch_size)),
+        )
+
+    def _end_turn(
+        self, queue: VectorizerQueue, max_items: int, task: asyncio.Task[int]
+    ):
+        queue.running -= 1
+        e = task.exception()
+        if e is not None:
+            queue.done = True
+            if self.fail_fast:
+                raise e
+            logger.error(
+                f"unexpected error: {str(e)}", vectorizer_id=queue.vectorizer_id
+            )
+            return
+        processed = task.result()
+        queue.processed += processed
+        queue.pending = max(queue.pending - processed, 0)
+        # A turn that goes over its credit is charged in the next round.
+        queue.deficit += max_items - processed
+        if processed == 0 or (processed < max_items and queue.pending == 0):
+            queue.done = True
@@ -0,0 +1,167 @@
+from abc import ABC, abstractmethod
+from collections.abc import Sequence
+from typing import Literal
+
+import numpy as np
+import numpy.typing as npt
+from pydantic import BaseModel
+from typing_extensions import override
+
+
+def _rows(buffer: npt.NDArray[np.generic]) -> list[memoryview]:
+    """
+    Returns a view over each row of a 2-dimensional buffer.
+    """
+    view = memoryview(buffer).cast("B")
+    width = buffer.shape[1] * buffer.itemsize
+    return [view[i * width : (i + 1) * width] for i in range(buffer.shape[0])]
+
+
+def vectors_to_binary(vectors: Sequence[npt.ArrayLike]) -> list[memoryview]:
+    """
+    Serializes vectors of the same dimensions to the binary format of
+    pgvector's vector type: the dimensions and an unused field as big-endian
+    int16, followed by the values as big-endian float32.
+
+    The vectors are converted in a single numpy operation into one buffer,
+    instead of one conversion and one allocation per vector in pgvector's
+    dumper.
+
+    Args:
+        vectors (Sequence[npt.ArrayLike]): The vectors to serialize.
+
+    Returns:
+        list[memoryview]: The binary representation of each vector, as views
+            over a single buffer.
+    """
+    if not vectors:
+        return []
+    values = np.stack(vectors)
+    count, dimensions = values.shape
+    # One float32 sized slot holds the two int16 header fields.
+    buffer = np.empty((count, 1 + dimensions), dtype=">f4")
+    header = buffer[:, :1].view(">i2")
+    header[:, 0] = dimensions
+    header[:, 1] = 0
+    np.copyto(buffer[:, 1:], values, casting="same_kind")
+    return _rows(buffer)
+
+
+def halfvecs_to_binary(vectors: Sequence[npt.ArrayLike]) -> list[memoryview]:
+    """
+    Serializes vectors of the same dimensions to the binary format of
+    pgvector's halfvec type: the dimensions and an unused field as big-endian
+    int16, followed by the values as big-endian float16.
+
+    Args:
+        vectors (Sequence[npt.ArrayLike]): The vectors to serialize.
+
+    Returns:
+        list[memoryview]: The binary representation of each vector, as views
+            over a single buffer.
+    """
+    if not vectors:
+        return []
+    values = np.stack(vectors)
+    count, dimensions = values.shape
+    buffer = np.empty((count, 2 + dimensions), dtype=">f2")
+    header = buffer[:, :2].view(">i2")
+    header[:, 0] = dimensions
+    header[:, 1] = 0
+    # Values beyond the float16 range become infinite, which halfvec rejects,
+    # as it does when casting such a vector.
+    buffer[:, 2:] = values
+    return _rows(buffer)
+
+
+def bits_to_binary(vectors: Sequence[npt.ArrayLike]) -> list[memoryview]:
+    """
+    Quantizes vectors of the same dimensions to one bit per dimension, set
+    when the value is positive, and serializes them to the binary format of
+    the bit type: the number of bits as big-endian int32, followed by the bits
+    packed most significant bit first.
+
+    Args:
+        vectors (Sequence[npt.ArrayLike]): The vectors to serialize.
+
+    Returns:
+        list[memoryview]: The binary representation of each vector, as views
+            over a single buffer.
+    """
+    if not vectors:
+        return []
+    values = np.stack(vectors)
+    count, dimensions = values.shape
+    bits = np.packbits(values > 0, axis=1)
+    buffer = np.empty((count, 4 + bits.shape[1]), dtype=np.uint8)
+    buffer[:, :4] = np.array([dimensions], dtype=">i4").view(np.uint8)
+    buffer[:, 4:] = bits
+    return _rows(buffer)
+
+
+class Storage(ABC):
+    """
+    Abstract base class for the column types embeddings are stored as.
+    """
+
+    @abstractmethod
+    def to_binary(self, vectors: Sequence[npt.ArrayLike]) -> list[memoryview]:
+        """
+        Serializes embeddings to the binary format of the embedding column of
+        the target table.
+
+        Args:
+            vectors (Sequence[npt.ArrayLike]): The embeddings to serialize.
+
+        Returns:
+            list[memoryview]: The binary representation of each embedding.
+        """
+
+
+class VectorStorage(BaseModel, Storage):
+    """
+    Stores embeddings as pgvector's vector type, with 4 bytes per dimension.
+
+    Attributes:
+        implementation (Literal["vector"]): The literal identifier for this
+            implementation.
+    """
+
+    implementation: Literal["vector"]
+
+    @override
+    def to_binary(self, vectors: Sequence[npt.ArrayLike]) -> list[memoryview]:
+        return vectors_to_binary(vectors)
+
+
+class HalfvecStorage(BaseModel, Storage):
+    """
+    Stores embeddings as pgvector's halfvec type, with 2 bytes per dimension.
+
+    Attributes:
+        implementation (Literal["halfvec"]): The literal identifier for this
+            implementation.
+    """
+
+    implementation: Literal["halfvec"]
+
+    @override
+    def to_binary(self, vectors: Sequence[npt.ArrayLike]) -> list[memoryview]:
+        return halfvecs_to_binary(vectors)
+
+
+class BitStorage(BaseModel, Storage):
+    """
+    Stores binary quantized embeddings as the bit type, with 1 bit per
+    dimension.
+
+    Attributes:
+        implementation (Literal["bit"]): The literal identifier for this
+            implementation.
+    """
+
+    implementation: Literal["bit"]
+
+    @override
+    def to_binary(self, vectors: Sequence[npt.ArrayLike]) -> list[memoryview]:
+        return bits_to_binary(vectors)
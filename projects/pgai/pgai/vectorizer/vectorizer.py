@@ -1,8 +1,11 @@
 import asyncio
+import contextlib
+import dataclasses
+import json
 import os
-import threading
 import time
-from collections.abc import Callable
+import uuid
+from collections.abc import AsyncIterator, Callable
 from functools import cached_property
 from itertools import repeat
 from typing import Any, TypeAlias
@@ -13,29 +16,54 @@ import structlog
 from ddtrace import tracer
 from pgvector.psycopg import register_vector_async  # type: ignore
 from psycopg import AsyncConnection, sql
+from psycopg.abc import Loader
+from psycopg.adapt import PyFormat, Transformer
+from psycopg.pq import Format
 from psycopg.rows import dict_row
 from psycopg.types.json import Jsonb
+from psycopg_pool import AsyncConnectionPool
 from pydantic.dataclasses import dataclass
 from pydantic.fields import Field
 
+from .batch_size import AdaptiveBatchSize
 from .chunking import (
     LangChainCharacterTextSplitter,
     LangChainRecursiveCharacterTextSplitter,
 )
+from .context_lengths import context_lengths
 from .embedders import Ollama, OpenAI, VoyageAI
+from .embedders.openai import OPENAI_MAX_REQUESTS_PER_BATCH_JOB, Batch
+from .embedding_cache import EmbeddingCache
 from .embeddings import ChunkEmbeddingError
 from .formatting import ChunkValue, PythonTemplate
+from .metrics import for_vectorizer, worker_metrics
+from .process_pool import ProcessPool, chunk_items
 from .processing import ProcessingDefault
+from .storage import BitStorage, HalfvecStorage, VectorStorage
 
 logger = structlog.get_logger()
 
 VectorizerErrorRecord: TypeAlias = tuple[int, str, Jsonb]
 EmbeddingRecord: TypeAlias = list[Any]
 SourceRow: TypeAlias = dict[str, Any]
+# The primary key values of an item followed by the chunk_seq of one of its chunks.
+ChunkKey: TypeAlias = list[Any]
 
 DEFAULT_CONCURRENCY = 1
+DEFAULT_PIPELINE_DEPTH = 1
+DEFAULT_BACKFILL_BATCH_SIZE = 5000
+# Postgres accepts at most 65535 bind parameters per statement.
+MAX_QUERY_PARAMS = 65535
 
 VECTORIZER_FAILED = "vectorizer failed with unexpected error"
+BATCH_JOB_FAILED = "batch job failed"
+
+# The statuses of Batch API jobs that may still produce results.
+BATCH_JOB_RUNNING_STATUSES = ("validating", "in_progress", "finalizing", "cancelling")
+
+# The status of the jobs recorded in ai.vectorizer_batch_job, with their items,
+# before they are submitted to the Batch API.
+BATCH_JOB_SUBMITTING = "submitting"
 
 
 class EmbeddingProviderError(Exception):
@@ -72,6 +100,8 @@ class Config:
         processing: Processing settings such as batch size and concurrency.
         chunking: The chunking strategy.
         formatting: Formatting strategy to apply to the chunks.
+        storage: The column type embeddings are stored as. Vectorizers
+            created before it could be chosen store vectors.
     """
 
     version: str
@@ -81,6 +111,9 @@ class Config:
         LangChainCharacterTextSplitter | LangChainRecursiveCharacterTextSplitter
     ) = Field(..., discriminator="implementation")
     formatting: PythonTemplate | ChunkValue = Field(..., discriminator="implementation")
+    storage: VectorStorage | HalfvecStorage | BitStorage = Field(
+        default=VectorStorage(implementation="vector"), discriminator="implementation"
+    )
 
 
 @dataclass
@@ -116,6 +149,14 @@ class Vectorizer:
     errors_schema: str = "ai"
     errors_table: str = "vectorizer_errors"
 
+    @property
+    def notify_channel(self) -> str:
+        """
+        The channel notified by the trigger on the source table when rows are
+        queued, if the vectorizer was created with `processing.notify` set.
+        """
+        return f"ai_vectorizer_{self.id}"
+
 
 class VectorizerQueryBuilder:
     """
@@ -181,8 +222,69 @@ class VectorizerQueryBuilder:
         """
         return sql.Identifier(self.vectorizer.queue_schema, self.vectorizer.queue_table)
 
+    @property
+    def lock_fields(self) -> sql.Composed:
+        """
+        The arguments of the concat_ws call that identifies an item in the
+        advisory locks taken by the Workers processing it: the name and the
+        value of each primary key field.
+        """
+        return sql.SQL(" ,").join(
+            [
+                xs
+                for x in self.vectorizer.source_pk
+                for xs in [
+                    sql.Literal(x.attname),
+                    sql.Identifier(x.attname),
+                ]
+            ]
+        )
+
     @cached_property
     def fetch_work_query(self) -> sql.Composed:
+        return self._fetch_work_query(self.queue_table_ident)
+
+    @cached_property
+    def claim_work_query(self) -> sql.Composed:
+        return self._fetch_work_query(self.queue_table_ident, claim=True)
+
+    def fetch_partition_work_query(
+        self, partition: str, claim: bool = False
+    ) -> sql.Composed:
+        """
+        Generates the SQL query to fetch work items from a partition of a
+        partitioned queue table, in the order they were queued. The oldest
+        items are found through the index on queued_at, instead of scanning
+        past the rows locked by other Workers.
+
+        Args:
+            partition (str): The name of the partition, in the schema of the
+                queue table.
+            claim (bool): Whether the items are claimed with a lease instead
+                of being deleted from the queue.
+        """
+        return self._fetch_work_query(
+            sql.Identifier(self.vectorizer.queue_schema, partition),
+            ordered=True,
+            claim=claim,
+        )
+
+    @cached_property
+    def fetch_queue_partitions_query(self) -> sql.Composed:
+        """
+        Lists the partitions of the queue table, in a stable order, so that
+        Workers map their slots to the same partitions.
+        """
+        return sql.SQL(
+            "SELECT c.relname FROM pg_catalog.pg_inherits i"
+            " JOIN pg_catalog.pg_class c ON c.oid = i.inhrelid"
+            " WHERE i.inhparent = %s"
+            " ORDER BY c.relname"
+        ).format()
+
+    def _fetch_work_query(
+        self, queue_table: sql.Identifier, ordered: bool = False, claim: bool = False
+    ) -> sql.Composed:
         """
         Generates the SQL query to fetch work items from the queue table.
 
@@ -213,12 +315,111 @@ class VectorizerQueryBuilder:
 
         The only differece, between the blog and this query, is that we handle
         composite primary keys.
+
+        A deduplicated queue holds each item at most once, so the selected
+        rows don't need to be made distinct.
+
+        On a queue with leases, rows claimed by a Worker whose lease hasn't
+        expired are left out, and so are the items with such a row. With
+        `claim`, the rows of the locked items are marked with a claim id and
+        a lease expiry instead of being deleted, the claim id and the lease
+        duration in seconds being the 3rd and 4th parameters. The rows of
+        items deleted from the source table are deleted right away.
         """
+        join_predicates = sql.SQL(" AND ").join(
+            [
+                sql.SQL("w.{} = l.{}").format(
+                    sql.Identifier(x.attname),
+                    sql.Identifier(x.attname),
+                )
+                for x in self.vectorizer.source_pk
+            ]
+        )
+        unclaimed = sql.SQL("")
+        unleased_items = sql.SQL("")
+        unleased_rows = sql.SQL("")
+        if self.vectorizer.config.processing.lease_seconds is not None:
+            unclaimed = sql.SQL(
+                "WHERE claimed_until IS NULL OR claimed_until < now()\n"
+                "                    "
+            )
+            unleased_items = sql.SQL("""
+                        WHERE NOT EXISTS (
+                            SELECT FROM {queue_table} AS a
+                            WHERE {leased_join_predicates}
+                            AND a.claimed_until >= now()
+                        )""").format(
+                queue_table=queue_table,
+                leased_join_predicates=sql.SQL(" AND ").join(
+                    [
+                        sql.SQL("a.{} = s.{}").format(
+                            sql.Identifier(x.attname),
+                            sql.Identifier(x.attname),
+                        )
+                        for x in self.vectorizer.source_pk
+                    ]
+                ),
+            )
+            unleased_rows = sql.SQL(
+                "\n                    "
+                "AND (w.claimed_until IS NULL OR w.claimed_until < now())"
+            )
+        if claim:
+            source_exists = sql.SQL(
+                "EXISTS (SELECT FROM {source_schema}.{source_table} AS s"
+                " WHERE {predicates})"
+            ).format(
+                predicates=sql.SQL(" AND ").join(
+                    [
+                        sql.SQL("s.{} = l.{}").format(
+                            sql.Identifier(x.attname),
+                            sql.Identifier(x.attname),
+                        )
+                        for x in self.vectorizer.source_pk
+                    ]
+                ),
+                source_schema=sql.Identifier(self.vectorizer.source_schema),
+                source_table=sql.Identifier(self.vectorizer.source_table),
+            )
+            dequeued_rows = sql.SQL("""
+                claimed_rows AS (
+                    UPDATE {queue_table} AS w
+                    SET claim_id = %s,
+                        claimed_until = now() + make_interval(secs => %s)
+                    FROM locked_items AS l
+                    WHERE locked = true
+                    AND {join_predicates}{unleased_rows}
+                    AND {source_exists}
+                ),
+                deleted_rows AS (
+                    DELETE FROM {queue_table} AS w
+                    USING locked_items AS l
+                    WHERE locked = true
+                    AND {join_predicates}{unleased_rows}
+                    AND NOT {source_exists}
+                )""").format(
+                queue_table=queue_table,
+                join_predicates=join_predicates,
+                unleased_rows=unleased_rows,
+                source_exists=source_exists,
+            )
+        else:
+            dequeued_rows = sql.SQL("""
+                deleted_rows AS (
+                    DELETE FROM {queue_table} AS w
+                    USING locked_items AS l
+                    WHERE locked = true
+                    AND {join_predicates}{unleased_rows}
+                )""").format(
+                queue_table=queue_table,
+                join_predicates=join_predicates,
+                unleased_rows=unleased_rows,
+            )
         return sql.SQL("""
                 WITH selected_rows AS (
                     SELECT {pk_fields}
                     FROM {queue_table}
-                    LIMIT %s
+                    {unclaimed}{order_by}LIMIT %s
                     FOR UPDATE SKIP LOCKED
                 ),
                 locked_items AS (
@@ -229,17 +430,11 @@ class VectorizerQueryBuilder:
                             hashtext(concat_ws('|', {lock_fields}))
                         ) AS locked
                     FROM (
-                        SELECT DISTINCT {pk_fields}
-                        FROM selected_rows
+                        SELECT {distinct}{pk_fields}
+                        FROM selected_rows AS s{unleased_items}
                         ORDER BY {pk_fields}
                     ) as ids
-                ),
-                deleted_rows AS (
-                    DELETE FROM {queue_table} AS w
-                    USING locked_items AS l
-                    WHERE locked = true
-                    AND {delete_join_predicates}
-                )
+                ),{dequeued_rows}
                 SELECT {source_table}.*
                 FROM locked_items
                 LEFT JOIN {source_schema}.{source_table} USING ({pk_fields})
@@ -247,28 +442,17 @@ class VectorizerQueryBuilder:
                 ORDER BY {pk_fields}
                         """).format(
             pk_fields=self.pk_fields_sql,
-            queue_table=sql.Identifier(
-                self.vectorizer.queue_schema, self.vectorizer.queue_table
-            ),
-            lock_fields=sql.SQL(" ,").join(
-                [
-                    xs
-                    for x in self.vectorizer.source_pk
-                    for xs in [
-                        sql.Literal(x.attname),
-                        sql.Identifier(x.attname),
-                    ]
-                ]
-            ),
-            delete_join_predicates=sql.SQL(" AND ").join(
-                [
-                    sql.SQL("w.{} = l.{}").format(
-                        sql.Identifier(x.attname),
-                        sql.Identifier(x.attname),
-                    )
-                    for x in self.vectorizer.source_pk
-                ]
+            distinct=sql.SQL(
+                ""
+                if self.vectorizer.config.processing.deduplicate_queue
+                else "DISTINCT "
             ),
+            queue_table=queue_table,
+            order_by=sql.SQL("ORDER BY queued_at " if ordered else ""),
+            lock_fields=self.lock_fields,
+            unclaimed=unclaimed,
+            unleased_items=unleased_items,
+            dequeued_rows=dequeued_rows,
             source_schema=sql.Identifier(self.vectorizer.source_schema),
             source_table=sql.Identifier(self.vectorizer.source_table),
         )
@@ -286,10 +470,93 @@ class VectorizerQueryBuilder:
             self._pks_placeholders_tuples(items_count),
         )
 
+    def lock_items_query(self, items_count: int) -> sql.Composed:
+        """
+        Fetches the given items from the source table, taking the same
+        advisory locks as the fetch_work_query. Items that don't exist, or
+        are being processed by another Worker, are left out.
+        """
+        return sql.SQL(
+            "SELECT * FROM {} WHERE ({}) IN ({})"
+            " AND pg_try_advisory_xact_lock(%s, hashtext(concat_ws('|', {})))"
+        ).format(
+            sql.Identifier(self.vectorizer.source_schema, self.vectorizer.source_table),
+            self.pk_fields_sql,
+            self._pks_placeholders_tuples(items_count),
+            self.lock_fields,
+        )
+
+    def requeue_items_query(self, items_count: int) -> sql.Composed:
+        on_conflict = sql.SQL("")
+        processing = self.vectorizer.config.processing
+        if processing.deduplicate_queue:
+            # Queued rows keep their queued_at, like in the source trigger.
+            on_conflict = sql.SQL(" ON CONFLICT ({}) DO {}").format(
+                self.pk_fields_sql,
+                sql.SQL(
+                    "UPDATE SET claim_id = NULL, claimed_until = NULL"
+                    if processing.lease_seconds is not None
+                    else "NOTHING"
+                ),
+            )
+        return sql.SQL("INSERT INTO {} ({}) VALUES {}{}").format(
+            self.queue_table_ident,
+            self.pk_fields_sql,
+            self._pks_placeholders_tuples(items_count),
+            on_conflict,
+        )
+
+    def complete_claim_query(self, items_count: int) -> sql.Composed:
+        """
+        Deletes the queue rows of the given items that are still claimed
+        with the claim id given as last parameter, and returns the primary
+        keys of the items they belong to.
+        """
+        return sql.SQL(
+            "DELETE FROM {} WHERE ({}) IN ({}) AND claim_id = %s RETURNING {}"
+        ).format(
+            self.queue_table_ident,
+            self.pk_fields_sql,
+            self._pks_placeholders_tuples(items_count),
+            self.pk_fields_sql,
+        )
+
+    def release_claim_query(self, items_count: int) -> sql.Composed:
+        """
+        Releases the queue rows of the given items that are still claimed
+        with the claim id given as last parameter.
+        """
+        return sql.SQL(
+            "UPDATE {} SET claim_id = NULL, claimed_until = NULL"
+            " WHERE ({}) IN ({}) AND claim_id = %s"
+        ).format(
+            self.queue_table_ident,
+            self.pk_fields_sql,
+            self._pks_placeholders_tuples(items_count),
+        )
+
+    def fetch_chunks_query(self, items_count: int) -> sql.Composed:
+        return sql.SQL("SELECT {}, chunk_seq, chunk FROM {} WHERE ({}) IN ({})").format(
+            self.pk_fields_sql,
+            self.target_table_ident,
+            self.pk_fields_sql,
+            self._pks_placeholders_tuples(items_count),
+        )
+
+    def delete_chunks_query(self, chunks_count: int) -> sql.Composed:
+        return sql.SQL("DELETE FROM {} WHERE ({}, chunk_seq) IN ({})").format(
+            self.target_table_ident,
+            self.pk_fields_sql,
+            self._pks_placeholders_tuples(chunks_count, extra_fields=1),
+        )
+
     @cached_property
     def copy_types(self) -> list[str]:
         types = [a.typname for a in self.vectorizer.source_pk]
-        types.extend(["int4", "text", "vector"])
+        # Embeddings are serialized by the storage config, and copied as is:
+        # in a binary COPY the server reads every field with the receive
+        # function of the target column, whatever type the client dumped.
+        types.extend(["int4", "text", "bytea"])
         return types
 
     @cached_property
@@ -319,7 +586,9 @@ class VectorizerQueryBuilder:
             self.errors_table_ident,
         )
 
-    def _pks_placeholders_tuples(self, items_count: int) -> sql.Composed:
+    def _pks_placeholders_tuples(
+        self, items_count: int, extra_fields: int = 0
+    ) -> sql.Composed:
         """Generates a comma separated list of tuples with placeholders for the
         primary key fields of the source table.
 
@@ -335,9 +604,13 @@ class VectorizerQueryBuilder:
 
         We cannot use ANY = %s because Postgres doesn't allow it for anonymous
         composite values.
+
+        `extra_fields` adds placeholders after the primary key fields of each
+        tuple, to match against columns such as chunk_seq.
         """
         placeholder_tuple = sql.SQL(", ").join(
-            sql.Placeholder() for _ in range(len(self.vectorizer.source_pk))
+            sql.Placeholder()
+            for _ in range(len(self.vectorizer.source_pk) + extra_fields)
         )
 
         tuples = sql.SQL(",").join(
@@ -346,79 +619,39 @@ class VectorizerQueryBuilder:
         return tuples
 
 
-class ProcessingStats:
+@dataclasses.dataclass
+class PipelineBatch:
     """
-    Tracks processing statistics for chunk processing tasks.
+    A batch of work moving through the stages of a pipelined Worker.
 
-    Records the total processing time, number of chunks processed,
-    and wall time. It also logs statistics such as chunks processed per second.
+    The batch owns a database connection for its whole lifetime. The
+    transaction opened on that connection by the fetch stage holds the queue
+    row locks and advisory locks of the batch, and is only committed by the
+    write stage once the embeddings have been written.
 
     Attributes:
-        total_processing_time (float): The total time spent processing chunks.
-        total_chunks (int): The total number of chunks processed.
-        wall_time (float): The total wall time from when processing started.
-        wall_start (float): The time when processing started, used for
-            calculating the elapsed time.
+        conn (AsyncConnection): The connection holding the batch's transaction.
+        items (list[SourceRow]): The source rows claimed from the queue.
+        records (list[EmbeddingRecord]): The chunk records, without embeddings
+            until the embed stage has run.
+        documents (list[str]): The formatted chunks to be embedded.
+        start_time (float): The time at which the batch was claimed.
+        full (bool): Whether the batch claimed as many items as it asked for.
+        errors (list[VectorizerErrorRecord]): Non-fatal errors returned by the
+            embed stage.
+        stale_chunks (list[ChunkKey] | None): With incremental writes, the
+            chunks to delete from the target table. None when all the
+            embeddings of the items are replaced.
     """
 
-    total_processing_time: float
-    total_chunks: int
-    wall_time: float
-    wall_start: float
-
-    def __new__(cls):
-        if not hasattr(cls, "_instance"):
-            cls._instance = super().__new__(cls)
-
-            logger.debug(
-                "ProcessingStats initialized",
-                thread_id=threading.get_native_id(),
-                active_count=threading.active_count(),
-                task=id(asyncio.current_task()),
-            )
-            cls._instance.total_processing_time = 0.0
-            cls._instance.total_chunks = 0
-            cls._instance.wall_start = time.perf_counter()
-        return cls._instance
-
-    def add_request_time(self, duration: float, chunk_count: int):
-        """
-        Adds the time and chunk count of a processing request to the accumulated totals.
-
-        Args:
-            duration (float): The time taken for the request.
-            chunk_count (int): The number of chunks processed in the request.
-        """
-        self.total_processing_time += duration
-        self.total_chunks += chunk_count
-
-    async def print_stats(self):
-        """
-        Logs the processing statistics, including total time, chunks processed,
-        and chunks processed per second.
-
-        This method calculates two main rates:
-        - Chunks processed per second overall.
-        - Chunks processed per second per thread.
-
-        The statistics are logged only to the DEBUG log level.
-        """
-        chunks_per_second_per_thread = (
-            self.total_chunks / self.total_processing_time
-            if self.total_processing_time > 0
-            else 0
-        )
-        wall_time = time.perf_counter() - self.wall_start
-        chunks_per_second = self.total_chunks / wall_time if wall_time > 0 else 0
-        await logger.adebug(
-            "Processing stats",
-            wall_time=wall_time,
-            total_processing_time=self.total_processing_time,
-            total_chunks=self.total_chunks,
-            chunks_per_second=chunks_per_second,
-            chunks_per_second_per_thread=chunks_per_second_per_thread,
-            task=id(asyncio.current_task()),
-        )
+    conn: AsyncConnection
+    items: list[SourceRow]
+    records: list[EmbeddingRecord]
+    documents: list[str]
+    start_time: float
+    full: bool = False
+    errors: list[VectorizerErrorRecord] = dataclasses.field(default_factory=list)
+    stale_chunks: list[ChunkKey] | None = None
 
 
 class Worker:
@@ -429,52 +662,175 @@ class Worker:
     the vectorizer, and writes the resulting embeddings or errors back to the
     database.
 
+    When `pipeline_depth` is greater than 1, the Worker runs in pipelined
+    mode: fetching and chunking, embedding, and writing are performed by
+    separate stages connected by bounded queues, so that the next batch is
+    claimed while the current one is being embedded or written.
+
+    When the vectorizer's queue has leases (`processing.lease_seconds`), the
+    Worker claims a batch in a short transaction, embeds it outside of any
+    transaction, and writes the embeddings and deletes the claimed queue rows
+    in a second short transaction. Batches are then processed one at a time,
+    whatever the `pipeline_depth`.
+
     Attributes:
         db_url (str): The URL of the database to connect to.
         vectorizer (Vectorizer): The vectorizer configuration used for processing.
         queries (VectorizerQueryBuilder): A query builder instance used for
             generating SQL queries.
+        pipeline_depth (int): The maximum number of batches in flight at the
+            same time. Each in-flight batch uses its own database connection.
+        embedding_cache (EmbeddingCache | None): When set, chunks already
+            embedded with the same embedding configuration are not sent to
+            the embedding provider again.
+        incremental_writes (bool): When set, the chunks of an item are
+            compared with the ones in the target table, and only the chunks
+            that differ are embedded, deleted and inserted. Otherwise all
+            the embeddings of an item are replaced.
+        pool (AsyncConnectionPool | None): A pool to borrow connections from,
+            shared with other Workers. When unset, the Worker opens its own
+            connections to `db_url`.
+        process_pool (ProcessPool | None): When set, items are chunked and
+            formatted, and documents tokenized, in the processes of the pool
+            instead of on the event loop.
+        share_context_lengths (bool): When set, the context lengths of
+            embedding models are loaded from, and the ones found by the
+            embedder saved to, the ai.vectorizer_context_length table.
+        batch_size (AdaptiveBatchSize | None): When set, the number of items
+            claimed per batch is adapted to the measured cost of the batches,
+            instead of the vectorizer's configured batch size.
+        slot (int): The worker slot of the Worker among the ones running the
+            vectorizer concurrently. With a partitioned queue table, the
+            Worker claims items from the partition of its slot first.
     """
 
     _queue_table_oid = None
+    _queue_partitions: list[str] | None = None
     _continue_processing: Callable[[int, int], bool]
+    _set_up = False
 
     def __init__(
         self,
         db_url: str,
         vectorizer: Vectorizer,
         continue_processing: None | Callable[[int, int], bool] = None,
+        pipeline_depth: int = DEFAULT_PIPELINE_DEPTH,
+        embedding_cache: EmbeddingCache | None = None,
+        incremental_writes: bool = False,
+        pool: AsyncConnectionPool | None = None,
+        process_pool: ProcessPool | None = None,
+        share_context_lengths: bool = False,
+        batch_size: AdaptiveBatchSize | None = None,
+        slot: int = 0,
     ):
         self.db_url = db_url
         self.vectorizer = vectorizer
         self.queries = VectorizerQueryBuilder(vectorizer)
         self._continue_processing = continue_processing or (lambda _loops, _res: True)
+        self.pipeline_depth = pipeline_depth
+        self.embedding_cache = embedding_cache
+        self.incremental_writes = incremental_writes
+        self.pool = pool
+        self.process_pool = process_pool
+        self.share_context_lengths = share_context_lengths
+        self.batch_size = batch_size
+        self.slot = slot
+        self.vectorizer.config.embedding.set_max_in_flight(
+            self.vectorizer.config.processing.max_in_flight
+        )
+        self.vectorizer.config.embedding.set_process_pool(process_pool)
+        self._setup_lock = asyncio.Lock()
 
-    async def run(self) -> int:
+    async def run(
+        self,
+        continue_processing: Callable[[int, int], bool] | None = None,
+        slot: int | None = None,
+    ) -> int:
         """
         Embedding loop. Continuously fetches tasks from the work queue and
         processes them within the context of a transaction.
 
+        The same Worker can run several times, one after the other or
+        concurrently, such as once per scheduler turn. The embedder is only
+        set up, and the queue table looked up, by the first run.
+
+        Args:
+            continue_processing (Callable[[int, int], bool] | None): When set,
+                replaces the Worker's `continue_processing` for this run.
+            slot (int | None): When set, replaces the Worker's slot for this
+                run.
+
         Returns:
             int: The number of tasks processed from the work queue.
         """
+        continue_processing = continue_processing or self._continue_processing
+        slot = self.slot if slot is None else slot
+        leased = self.vectorizer.config.processing.lease_seconds is not None
+        if self.pipeline_depth > 1 and not leased:
+            return await self._run_pipelined(continue_processing, slot)
+
+        do_batch = self._do_leased_batch if leased else self._do_batch
         res = 0
         loops = 0
 
-        async with await psycopg.AsyncConnection.connect(self.db_url) as conn:
-            await register_vector_async(conn)
-            await self.vectorizer.config.embedding.setup()
-            while True:
-                if not self._continue_processing(loops, res):
-                    return res
-                items_processed = await self._do_batch(conn)
+        async with self._connection() as conn:
+            await self._setup(conn)
+            while continue_processing(loops, res):
+                items_processed = await do_batch(conn, slot)
                 if items_processed == 0:
-                    return res
+                    break
                 res += items_processed
                 loops += 1
+            await self._save_context_lengths(conn)
+            return res
+
+    async def _setup(self, conn: AsyncConnection):
+        """
+        Loads the shared context lengths and sets the embedder up, once per
+        Worker.
+        """
+        async with self._setup_lock:
+            if self._set_up:
+                return
+            await self._load_context_lengths(conn)
+            await self.vectorizer.config.embedding.setup()
+            self._set_up = True
+
+    async def _load_context_lengths(self, conn: AsyncConnection):
+        """
+        Adds the context lengths stored in the database to the registry, if
+        the Worker shares them.
+        """
+        if self.share_context_lengths:
+            async with conn.transaction():
+                await context_lengths.load(conn)
+
+    async def _save_context_lengths(self, conn: AsyncConnection):
+        """
+        Stores the context lengths found by the embedders in the database, if
+        the Worker shares them.
+        """
+        if self.share_context_lengths:
+            async with conn.transaction():
+                await context_lengths.save(conn)
+
+    @contextlib.asynccontextmanager
+    async def _connection(self) -> AsyncIterator[AsyncConnection]:
+        """
+        Borrows a connection from the pool, or opens a new one if the Worker
+        has no pool, with the vector types registered.
+        """
+        if self.pool is None:
+            async with await psycopg.AsyncConnection.connect(self.db_url) as conn:
+                await register_vector_async(conn)
+                yield conn
+        else:
+            async with self.pool.connection() as conn:
+                await register_vector_async(conn)
+                yield conn
 
     @tracer.wrap()
-    async def _do_batch(self, conn: AsyncConnection) -> int:
+    async def _do_batch(self, conn: AsyncConnection, slot: int) -> int:
         """
         Processes a batch of tasks. Fetches items from the queue, filters out
         deleted items, generates embeddings, and writes them to the database.
@@ -485,11 +841,12 @@ class Worker:
         Returns:
             int: The number of items processed in the batch.
         """
-        processing_stats = ProcessingStats()
         try:
             start_time = time.perf_counter()
             async with conn.transaction():
-                items = await self._fetch_work(conn)
+                batch_size = self._batch_size()
+                items = await self._fetch_work(conn, batch_size, slot)
+                full = len(items) == batch_size
 
                 current_span = tracer.current_span()
                 if current_span:
@@ -510,13 +867,180 @@ class Worker:
 
                 num_chunks = await self._embed_and_write(conn, items)
 
-                processing_stats.add_request_time(
-                    time.perf_counter() - start_time, num_chunks
+            duration = time.perf_counter() - start_time
+            if self.batch_size is not None:
+                self.batch_size.observe_batch(full, num_chunks, duration)
+            worker_metrics.transaction_duration.observe(duration, self.vectorizer.id)
+
+            return len(items)
+        except Exception as e:
+            await self._handle_batch_error(conn, e)
+            raise e
+
+    @tracer.wrap()
+    async def _do_leased_batch(self, conn: AsyncConnection, slot: int) -> int:
+        """
+        Processes a batch of tasks from a queue with leases. Claims items
+        from the queue, generates their embeddings without holding a
+        transaction open, and writes them to the database.
+
+        The embeddings of the items whose claim was lost in the meantime,
+        because the lease expired and the item was claimed again, or the
+        item was queued again on a deduplicated queue, are not written.
+
+        Args:
+            conn (AsyncConnection): The asynchronous database connection.
+
+        Returns:
+            int: The number of items processed in the batch.
+        """
+        claim_id = uuid.uuid4()
+        start_time = time.perf_counter()
+        batch_size = self._batch_size()
+        items: list[SourceRow] = []
+        try:
+            async with conn.transaction():
+                items = await self._fetch_work(conn, batch_size, slot, claim_id)
+            worker_metrics.transaction_duration.observe(
+                time.perf_counter() - start_time, self.vectorizer.id
+            )
+            full = len(items) == batch_size
+            await logger.adebug(f"Items claimed from queue: {len(items)}")
+
+            # Items deleted from the source table were removed from the queue
+            # instead of being claimed.
+            items = [
+                i for i in items if i[self.vectorizer.source_pk[0].attname] is not None
+            ]
+            if len(items) == 0:
+                return 0
+
+            stale_chunks: list[ChunkKey] | None = None
+            async with self._autocommit(conn):
+                if self.incremental_writes:
+                    records, documents = await self._chunk_items(items)
+                    records, documents, stale_chunks = await self._diff_chunks(
+                        conn, items, records
+                    )
+                    records, errors = await self._embed_documents(
+                        conn, records, documents
+                    )
+                else:
+                    records, errors = await self._generate_embeddings(conn, items)
+
+            write_start = time.perf_counter()
+            async with conn.transaction():
+                owned = await self._complete_claim(conn, items, claim_id)
+                if len(owned) < len(items):
+                    await logger.ainfo(
+                        "Claims lost while embedding",
+                        items=len(items) - len(owned),
+                    )
+                    pk_count = len(self.queries.pk_attnames)
+                    items = [i for i in items if self._item_key(i) in owned]
+                    records = [r for r in records if tuple(r[:pk_count]) in owned]
+                    if stale_chunks is not None:
+                        stale_chunks = [
+                            c for c in stale_chunks if tuple(c[:pk_count]) in owned
+                        ]
+                if stale_chunks is None:
+                    await self._delete_embeddings(conn, items)
+                else:
+                    await self._delete_chunks(conn, stale_chunks)
+                await self._copy_embeddings(conn, records)
+                if errors:
+                    await self._insert_vectorizer_errors(conn, errors)
+        except Exception as e:
+            # The items can be claimed again right away, instead of once the
+            # lease expires. Nothing was claimed if the claim itself failed.
+            if items:
+                async with conn.transaction():
+                    await self._release_claim(conn, items, claim_id)
+            await self._handle_batch_error(conn, e)
+            raise e
+
+        worker_metrics.transaction_duration.observe(
+            time.perf_counter() - write_start, self.vectorizer.id
+        )
+        duration = time.perf_counter() - start_time
+        if self.batch_size is not None:
+            self.batch_size.observe_batch(full, len(records), duration)
+        return len(items)
+
+    @contextlib.asynccontextmanager
+    async def _autocommit(self, conn: AsyncConnection) -> AsyncIterator[None]:
+        """
+        Runs every statement on the connection in its own transaction, so that
+        no snapshot or lock is held while waiting for the embedding provider.
+        """
+        autocommit = conn.autocommit
+        await conn.set_autocommit(True)
+        try:
+            yield
+        finally:
+            await conn.set_autocommit(autocommit)
+
+    def _item_key(self, item: SourceRow) -> tuple[Any, ...]:
+        """
+        The primary key values of an item.
+        """
+        return tuple(item[pk] for pk in self.queries.pk_attnames)
+
+    async def _complete_claim(
+        self, conn: AsyncConnection, items: list[SourceRow], claim_id: uuid.UUID
+    ) -> set[tuple[Any, ...]]:
+        """
+        Deletes the queue rows of the given items claimed with `claim_id`.
+
+        Returns:
+            set[tuple[Any, ...]]: The primary keys of the items that were
+                still claimed with `claim_id`.
+        """
+        per_query = (MAX_QUERY_PARAMS - 1) // len(self.queries.pk_attnames)
+        owned: set[tuple[Any, ...]] = set()
+        async with conn.cursor() as cursor:
+            for start in range(0, len(items), per_query):
+                batch = items[start : start + per_query]
+                await cursor.execute(
+                    self.queries.complete_claim_query(len(batch)),
+                    [value for item in batch for value in self._item_key(item)]
+                    + [claim_id],
+                )
+                owned.update(tuple(row) for row in await cursor.fetchall())
+        return owned
+
+    async def _release_claim(
+        self, conn: AsyncConnection, items: list[SourceRow], claim_id: uuid.UUID
+    ):
+        """
+        Releases the queue rows of the given items claimed with `claim_id`.
+        """
+        per_query = (MAX_QUERY_PARAMS - 1) // len(self.queries.pk_attnames)
+        async with conn.cursor() as cursor:
+            for start in range(0, len(items), per_query):
+                batch = items[start : start + per_query]
+                await cursor.execute(
+                    self.queries.release_claim_query(len(batch)),
+                    [value for item in batch for value in self._item_key(item)]
+                    + [claim_id],
                 )
-                await processing_stats.print_stats()
 
-                return len(items)
-        except EmbeddingProviderError as e:
+    async def _handle_batch_error(self, conn: AsyncConnection, e: Exception):
+        """
+        Records the error that made a batch fail in the errors table, in its
+        own transaction.
+
+        EmbeddingProviderErrors are re-raised as the exception that caused
+        them.
+
+        Args:
+            conn (AsyncConnection): The database connection.
+            e (Exception): The error that made the batch fail.
+        """
+        worker_metrics.errors.inc(vectorizer_id=self.vectorizer.id)
+        if self.batch_size is not None:
+            self.batch_size.observe_error(e)
+        if isinstance(e, EmbeddingProviderError):
             async with conn.transaction():
                 await self._insert_vectorizer_error(
                     conn,
@@ -537,41 +1061,735 @@ class Worker:
             if e.__cause__ is not None:
                 raise e.__cause__  # noqa
             raise e
-        except Exception as e:
+        async with conn.transaction():
+            await self._insert_vectorizer_error(
+                conn,
+                (
+                    self.vectorizer.id,
+                    VECTORIZER_FAILED,
+                    Jsonb({"error_reason": str(e)}),
+                ),
+            )
+
+    async def _run_pipelined(
+        self, continue_processing: Callable[[int, int], bool], slot: int
+    ) -> int:
+        """
+        Pipelined embedding loop.
+
+        Runs three stages concurrently, connected by bounded queues:
+
+        - fetch: claims a batch from the work queue and chunks/formats it.
+        - embed: sends the chunks of a batch to the embedding provider.
+        - write: writes the embeddings of a batch and commits its transaction.
+
+        Every batch in flight holds its own connection and transaction, so the
+        number of connections (`pipeline_depth`) bounds how far the fetch stage
+        can get ahead of the write stage.
+
+        Args:
+            continue_processing (Callable[[int, int], bool]): Whether to claim
+                another batch, given the number of batches claimed and of
+                items written so far.
+            slot (int): The worker slot of this run.
+
+        Returns:
+            int: The number of tasks processed from the work queue.
+        """
+        conns: list[AsyncConnection] = []
+        free_conns: asyncio.Queue[AsyncConnection] = asyncio.Queue()
+        to_embed: asyncio.Queue[PipelineBatch | None] = asyncio.Queue(
+            maxsize=self.pipeline_depth
+        )
+        to_write: asyncio.Queue[PipelineBatch | None] = asyncio.Queue(
+            maxsize=self.pipeline_depth
+        )
+        processed = [0]
+        async with contextlib.AsyncExitStack() as stack:
+            for _ in range(self.pipeline_depth):
+                conn = await stack.enter_async_context(self._connection())
+                conns.append(conn)
+                free_conns.put_nowait(conn)
+            await self._setup(conns[0])
+
+            stages = [
+                asyncio.create_task(
+                    self._pipeline_fetch(
+                        free_conns, to_embed, processed, continue_processing, slot
+                    )
+                ),
+                asyncio.create_task(self._pipeline_embed(to_embed, to_write)),
+                asyncio.create_task(
+                    self._pipeline_write(to_write, free_conns, processed)
+                ),
+            ]
+            try:
+                done, pending = await asyncio.wait(
+                    stages, return_when=asyncio.FIRST_EXCEPTION
+                )
+            except asyncio.CancelledError:
+                for task in stages:
+                    task.cancel()
+                await asyncio.gather(*stages, return_exceptions=True)
+                await self._rollback_in_flight(conns)
+                raise
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for task in done:
+                e = task.exception()
+                if isinstance(e, Exception):
+                    await self._rollback_in_flight(conns)
+                    usable = [conn for conn in conns if not conn.broken]
+                    if usable:
+                        await self._handle_batch_error(usable[0], e)
+                    raise e
+            await self._save_context_lengths(conns[0])
+            return processed[0]
+
+    async def _rollback_in_flight(self, conns: list[AsyncConnection]):
+        """
+        Rolls back the transactions of the batches still in flight, their
+        queue items will be picked up again by the next run.
+
+        The connection a batch failed on may be unusable, a failed rollback
+        doesn't hide the error that made the batch fail.
+        """
+        for conn in conns:
+            with contextlib.suppress(psycopg.Error):
+                await conn.rollback()
+
+    async def _pipeline_fetch(
+        self,
+        free_conns: asyncio.Queue[AsyncConnection],
+        to_embed: asyncio.Queue[PipelineBatch | None],
+        processed: list[int],
+        continue_processing: Callable[[int, int], bool],
+        slot: int,
+    ):
+        """
+        Fetch stage of the pipelined Worker. Claims batches from the work queue
+        and chunks them, until the queue is empty or `continue_processing`
+        says otherwise.
+
+        Args:
+            free_conns (asyncio.Queue[AsyncConnection]): Connections not used
+                by any batch in flight.
+            to_embed (asyncio.Queue[PipelineBatch | None]): The embed stage's
+                input queue. `None` signals the end of the work.
+            processed (list[int]): Single element list holding the number of
+                items written so far.
+            continue_processing (Callable[[int, int], bool]): Whether to claim
+                another batch.
+            slot (int): The worker slot of this run.
+        """
+        loops = 0
+        while continue_processing(loops, processed[0]):
+            conn = await free_conns.get()
+            start_time = time.perf_counter()
+            # The transaction is started implicitly and is committed by the
+            # write stage.
+            batch_size = self._batch_size()
+            items = await self._fetch_work(conn, batch_size, slot)
+            full = len(items) == batch_size
+            await logger.adebug(f"Items pulled from queue: {len(items)}")
+            items = [
+                i for i in items if i[self.vectorizer.source_pk[0].attname] is not None
+            ]
+            if len(items) == 0:
+                await conn.commit()
+                free_conns.put_nowait(conn)
+                break
+            records, documents = await self._chunk_items(items)
+            stale_chunks = None
+            if self.incremental_writes:
+                records, documents, stale_chunks = await self._diff_chunks(
+                    conn, items, records
+                )
+            await to_embed.put(
+                PipelineBatch(
+                    conn,
+                    items,
+                    records,
+                    documents,
+                    start_time,
+                    full=full,
+                    stale_chunks=stale_chunks,
+                )
+            )
+            loops += 1
+        await to_embed.put(None)
+
+    async def _pipeline_embed(
+        self,
+        to_embed: asyncio.Queue[PipelineBatch | None],
+        to_write: asyncio.Queue[PipelineBatch | None],
+    ):
+        """
+        Embed stage of the pipelined Worker.
+
+        Args:
+            to_embed (asyncio.Queue[PipelineBatch | None]): Batches to embed.
+            to_write (asyncio.Queue[PipelineBatch | None]): The write stage's
+                input queue.
+        """
+        while (batch := await to_embed.get()) is not None:
+            batch.records, batch.errors = await self._embed_documents(
+                batch.conn, batch.records, batch.documents
+            )
+            await to_write.put(batch)
+        await to_write.put(None)
+
+    async def _pipeline_write(
+        self,
+        to_write: asyncio.Queue[PipelineBatch | None],
+        free_conns: asyncio.Queue[AsyncConnection],
+        processed: list[int],
+    ):
+        """
+        Write stage of the pipelined Worker. Replaces the embeddings of the
+        items of a batch and commits the batch's transaction.
+
+        Args:
+            to_write (asyncio.Queue[PipelineBatch | None]): Batches to write.
+            free_conns (asyncio.Queue[AsyncConnection]): Where the connection
+                of a batch is returned once it has been committed.
+            processed (list[int]): Single element list holding the number of
+                items written so far.
+        """
+        while (batch := await to_write.get()) is not None:
+            if batch.stale_chunks is None:
+                await self._delete_embeddings(batch.conn, batch.items)
+            else:
+                await self._delete_chunks(batch.conn, batch.stale_chunks)
+            await self._copy_embeddings(batch.conn, batch.records)
+            if batch.errors:
+                await self._insert_vectorizer_errors(batch.conn, batch.errors)
+            await batch.conn.commit()
+            free_conns.put_nowait(batch.conn)
+
+            processed[0] += len(batch.items)
+            duration = time.perf_counter() - batch.start_time
+            if self.batch_size is not None:
+                self.batch_size.observe_batch(batch.full, len(batch.records), duration)
+            worker_metrics.transaction_duration.observe(duration, self.vectorizer.id)
+
+    async def backfill(self, batch_size: int, submit: bool = True) -> int:
+        """
+        Backfill loop, through the OpenAI Batch API, for vectorizers with a
+        large number of queued items, such as after ai.create_vectorizer with
+        enqueue_existing.
+
+        First ingests the results of the vectorizer's Batch API jobs that
+        finished. Then, if `submit` is set, claims batches from the work queue
+        and submits their chunks as new jobs, until the queue is empty or
+        `continue_processing` says otherwise. Jobs are tracked in the
+        ai.vectorizer_batch_job table until their results are ingested.
+
+        Args:
+            batch_size (int): The number of items claimed per batch.
+            submit (bool): Whether to submit new jobs.
+
+        Returns:
+            int: The number of items submitted.
+        """
+        embedding = self.vectorizer.config.embedding
+        if not isinstance(embedding, OpenAI):
+            raise ValueError(
+                f"the {embedding.implementation} embedder doesn't support batch jobs"
+            )
+        submitted = 0
+        loops = 0
+        async with self._connection() as conn:
+            try:
+                await self._ingest_batch_jobs(conn, embedding)
+                while submit and self._continue_processing(loops, submitted):
+                    claimed = await self._submit_batch_jobs(conn, embedding, batch_size)
+                    if claimed == 0:
+                        break
+                    submitted += claimed
+                    loops += 1
+            except Exception as e:
+                await self._handle_batch_error(conn, e)
+                raise e
+        return submitted
+
+    async def _submit_batch_jobs(
+        self, conn: AsyncConnection, embedding: OpenAI, batch_size: int
+    ) -> int:
+        """
+        Claims a batch from the work queue and submits its chunks as Batch API
+        jobs of at most OPENAI_MAX_REQUESTS_PER_BATCH_JOB chunks.
+
+        The embeddings of the items are replaced when the results are
+        ingested, except for items without chunks, whose embeddings are
+        deleted right away.
+
+        The jobs are recorded with their items in the transaction that claims
+        them, and submitted after it commits, so that no transaction is held
+        open while the requests are uploaded. Items of jobs whose submission
+        doesn't complete are queued again by `_ingest_batch_jobs`.
+
+        Args:
+            conn (AsyncConnection): The database connection.
+            embedding (OpenAI): The embedder of the vectorizer.
+            batch_size (int): The number of items to claim.
+
+        Returns:
+            int: The number of items claimed from the queue.
+        """
+        async with conn.transaction():
+            claimed = await self._fetch_work(conn, batch_size, self.slot)
+            items = [
+                i
+                for i in claimed
+                if i[self.vectorizer.source_pk[0].attname] is not None
+            ]
+            records, _ = await self._chunk_items(items)
+            pk_count = len(self.queries.pk_attnames)
+            chunked = {tuple(record[:pk_count]) for record in records}
+            without_chunks = [
+                item
+                for item in items
+                if tuple(item[pk] for pk in self.queries.pk_attnames) not in chunked
+            ]
+            if without_chunks:
+                await self._delete_embeddings(conn, without_chunks)
+
+            tx = Transformer.from_context(conn)
+            jobs: list[tuple[str, list[tuple[str, str]]]] = []
+            for start in range(0, len(records), OPENAI_MAX_REQUESTS_PER_BATCH_JOB):
+                group = records[start : start + OPENAI_MAX_REQUESTS_PER_BATCH_JOB]
+                job_id = f"{BATCH_JOB_SUBMITTING}-{uuid.uuid4()}"
+                requests = [
+                    (self._batch_job_custom_id(tx, record), record[-1])
+                    for record in group
+                ]
+                item_keys = list(
+                    dict.fromkeys(self._batch_job_item_key(tx, r) for r in group)
+                )
+                async with conn.cursor() as cursor:
+                    await cursor.execute(
+                        "insert into ai.vectorizer_batch_job"
+                        " (id, vectorizer_id, status, request_count, items)"
+                        " values (%s, %s, %s, %s, %s)",
+                        (
+                            job_id,
+                            self.vectorizer.id,
+                            BATCH_JOB_SUBMITTING,
+                            len(requests),
+                            item_keys,
+                        ),
+                    )
+                jobs.append((job_id, requests))
+
+        submitted = 0
+        for job_id, requests in jobs:
+            if await self._submit_batch_job(conn, embedding, job_id, requests):
+                submitted += 1
+        await logger.ainfo(
+            f"Batch jobs submitted: {submitted}",
+            items=len(items),
+            chunks=len(records),
+        )
+        return len(claimed)
+
+    async def _submit_batch_job(
+        self,
+        conn: AsyncConnection,
+        embedding: OpenAI,
+        job_id: str,
+        requests: list[tuple[str, str]],
+    ) -> bool:
+        """
+        Submits a job recorded by `_submit_batch_jobs` to the Batch API, and
+        replaces its placeholder id with the id of the Batch API job.
+
+        The job's row is locked while it is submitted, which tells other
+        Workers not to queue its items again. The lock is released if the
+        Worker dies, and a job created by a failed transaction is cancelled.
+
+        Returns:
+            bool: Whether the job was submitted, False if another Worker
+                queued its items again in the meantime.
+        """
+        batch: Batch | None = None
+        try:
             async with conn.transaction():
+                async with conn.cursor() as cursor:
+                    await cursor.execute(
+                        "select 1 from ai.vectorizer_batch_job"
+                        " where id = %s for update skip locked",
+                        (job_id,),
+                    )
+                    if await cursor.fetchone() is None:
+                        return False
+                batch = await embedding.create_batch_job(requests)
+                async with conn.cursor() as cursor:
+                    await cursor.execute(
+                        "update ai.vectorizer_batch_job"
+                        " set id = %s, input_file_id = %s, status = %s"
+                        ", items = null, updated_at = now()"
+                        " where id = %s",
+                        (batch.id, batch.input_file_id, batch.status, job_id),
+                    )
+        except BaseException:
+            # The items are queued again, don't embed them twice.
+            if batch is not None:
+                with contextlib.suppress(Exception):
+                    await embedding.cancel_batch_job(batch.id)
+            raise
+        return True
+
+    async def _ingest_batch_jobs(self, conn: AsyncConnection, embedding: OpenAI):
+        """
+        Checks the status of the vectorizer's Batch API jobs, and ingests the
+        results of the ones that finished.
+
+        Args:
+            conn (AsyncConnection): The database connection.
+            embedding (OpenAI): The embedder of the vectorizer.
+        """
+        await self._requeue_unsubmitted_batch_jobs(conn)
+        async with conn.transaction(), conn.cursor() as cursor:
+            await cursor.execute(
+                "select id from ai.vectorizer_batch_job"
+                " where vectorizer_id = %s and status != %s order by created_at",
+                (self.vectorizer.id, BATCH_JOB_SUBMITTING),
+            )
+            batch_ids: list[str] = [row[0] for row in await cursor.fetchall()]
+        for batch_id in batch_ids:
+            batch = await embedding.retrieve_batch_job(batch_id)
+            if batch.status in BATCH_JOB_RUNNING_STATUSES:
+                async with conn.transaction(), conn.cursor() as cursor:
+                    await cursor.execute(
+                        "update ai.vectorizer_batch_job"
+                        " set status = %s, updated_at = now() where id = %s",
+                        (batch.status, batch.id),
+                    )
+                continue
+            await self._ingest_batch_job(conn, embedding, batch)
+
+    async def _requeue_unsubmitted_batch_jobs(self, conn: AsyncConnection):
+        """
+        Queues the items of the vectorizer's jobs whose submission didn't
+        complete again, and deletes the jobs. Jobs being submitted by another
+        Worker are locked, and left alone.
+        """
+        async with conn.transaction():
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    "select id, items from ai.vectorizer_batch_job"
+                    " where vectorizer_id = %s and status = %s"
+                    " for update skip locked",
+                    (self.vectorizer.id, BATCH_JOB_SUBMITTING),
+                )
+                jobs: list[tuple[str, list[str]]] = [
+                    (row[0], row[1]) for row in await cursor.fetchall()
+                ]
+            if not jobs:
+                return
+            loaders = self._pk_loaders(conn)
+            keys = {key for _, item_keys in jobs for key in item_keys}
+            items: list[SourceRow] = [
+                dict(
+                    zip(
+                        self.queries.pk_attnames,
+                        self._load_pk(loaders, json.loads(key)),
+                        strict=True,
+                    )
+                )
+                for key in keys
+            ]
+            await self._requeue_items(conn, items)
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    "delete from ai.vectorizer_batch_job where id = any(%s)",
+                    ([job_id for job_id, _ in jobs],),
+                )
+        await logger.ainfo(
+            f"Batch jobs not submitted: {len(jobs)}", requeued=len(items)
+        )
+
+    async def _ingest_batch_job(
+        self, conn: AsyncConnection, embedding: OpenAI, batch: Batch
+    ):
+        """
+        Writes the embeddings of a finished Batch API job through the same
+        COPY as the other batches, and deletes the job.
+
+        The items are chunked again first: the embeddings of items that
+        changed since the job was submitted, or whose requests were not
+        processed because the job failed, expired or was cancelled, are not
+        written, and the items are queued again instead. Items that were
+        deleted, or are being processed by another Worker, are left alone.
+
+        Args:
+            conn (AsyncConnection): The database connection.
+            embedding (OpenAI): The embedder of the vectorizer.
+            batch (Batch): The job, in a final status.
+        """
+        inputs = await embedding.batch_job_inputs(batch)
+        results = await embedding.batch_job_results(batch)
+        pk_count = len(self.queries.pk_attnames)
+        loaders = self._pk_loaders(conn)
+        # The chunks submitted for each item, with their custom ids.
+        submitted: dict[tuple[Any, ...], list[tuple[str, EmbeddingRecord]]] = {}
+        for custom_id, document in inputs.items():
+            chunk_key = self._parse_batch_job_custom_id(loaders, custom_id)
+            submitted.setdefault(tuple(chunk_key[:pk_count]), []).append(
+                (custom_id, chunk_key + [document])
+            )
+
+        async with conn.transaction():
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    "select 1 from ai.vectorizer_batch_job"
+                    " where id = %s for update skip locked",
+                    (batch.id,),
+                )
+                if await cursor.fetchone() is None:
+                    # Another Worker is ingesting the job.
+                    return
+            items = await self._lock_items(conn, list(submitted.keys()))
+            current_records, _ = await self._chunk_items(items)
+            current: dict[tuple[Any, ...], list[EmbeddingRecord]] = {}
+            for record in current_records:
+                current.setdefault(tuple(record[:pk_count]), []).append(record)
+
+            written: list[SourceRow] = []
+            requeued: list[SourceRow] = []
+            records: list[EmbeddingRecord] = []
+            errors: list[VectorizerErrorRecord] = []
+            for item in items:
+                key = tuple(item[pk] for pk in self.queries.pk_attnames)
+                chunks = sorted(submitted[key], key=lambda chunk: chunk[1][-2])
+                if current.get(key, []) != [record for _, record in chunks] or any(
+                    custom_id not in results for custom_id, _ in chunks
+                ):
+                    requeued.append(item)
+                    continue
+                written.append(item)
+                for custom_id, record in chunks:
+                    result = results[custom_id]
+                    if isinstance(result, ChunkEmbeddingError):
+                        errors.append(self._vectorizer_error_record(record, result))
+                    else:
+                        records.append(record + [np.asarray(result, np.float32)])
+
+            if written:
+                await self._delete_embeddings(conn, written)
+            await self._copy_embeddings(conn, records)
+            if errors:
+                await self._insert_vectorizer_errors(conn, errors)
+            if requeued:
+                await self._requeue_items(conn, requeued)
+            if batch.status == "failed":
                 await self._insert_vectorizer_error(
                     conn,
                     (
                         self.vectorizer.id,
-                        VECTORIZER_FAILED,
-                        Jsonb({"error_reason": str(e)}),
+                        BATCH_JOB_FAILED,
+                        Jsonb(
+                            {
+                                "batch_id": batch.id,
+                                "error_reason": batch.errors.model_dump_json()
+                                if batch.errors is not None
+                                else None,
+                            }
+                        ),
                     ),
                 )
-            raise e
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    "delete from ai.vectorizer_batch_job where id = %s", (batch.id,)
+                )
+        await logger.ainfo(
+            f"Batch job ingested: {batch.id}",
+            status=batch.status,
+            items=len(written),
+            requeued=len(requeued),
+        )
+        await embedding.delete_batch_job_files(batch)
+
+    async def _lock_items(
+        self, conn: AsyncConnection, keys: list[tuple[Any, ...]]
+    ) -> list[SourceRow]:
+        """
+        Fetches the items with the given primary key values from the source
+        table, and takes their advisory locks.
+
+        Returns:
+            list[SourceRow]: The items that exist and were not locked by
+                another Worker.
+        """
+        queue_table_oid = await self._get_queue_table_oid(conn)
+        per_query = (MAX_QUERY_PARAMS - 1) // len(self.queries.pk_attnames)
+        items: list[SourceRow] = []
+        async with conn.cursor(row_factory=dict_row) as cursor:
+            for start in range(0, len(keys), per_query):
+                batch = keys[start : start + per_query]
+                await cursor.execute(
+                    self.queries.lock_items_query(len(batch)),
+                    [value for key in batch for value in key] + [queue_table_oid],
+                )
+                items.extend(await cursor.fetchall())
+        return items
+
+    async def _requeue_items(self, conn: AsyncConnection, items: list[SourceRow]):
+        """
+        Adds the given items back to the work queue.
+        """
+        per_query = MAX_QUERY_PARAMS // len(self.queries.pk_attnames)
+        async with conn.cursor() as cursor:
+            for start in range(0, len(items), per_query):
+                batch = items[start : start + per_query]
+                await cursor.execute(
+                    self.queries.requeue_items_query(len(batch)),
+                    [item[pk] for item in batch for pk in self.queries.pk_attnames],
+                )
 
-    async def _fetch_work(self, conn: AsyncConnection) -> list[SourceRow]:
+    def _batch_job_custom_id(self, tx: Transformer, record: EmbeddingRecord) -> str:
+        """
+        Identifies a chunk in a Batch API job: the text representation of the
+        primary key values of its item, followed by its chunk_seq.
+        """
+        pk_count = len(self.queries.pk_attnames)
+        return json.dumps(self._dump_pk(tx, record) + [record[pk_count]])
+
+    def _batch_job_item_key(self, tx: Transformer, record: EmbeddingRecord) -> str:
+        """
+        Identifies the item of a chunk in ai.vectorizer_batch_job: the text
+        representation of its primary key values.
+        """
+        return json.dumps(self._dump_pk(tx, record))
+
+    def _dump_pk(self, tx: Transformer, record: EmbeddingRecord) -> list[Any]:
+        """
+        The text representation of the primary key values of a record.
+        """
+        values: list[Any] = []
+        for value in record[: len(self.queries.pk_attnames)]:
+            dumped = tx.get_dumper(value, PyFormat.TEXT).dump(value)
+            values.append(bytes(dumped).decode() if dumped is not None else None)
+        return values
+
+    def _pk_loaders(self, conn: AsyncConnection) -> list[Loader]:
+        """
+        The loaders of the text representation of the primary key fields.
+        """
+        tx = Transformer.from_context(conn)
+        loaders: list[Loader] = []
+        for att in self.vectorizer.source_pk:
+            info = conn.adapters.types.get(att.typname)
+            loaders.append(tx.get_loader(info.oid if info else 0, Format.TEXT))
+        return loaders
+
+    def _parse_batch_job_custom_id(
+        self, loaders: list[Loader], custom_id: str
+    ) -> ChunkKey:
+        values = json.loads(custom_id)
+        chunk_key: ChunkKey = self._load_pk(loaders, values[:-1])
+        chunk_key.append(values[-1])
+        return chunk_key
+
+    def _load_pk(self, loaders: list[Loader], values: list[str]) -> list[Any]:
+        """
+        Loads primary key values from their text representation.
+        """
+        return [
+            loader.load(value.encode())
+            for loader, value in zip(loaders, values, strict=True)
+        ]
+
+    def _batch_size(self) -> int:
+        """
+        The number of items to claim in the next batch.
+        """
+        if self.batch_size is not None:
+            return self.batch_size.size
+        return self.vectorizer.config.processing.batch_size
+
+    async def _fetch_work(
+        self,
+        conn: AsyncConnection,
+        batch_size: int,
+        slot: int,
+        claim_id: uuid.UUID | None = None,
+    ) -> list[SourceRow]:
         """
         Fetches a batch of tasks from the work queue table. Safe for concurrent use.
 
         Follows the approach described in:
         https://www.timescale.com/blog/how-we-designed-a-resilient-vector-embedding-creation-system-for-postgresql-data/
 
+        With a partitioned queue table, the items are claimed from the
+        partition of the given slot. The other partitions are tried in
+        turn only when it is empty, so that concurrent Workers don't skip
+        past each other's locked rows.
+
         Args:
             conn (AsyncConnection): The database connection.
+            batch_size (int): The number of items to claim.
+            slot (int): The worker slot of the run claiming the items.
+            claim_id (uuid.UUID | None): When set, the queue rows of the items
+                are claimed with this id and a lease, instead of being
+                deleted. Only for queues with leases.
 
         Returns:
             list[SourceRow]: The rows from the source table that need to be embedded.
         """
         queue_table_oid = await self._get_queue_table_oid(conn)
+        partitions = await self._get_queue_partitions(conn)
+        claim = claim_id is not None
+        if not partitions:
+            queries = [
+                self.queries.claim_work_query
+                if claim
+                else self.queries.fetch_work_query
+            ]
+        else:
+            first = slot % len(partitions)
+            queries = [
+                self.queries.fetch_partition_work_query(partition, claim=claim)
+                for partition in partitions[first:] + partitions[:first]
+            ]
+        params: list[Any] = [batch_size, queue_table_oid]
+        if claim:
+            params += [claim_id, self.vectorizer.config.processing.lease_seconds]
         async with conn.cursor(row_factory=dict_row) as cursor:
+            for query in queries:
+                await cursor.execute(query, params)
+                items = await cursor.fetchall()
+                if items:
+                    worker_metrics.items_claimed.inc(len(items), self.vectorizer.id)
+                    return items
+            return []
+
+    async def _get_queue_partitions(self, conn: AsyncConnection) -> list[str]:
+        """
+        Retrieves the names of the partitions of the queue table, if the
+        vectorizer has a partitioned queue table.
+
+        Args:
+            conn (AsyncConnection): The database connection.
+
+        Returns:
+            list[str]: The partitions of the queue table, empty if it isn't
+                partitioned.
+        """
+        if self.vectorizer.config.processing.queue_partitions is None:
+            return []
+        if self._queue_partitions is not None:
+            return self._queue_partitions
+
+        queue_table_oid = await self._get_queue_table_oid(conn)
+        async with conn.cursor() as cursor:
             await cursor.execute(
-                self.queries.fetch_work_query,
-                (
-                    self.vectorizer.config.processing.batch_size,
-                    queue_table_oid,
-                ),
+                self.queries.fetch_queue_partitions_query, (queue_table_oid,)
             )
-            return await cursor.fetchall()
+            self._queue_partitions = [row[0] for row in await cursor.fetchall()]
+        return self._queue_partitions
 
     async def _get_queue_table_oid(self, conn: AsyncConnection) -> int:
         """
@@ -601,7 +1819,9 @@ class Worker:
         """
         Embeds the items and writes them to the database.
 
-        - Deletes existing embeddings for the items.
+        - Deletes existing embeddings for the items. With incremental writes,
+          only the embeddings of chunks that changed or no longer exist are
+          deleted, and only new or changed chunks are embedded.
         - Generates the documents to be embedded, chunks them, and formats the chunks.
         - Sends the documents to the embedding provider and writes embeddings
           to the database.
@@ -615,8 +1835,16 @@ class Worker:
             int: The number of records written to the database.
         """
 
-        await self._delete_embeddings(conn, items)
-        records, errors = await self._generate_embeddings(items)
+        if self.incremental_writes:
+            records, documents = await self._chunk_items(items)
+            records, documents, stale_chunks = await self._diff_chunks(
+                conn, items, records
+            )
+            await self._delete_chunks(conn, stale_chunks)
+            records, errors = await self._embed_documents(conn, records, documents)
+        else:
+            await self._delete_embeddings(conn, items)
+            records, errors = await self._generate_embeddings(conn, items)
         # await self._insert_embeddings(conn, records)
         await self._copy_embeddings(conn, records)
         if errors:
@@ -632,9 +1860,84 @@ class Worker:
             conn (AsyncConnection): The database connection.
             items (list[SourceRow]): The items whose embeddings need to be deleted.
         """
-        ids = [item[pk] for item in items for pk in self.queries.pk_attnames]
+        per_query = MAX_QUERY_PARAMS // len(self.queries.pk_attnames)
+        async with conn.cursor() as cursor:
+            for start in range(0, len(items), per_query):
+                batch = items[start : start + per_query]
+                await cursor.execute(
+                    self.queries.delete_embeddings_query(len(batch)),
+                    [item[pk] for item in batch for pk in self.queries.pk_attnames],
+                )
+
+    async def _delete_chunks(self, conn: AsyncConnection, chunks: list[ChunkKey]):
+        """
+        Deletes the embeddings of the given chunks from the target table.
+
+        Args:
+            conn (AsyncConnection): The database connection.
+            chunks (list[ChunkKey]): The primary key values and chunk_seq of
+                the chunks to delete.
+        """
+        per_query = MAX_QUERY_PARAMS // (len(self.queries.pk_attnames) + 1)
         async with conn.cursor() as cursor:
-            await cursor.execute(self.queries.delete_embeddings_query(len(items)), ids)
+            for start in range(0, len(chunks), per_query):
+                batch = chunks[start : start + per_query]
+                await cursor.execute(
+                    self.queries.delete_chunks_query(len(batch)),
+                    [value for chunk in batch for value in chunk],
+                )
+
+    async def _diff_chunks(
+        self,
+        conn: AsyncConnection,
+        items: list[SourceRow],
+        records_without_embeddings: list[EmbeddingRecord],
+    ) -> tuple[list[EmbeddingRecord], list[str], list[ChunkKey]]:
+        """
+        Compares the chunks of the given items with the chunks stored in the
+        target table.
+
+        Args:
+            conn (AsyncConnection): The database connection.
+            items (list[SourceRow]): The items that were chunked.
+            records_without_embeddings (list[EmbeddingRecord]): The new chunk
+                records of the items.
+
+        Returns:
+            tuple[list[EmbeddingRecord], list[str], list[ChunkKey]]: The
+                records of the new or changed chunks, their documents, and the
+                chunks that must be deleted because they changed or no longer
+                exist.
+        """
+        per_query = MAX_QUERY_PARAMS // len(self.queries.pk_attnames)
+        existing: dict[tuple[Any, ...], str] = {}
+        async with conn.cursor() as cursor:
+            for start in range(0, len(items), per_query):
+                batch = items[start : start + per_query]
+                await cursor.execute(
+                    self.queries.fetch_chunks_query(len(batch)),
+                    [item[pk] for item in batch for pk in self.queries.pk_attnames],
+                )
+                for row in await cursor.fetchall():
+                    existing[tuple(row[:-1])] = row[-1]
+
+        records: list[EmbeddingRecord] = []
+        stale_chunks: list[ChunkKey] = []
+        for record in records_without_embeddings:
+            key = tuple(record[:-1])
+            stored_chunk = existing.pop(key, None)
+            if stored_chunk == record[-1]:
+                continue
+            if stored_chunk is not None:
+                stale_chunks.append(list(key))
+            records.append(record)
+        # Chunks left over belong to items that now produce fewer chunks.
+        stale_chunks.extend(list(key) for key in existing)
+        await logger.adebug(
+            f"Chunks unchanged: {len(records_without_embeddings) - len(records)}"
+            f", to embed: {len(records)}, to delete: {len(stale_chunks)}"
+        )
+        return records, [record[-1] for record in records], stale_chunks
 
     @tracer.wrap()
     async def _copy_embeddings(
@@ -650,13 +1953,21 @@ class Worker:
             conn (AsyncConnection): The database connection.
             records (list[EmbeddingRecord]): The embedding records to be copied.
         """
+        start_time = time.perf_counter()
         async with (
             conn.cursor(binary=True) as cursor,
             cursor.copy(self.queries.copy_embeddings_query) as copy,
         ):
             copy.set_types(self.queries.copy_types)
-            for record in records:
-                await copy.write_row(record)
+            embeddings = self.vectorizer.config.storage.to_binary(
+                [record[-1] for record in records]
+            )
+            for record, embedding in zip(records, embeddings, strict=True):
+                await copy.write_row(record[:-1] + [embedding])
+        worker_metrics.copy_duration.observe(
+            time.perf_counter() - start_time, self.vectorizer.id
+        )
+        worker_metrics.chunks.inc(len(records), self.vectorizer.id)
 
     async def _insert_vectorizer_errors(
         self,
@@ -688,36 +1999,75 @@ class Worker:
         async with conn.cursor() as cursor:
             await cursor.execute(self.queries.insert_errors_query, record)
 
-    def _get_item_pk_values(self, item: SourceRow) -> list[Any]:
-        return [item[pk] for pk in self.queries.pk_attnames]
-
     async def _generate_embeddings(
-        self, items: list[SourceRow]
+        self, conn: AsyncConnection, items: list[SourceRow]
     ) -> tuple[list[EmbeddingRecord], list[VectorizerErrorRecord]]:
         """
         Generates the embeddings for the given items.
 
         Args:
+            conn (AsyncConnection): The database connection, used to access
+                the embedding cache.
             items (list[SourceRow]): The items to generate embeddings for.
 
         Returns:
             tuple[list[EmbeddingRecord], list[VectorizerErrorRecord]]: A tuple
                 of embedding records and error records.
         """
-        records_without_embeddings: list[EmbeddingRecord] = []
-        documents: list[str] = []
-        for item in items:
-            pk = self._get_item_pk_values(item)
-            chunks = self.vectorizer.config.chunking.into_chunks(item)
-            for chunk_id, chunk in enumerate(chunks, 0):
-                formatted = self.vectorizer.config.formatting.format(chunk, item)
-                records_without_embeddings.append(pk + [chunk_id, formatted])
-                documents.append(formatted)
+        records_without_embeddings, documents = await self._chunk_items(items)
+        return await self._embed_documents(conn, records_without_embeddings, documents)
 
-        try:
-            embeddings = await self.vectorizer.config.embedding.embed(documents)
-        except Exception as e:
-            raise EmbeddingProviderError() from e
+    async def _chunk_items(
+        self, items: list[SourceRow]
+    ) -> tuple[list[EmbeddingRecord], list[str]]:
+        """
+        Splits the given items into chunks and formats them, in the process
+        pool if the Worker has one.
+
+        Args:
+            items (list[SourceRow]): The items to chunk.
+
+        Returns:
+            tuple[list[EmbeddingRecord], list[str]]: A tuple of records without
+                embeddings and the formatted documents to embed.
+        """
+        config = self.vectorizer.config
+        if self.process_pool is not None:
+            return await self.process_pool.chunk_items(
+                config.chunking, config.formatting, self.queries.pk_attnames, items
+            )
+        return chunk_items(
+            config.chunking, config.formatting, self.queries.pk_attnames, items
+        )
+
+    async def _embed_documents(
+        self,
+        conn: AsyncConnection,
+        records_without_embeddings: list[EmbeddingRecord],
+        documents: list[str],
+    ) -> tuple[list[EmbeddingRecord], list[VectorizerErrorRecord]]:
+        """
+        Embeds the given documents and attaches the embeddings to their records.
+        Documents found in the embedding cache, if enabled, are not sent to
+        the embedding provider.
+
+        Args:
+            conn (AsyncConnection): The database connection, used to access
+                the embedding cache.
+            records_without_embeddings (list[EmbeddingRecord]): The chunk
+                records, one per document.
+            documents (list[str]): The formatted chunks to embed.
+
+        Returns:
+            tuple[list[EmbeddingRecord], list[VectorizerErrorRecord]]: A tuple
+                of embedding records and error records.
+        """
+        if not documents:
+            return [], []
+        if self.embedding_cache is None:
+            embeddings = await self._embed(documents)
+        else:
+            embeddings = await self._embed_documents_cached(conn, documents)
 
         assert len(embeddings) == len(records_without_embeddings)
 
@@ -729,9 +2079,74 @@ class Worker:
             if isinstance(embedding, ChunkEmbeddingError):
                 errors.append(self._vectorizer_error_record(record, embedding))
             else:
-                records.append(record + [np.array(embedding)])
+                records.append(record + [np.asarray(embedding, np.float32)])
         return records, errors
 
+    async def _embed_documents_cached(
+        self, conn: AsyncConnection, documents: list[str]
+    ) -> list[Any]:
+        """
+        Embeds the given documents, looking them up in the embedding cache
+        first and storing the newly computed embeddings in it.
+
+        Args:
+            conn (AsyncConnection): The database connection.
+            documents (list[str]): The formatted chunks to embed.
+
+        Returns:
+            list[Any]: One embedding or ChunkEmbeddingError per document.
+        """
+        assert self.embedding_cache is not None
+        embedding = self.vectorizer.config.embedding
+        keys = self.embedding_cache.keys(embedding, documents)
+        cached = await self.embedding_cache.get_many(conn, keys)
+        # Identical chunks within the batch are only embedded once.
+        misses: dict[bytes, str] = {}
+        for key, document in zip(keys, documents, strict=True):
+            if key not in cached:
+                misses.setdefault(key, document)
+        await logger.adebug(
+            f"Embedding cache hits: {len(documents) - len(misses)}"
+            f" of {len(documents)}"
+        )
+
+        computed: dict[bytes, Any] = {}
+        if misses:
+            new_embeddings = await self._embed(list(misses.values()))
+            computed = dict(zip(misses.keys(), new_embeddings, strict=True))
+            await self.embedding_cache.put_many(
+                conn,
+                {
+                    key: np.asarray(value, dtype=np.float32)
+                    for key, value in computed.items()
+                    if not isinstance(value, ChunkEmbeddingError)
+                },
+            )
+        return [cached[key] if key in cached else computed[key] for key in keys]
+
+    async def _embed(self, documents: list[str]) -> list[Any]:
+        """
+        Sends the given documents to the embedding provider.
+
+        Args:
+            documents (list[str]): The formatted chunks to embed.
+
+        Returns:
+            list[Any]: One embedding or ChunkEmbeddingError per document.
+        """
+        start_time = time.perf_counter()
+        try:
+            # The embedder's requests are measured for this vectorizer.
+            with for_vectorizer(self.vectorizer.id):
+                embeddings = await self.vectorizer.config.embedding.embed(documents)
+        except Exception as e:
+            raise EmbeddingProviderError() from e
+        if self.batch_size is not None:
+            self.batch_size.observe_embed(
+                len(documents), time.perf_counter() - start_time
+            )
+        return embeddings
+
     def _vectorizer_error_record(
         self, record: EmbeddingRecord, chunk_error: ChunkEmbeddingError
     ) -> VectorizerErrorRecord:
@@ -0,0 +1,207 @@
+import asyncio
+import base64
+import json
+import threading
+from collections.abc import Iterator
+from email.parser import BytesParser
+from email.policy import default
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+import numpy as np
+import pytest
+
+from pgai.vectorizer.embedders import OpenAI
+from pgai.vectorizer.embedders.openai import BATCH_JOB_REQUEST_ERROR
+from pgai.vectorizer.embeddings import ChunkEmbeddingError
+
+
+class MockBatchApi(BaseHTTPRequestHandler):
+    """
+    The files and batches endpoints of the OpenAI API. Jobs complete as soon
+    as they are created, embedding each input as [its length, 1.0], and
+    failing the inputs longer than 20 characters.
+    """
+
+    files: dict[str, bytes] = {}
+    batches: dict[str, dict[str, Any]] = {}
+
+    def log_message(self, format: str, *args: Any):
+        pass
+
+    def _respond(self, status: int, body: bytes | dict[str, Any]):
+        if isinstance(body, dict):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers["Content-Length"]))
+
+    def _add_file(self, content: bytes) -> str:
+        file_id = f"file-{len(self.files)}"
+        self.files[file_id] = content
+        return file_id
+
+    def do_POST(self):
+        body = self._read_body()
+        if self.path == "/v1/files":
+            message = BytesParser(policy=default).parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body
+            )
+            parts = {
+                part.get_param("name", header="content-disposition"): part
+                for part in message.iter_parts()
+            }
+            file_id = self._add_file(parts["file"].get_payload(decode=True))
+            self._respond(
+                200,
+                {
+                    "id": file_id,
+                    "object": "file",
+                    "bytes": 0,
+                    "created_at": 0,
+                    "filename": "embeddings.jsonl",
+                    "purpose": "batch",
+                    "status": "processed",
+                },
+            )
+        elif self.path == "/v1/batches":
+            request = json.loads(body)
+            batch_id = f"batch-{len(self.batches)}"
+            self.batches[batch_id] = {
+                "id": batch_id,
+                "object": "batch",
+                "endpoint": request["endpoint"],
+                "input_file_id": request["input_file_id"],
+                "completion_window": request["completion_window"],
+                "created_at": 0,
+                "status": "validating",
+            }
+            self._respond(200, self.batches[batch_id])
+        else:
+            self._respond(404, {"error": {"message": "not found"}})
+
+    def do_GET(self):
+        parts = self.path.split("/")
+        if parts[2] == "batches" and parts[3] in self.batches:
+            batch = self.batches[parts[3]]
+            if batch["status"] == "validating":
+                self._complete(batch)
+            self._respond(200, batch)
+        elif parts[2] == "files" and parts[3] in self.files:
+            self._respond(200, self.files[parts[3]])
+        else:
+            self._respond(404, {"error": {"message": "not found"}})
+
+    def do_DELETE(self):
+        file_id = self.path.split("/")[3]
+        if self.files.pop(file_id, None) is None:
+            self._respond(404, {"error": {"message": "not found"}})
+        else:
+            self._respond(200, {"id": file_id, "object": "file", "deleted": True})
+
+    def _complete(self, batch: dict[str, Any]):
+        output: list[str] = []
+        errors: list[str] = []
+        for line in self.files[batch["input_file_id"]].splitlines():
+            request = json.loads(line)
+            document = request["body"]["input"]
+            if len(document) > 20:
+                response = {
+                    "status_code": 400,
+                    "body": {"error": {"message": f"{request['body']['model']}"}},
+                }
+                errors.append(
+                    json.dumps(
+                        {"custom_id": request["custom_id"], "response": response}
+                    )
+                )
+            else:
+                embedding = np.array([len(document), 1.0], dtype="<f4")
+                assert request["body"]["encoding_format"] == "base64"
+                response = {
+                    "status_code": 200,
+                    "body": {
+                        "data": [
+                            {
+                                "embedding": base64.b64encode(
+                                    embedding.tobytes()
+                                ).decode()
+                            }
+                        ]
+                    },
+                }
+                output.append(
+                    json.dumps(
+                        {"custom_id": request["custom_id"], "response": response}
+                    )
+                )
+        batch["status"] = "completed"
+        batch["output_file_id"] = self._add_file("\n".join(output).encode())
+        batch["error_file_id"] = self._add_file("\n".join(errors).encode())
+
+
+@pytest.fixture
+def mock_batch_api(monkeypatch: pytest.MonkeyPatch) -> Iterator[type[MockBatchApi]]:
+    MockBatchApi.files = {}
+    MockBatchApi.batches = {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockBatchApi)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1")
+    yield MockBatchApi
+    server.shutdown()
+    server.server_close()
+
+
+def test_openai_batch_jobs(mock_batch_api: type[MockBatchApi]):
+    embedder = OpenAI(
+        implementation="openai",
+        model="text-embedding-3-small",
+        dimensions=2,
+        api_key_name="OPENAI_API_KEY",
+    )
+    embedder.set_api_key({"OPENAI_API_KEY": "test"})
+    requests = [("[1, 0]", "post one"), ("[2, 0]", "post " * 10), ("[3, 0]", "two")]
+
+    async def run():
+        try:
+            batch = await embedder.create_batch_job(requests)
+            assert batch.status == "validating"
+            input_file = mock_batch_api.files[batch.input_file_id].splitlines()
+            assert json.loads(input_file[0]) == {
+                "custom_id": "[1, 0]",
+                "method": "POST",
+                "url": "/v1/embeddings",
+                "body": {
+                    "model": "text-embedding-3-small",
+                    "input": "post one",
+                    "encoding_format": "base64",
+                    "dimensions": 2,
+                },
+            }
+
+            batch = await embedder.retrieve_batch_job(batch.id)
+            assert batch.status == "completed"
+            assert await embedder.batch_job_inputs(batch) == dict(requests)
+            results = await embedder.batch_job_results(batch)
+            assert results["[2, 0]"] == ChunkEmbeddingError(
+                error=BATCH_JOB_REQUEST_ERROR,
+                error_details="text-embedding-3-small",
+            )
+            # Embeddings are decoded into float32 arrays.
+            assert isinstance(results["[1, 0]"], np.ndarray)
+            assert results["[1, 0]"].dtype == np.float32
+            assert results["[1, 0]"].tolist() == [8.0, 1.0]
+            assert isinstance(results["[3, 0]"], np.ndarray)
+            assert results["[3, 0]"].tolist() == [3.0, 1.0]
+
+            await embedder.delete_batch_job_files(batch)
+            assert mock_batch_api.files == {}
+        finally:
+            await embedder.close()
+
+    asyncio.run(run())
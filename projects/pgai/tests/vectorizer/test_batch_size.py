@@ -0,0 +1,56 @@
+import httpx
+import openai
+
+from pgai.vectorizer.batch_size import AdaptiveBatchSize, BatchSizeLimits
+from pgai.vectorizer.vectorizer import EmbeddingProviderError
+
+limits = BatchSizeLimits(
+    min_size=10,
+    max_size=200,
+    target_embed_latency=5,
+    max_duration=30,
+    max_chunks=1000,
+)
+
+
+def test_grows_additively_after_full_batches():
+    batch_size = AdaptiveBatchSize(100, limits)
+    batch_size.observe_batch(full=True, chunks=100, seconds=1)
+    batch_size.observe_batch(full=True, chunks=100, seconds=1)
+    assert batch_size.size == 120
+    # A batch that drained the queue says nothing about larger batches.
+    batch_size.observe_batch(full=False, chunks=10, seconds=1)
+    assert batch_size.size == 120
+    for _ in range(20):
+        batch_size.observe_batch(full=True, chunks=100, seconds=1)
+    assert batch_size.size == 200
+
+
+def test_shrinks_in_proportion_to_the_overshoot():
+    batch_size = AdaptiveBatchSize(100, limits)
+    batch_size.observe_embed(chunks=500, seconds=10)
+    assert batch_size.size == 50
+    batch_size.observe_batch(full=True, chunks=100, seconds=60)
+    assert batch_size.size == 25
+    batch_size.observe_batch(full=True, chunks=2000, seconds=1)
+    assert batch_size.size == 12
+    batch_size.observe_embed(chunks=500, seconds=100)
+    assert batch_size.size == 10
+
+
+def test_halves_on_rate_limit_errors():
+    batch_size = AdaptiveBatchSize(100, limits)
+    rate_limited = openai.RateLimitError(
+        "rate limited",
+        response=httpx.Response(
+            429, request=httpx.Request("POST", "https://api.openai.com")
+        ),
+        body=None,
+    )
+    try:
+        raise EmbeddingProviderError() from rate_limited
+    except EmbeddingProviderError as e:
+        batch_size.observe_error(e)
+    assert batch_size.size == 50
+    batch_size.observe_error(ValueError("not a rate limit"))
+    assert batch_size.size == 50
@@ -0,0 +1,72 @@
+import asyncio
+
+import numpy as np
+
+from pgai.vectorizer.embedders import OpenAI
+from pgai.vectorizer.embedding_cache import EmbeddingCache, LruCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    lru = LruCache(max_size=2)
+    lru.put(b"a", np.array([1.0]))
+    lru.put(b"b", np.array([2.0]))
+    assert lru.get(b"a") is not None
+    lru.put(b"c", np.array([3.0]))
+    assert len(lru) == 2
+    assert lru.get(b"b") is None
+    assert lru.get(b"a") is not None
+    assert lru.get(b"c") is not None
+
+
+def test_embedding_cache_keys():
+    small = OpenAI(
+        implementation="openai",
+        model="text-embedding-3-small",
+        dimensions=768,
+        api_key_name="OPENAI_API_KEY",
+    )
+    other_key = small.model_copy(update={"api_key_name": "OTHER_KEY"})
+    fewer_dimensions = small.model_copy(update={"dimensions": 512})
+
+    keys = EmbeddingCache.keys(small, ["a", "b", "a"])
+    assert keys[0] == keys[2]
+    assert keys[0] != keys[1]
+    assert EmbeddingCache.keys(other_key, ["a"])[0] == keys[0]
+    assert EmbeddingCache.keys(fewer_dimensions, ["a"])[0] != keys[0]
+
+
+class FakeCursor:
+    def __init__(self, executed: list[tuple[str, tuple[int, ...]]]):
+        self.executed = executed
+        self.rowcount = 3
+
+    async def __aenter__(self) -> "FakeCursor":
+        return self
+
+    async def __aexit__(self, *_args: object):
+        pass
+
+    async def execute(self, query: str, params: tuple[int, ...]):
+        self.executed.append((query, params))
+
+
+class FakeConnection:
+    def __init__(self):
+        self.executed: list[tuple[str, tuple[int, ...]]] = []
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self.executed)
+
+
+def test_prune_deletes_expired_entries_once_per_interval():
+    conn = FakeConnection()
+    cache = EmbeddingCache(LruCache(), max_age=3600)
+    assert asyncio.run(cache.prune(conn)) == 3  # type: ignore
+    assert asyncio.run(cache.prune(conn)) == 0  # type: ignore
+    assert len(conn.executed) == 1
+    assert conn.executed[0][1] == (3600,)
+
+    conn = FakeConnection()
+    forever = EmbeddingCache(LruCache(), max_age=0)
+    assert asyncio.run(forever.prune(conn)) == 0  # type: ignore
+    assert conn.executed == []
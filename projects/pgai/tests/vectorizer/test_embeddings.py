@@ -0,0 +1,286 @@
+import asyncio
+import random
+
+import httpx
+import ollama
+import openai
+import pytest
+
+from pgai.vectorizer import context_lengths
+from pgai.vectorizer.context_lengths import ContextLengths
+from pgai.vectorizer.embedders import Ollama, OpenAI, VoyageAI
+from pgai.vectorizer.embedders import ollama as ollama_embedder
+from pgai.vectorizer.embedders import openai as openai_embedder
+from pgai.vectorizer.embeddings import (
+    BatchApiCaller,
+    ChunkEmbeddingError,
+    EmbeddingResponse,
+    Usage,
+)
+
+
+def fake_api(
+    calls: list[list[str]], in_flight: list[int], max_seen: list[int]
+) -> BatchApiCaller[str]:
+    async def call_embed_api(documents: list[str]) -> EmbeddingResponse:
+        calls.append(documents)
+        in_flight[0] += 1
+        max_seen[0] = max(max_seen[0], in_flight[0])
+        # Make requests finish out of order
+        await asyncio.sleep(random.uniform(0, 0.01))
+        in_flight[0] -= 1
+        return EmbeddingResponse(
+            embeddings=[[float(d)] for d in documents],
+            usage=Usage(prompt_tokens=len(documents), total_tokens=len(documents)),
+        )
+
+    return BatchApiCaller(3, call_embed_api)
+
+
+def test_batch_chunks_and_embed_sequential():
+    calls: list[list[str]] = []
+    in_flight, max_seen = [0], [0]
+    batcher = fake_api(calls, in_flight, max_seen)
+    documents = [str(i) for i in range(10)]
+
+    embeddings = asyncio.run(batcher.batch_chunks_and_embed(documents))
+
+    assert embeddings == [[float(i)] for i in range(10)]
+    assert [len(c) for c in calls] == [3, 3, 3, 1]
+    assert max_seen[0] == 1
+
+
+def test_batch_chunks_and_embed_concurrent_keeps_order():
+    calls: list[list[str]] = []
+    in_flight, max_seen = [0], [0]
+    batcher = fake_api(calls, in_flight, max_seen)
+    batcher.max_in_flight = 2
+    documents = [str(i) for i in range(20)]
+
+    embeddings = asyncio.run(batcher.batch_chunks_and_embed(documents))
+
+    assert embeddings == [[float(i)] for i in range(20)]
+    assert len(calls) == 7
+    assert max_seen[0] == 2
+
+
+def test_pack_batches_by_chunk_count():
+    batcher = fake_api([], [0], [0])
+
+    assert batcher._pack_batches([str(i) for i in range(7)]) == [  # type: ignore
+        [0, 1, 2],
+        [3, 4, 5],
+        [6],
+    ]
+
+
+def test_pack_batches_by_token_budget():
+    async def unused(_documents: list[list[int]]) -> EmbeddingResponse:
+        raise NotImplementedError
+
+    batcher = BatchApiCaller(3, unused, max_tokens_per_batch=10, token_counter=len)
+    sizes = [6, 4, 5, 3, 2, 12, 1]
+    documents = [[0] * size for size in sizes]
+
+    batches = batcher._pack_batches(documents)  # type: ignore
+
+    # Every document is in exactly one batch
+    assert sorted(i for batch in batches for i in batch) == list(range(len(sizes)))
+    for batch in batches:
+        assert batch == sorted(batch)
+        assert len(batch) <= 3
+        # The oversized document goes alone in its batch
+        assert sum(sizes[i] for i in batch) <= 10 or batch == [5]
+    # 21 tokens of regular documents need 3 batches, plus the oversized one
+    assert len(batches) == 4
+
+
+def test_batch_chunks_and_embed_token_budget_keeps_order():
+    calls: list[list[list[int]]] = []
+
+    async def call_embed_api(documents: list[list[int]]) -> EmbeddingResponse:
+        calls.append(documents)
+        return EmbeddingResponse(
+            embeddings=[[float(len(d))] for d in documents],
+            usage=Usage(prompt_tokens=0, total_tokens=0),
+        )
+
+    batcher = BatchApiCaller(
+        2, call_embed_api, max_tokens_per_batch=8, token_counter=len
+    )
+    sizes = [1, 7, 2, 6, 3, 5]
+    embeddings = asyncio.run(
+        batcher.batch_chunks_and_embed([[0] * size for size in sizes])
+    )
+
+    assert embeddings == [[float(size)] for size in sizes]
+    assert all(sum(len(d) for d in call) <= 8 for call in calls)
+    assert len(calls) == 3
+
+
+def test_embedders_reuse_their_clients_until_closed(monkeypatch: pytest.MonkeyPatch):
+    async def run():
+        ollama = Ollama(implementation="ollama", model="nomic-embed-text")
+        client = ollama._client
+        transport = ollama._transport
+        assert ollama._client is client
+        closed: list[httpx.AsyncHTTPTransport] = []
+        aclose = transport.aclose
+
+        async def record_aclose():
+            closed.append(transport)
+            await aclose()
+
+        monkeypatch.setattr(transport, "aclose", record_aclose)
+        await ollama.close()
+        assert closed == [transport]
+        assert ollama._client is not client
+        assert ollama._transport is not transport
+        await ollama.close()
+
+        voyageai = VoyageAI(
+            implementation="voyageai", model="voyage-3", api_key_name="VOYAGE_API_KEY"
+        )
+        session = voyageai._session
+        assert voyageai._session is session
+        await voyageai.close()
+        assert session.closed
+
+    asyncio.run(run())
+
+
+def test_openai_filters_chunks_longer_than_the_context_length(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    registry = ContextLengths(builtin={})
+    monkeypatch.setattr(openai_embedder, "context_lengths", registry)
+    requests: list[list[list[int]]] = []
+
+    async def call_embed_api(documents: list[list[int]]) -> EmbeddingResponse:
+        requests.append(documents)
+        if any(len(d) > 5 for d in documents):
+            raise openai.BadRequestError(
+                "too long",
+                response=httpx.Response(
+                    400, request=httpx.Request("POST", "https://api.openai.com")
+                ),
+                body={
+                    "message": "This model's maximum context length is 5 tokens,"
+                    " however you requested 40 tokens"
+                },
+            )
+        return EmbeddingResponse(
+            embeddings=[[float(len(d))] for d in documents],
+            usage=Usage(prompt_tokens=0, total_tokens=0),
+        )
+
+    embedder = OpenAI(
+        implementation="openai",
+        model="text-embedding-ada-002",
+        api_key_name="OPENAI_API_KEY",
+    )
+    embedder.__dict__["_batcher"] = BatchApiCaller(2048, call_embed_api)
+    documents = ["post one", "post " * 40, "two"]
+
+    first = asyncio.run(embedder.embed(documents))
+    # The context length is learned from the error, and the batch resent.
+    assert len(requests) == 2
+    assert registry.get("openai", "text-embedding-ada-002") == 5
+    assert first[0] == [2.0] and first[2] == [1.0]
+    assert isinstance(first[1], ChunkEmbeddingError)
+
+    second = asyncio.run(embedder.embed(documents))
+    # Long chunks are filtered out before the first request.
+    assert len(requests) == 3
+    assert second == first
+
+
+def test_context_lengths_builtin_and_found():
+    registry = ContextLengths()
+    assert registry.get("openai", "text-embedding-3-small") == 8192
+    assert registry.get("ollama", "nomic-embed-text") is None
+    registry.set("ollama", "nomic-embed-text", 8192)
+    assert registry.get("ollama", "nomic-embed-text") == 8192
+    assert registry._unsaved == {("ollama", "nomic-embed-text")}
+    # Setting a known length again has nothing new to save.
+    registry.set("openai", "text-embedding-3-small", 8192)
+    assert registry._unsaved == {("ollama", "nomic-embed-text")}
+    assert context_lengths.context_lengths.get("openai", "text-embedding-ada-002")
+
+
+def test_ollama_context_length_from_model_details(monkeypatch: pytest.MonkeyPatch):
+    registry = ContextLengths(builtin={})
+    monkeypatch.setattr(ollama_embedder, "context_lengths", registry)
+    embedder = Ollama(
+        implementation="ollama", model="nomic-embed-text", options={"num_ctx": 512}
+    )
+    assert embedder._known_context_length() is None
+    # Details without a context length leave the registry as it is.
+    assert asyncio.run(embedder._model_context_length({})) is None
+    assert (
+        asyncio.run(
+            embedder._model_context_length(
+                {"model_info": {"general.architecture": "nomic-bert"}}
+            )
+        )
+        is None
+    )
+    assert embedder._known_context_length() is None
+    asyncio.run(
+        embedder._model_context_length(
+            {
+                "model_info": {
+                    "general.architecture": "nomic-bert",
+                    "nomic-bert.context_length": 2048,
+                }
+            }
+        )
+    )
+    assert registry.get("ollama", "nomic-embed-text") == 2048
+    # The configured context window is used when it is smaller.
+    assert embedder._known_context_length() == 512
+
+
+def test_ollama_rejects_chunks_longer_than_the_context_length(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    registry = ContextLengths(builtin={"ollama": {"nomic-embed-text": 10}})
+    monkeypatch.setattr(ollama_embedder, "context_lengths", registry)
+    truncated: list[list[str]] = []
+    untruncated: list[list[str]] = []
+
+    async def call_embed_api(documents: list[str]) -> EmbeddingResponse:
+        truncated.append(documents)
+        return EmbeddingResponse(
+            embeddings=[[float(len(d))] for d in documents],
+            usage=Usage(prompt_tokens=0, total_tokens=0),
+        )
+
+    async def call_embed_api_untruncated(documents: list[str]) -> EmbeddingResponse:
+        untruncated.append(documents)
+        # Chunks of "x" are one token per byte, the others fit.
+        if any(d.startswith("x") for d in documents):
+            raise ollama.ResponseError(
+                "input length exceeds maximum context length", 400
+            )
+        return await call_embed_api(documents)
+
+    embedder = Ollama(implementation="ollama", model="nomic-embed-text")
+    embedder.__dict__["_batcher"] = BatchApiCaller(2048, call_embed_api)
+    embedder.__dict__["_untruncated_batcher"] = BatchApiCaller(
+        2048, call_embed_api_untruncated
+    )
+    documents = ["short", "x" * 20, "ab " * 10, "x" * 11]
+
+    embeddings = asyncio.run(embedder.embed(documents))
+
+    assert embeddings[0] == [5.0]
+    assert isinstance(embeddings[1], ChunkEmbeddingError)
+    assert embeddings[2] == [30.0]
+    assert isinstance(embeddings[3], ChunkEmbeddingError)
+    # Only the chunks longer than the context length in bytes are sent
+    # without truncation, and a rejected request is split until the chunks
+    # that are too long are found.
+    assert truncated[0] == ["short"]
+    assert untruncated[0] == ["x" * 20, "ab " * 10, "x" * 11]
+    assert ["x" * 20] in untruncated and ["x" * 11] in untruncated
@@ -0,0 +1,88 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator
+
+from psycopg import Notify
+
+from pgai.cli import wait_for_work
+from pgai.vectorizer.listener import QueueListener
+
+
+class FakeConnection:
+    """Delivers a fixed list of notifications, one call to notifies at a time."""
+
+    def __init__(self, batches: list[list[Notify]]):
+        self.batches = batches
+
+    async def notifies(self, **_kwargs: float | int | None) -> AsyncIterator[Notify]:
+        batch = self.batches.pop(0) if self.batches else []
+        for notify in batch:
+            yield notify
+
+    async def close(self):
+        pass
+
+
+def listener_with(batches: list[list[Notify]]) -> QueueListener:
+    listener = QueueListener("postgres://unused", debounce=0)
+    listener._conn = FakeConnection(batches)  # type: ignore
+    listener._channels = {"ai_vectorizer_1": 1, "ai_vectorizer_2": 2}
+    return listener
+
+
+def test_wait_without_channels_times_out():
+    listener = QueueListener("postgres://unused")
+    assert asyncio.run(listener.wait(0)) is None
+
+
+def test_wait_coalesces_notifications():
+    listener = listener_with(
+        [
+            [Notify("ai_vectorizer_1", "", 1)],
+            [
+                Notify("ai_vectorizer_1", "", 1),
+                Notify("ai_vectorizer_2", "", 2),
+                Notify("unknown", "", 2),
+            ],
+        ]
+    )
+    assert asyncio.run(listener.wait(10)) == {1, 2}
+
+
+def test_wait_without_notifications_polls_everything():
+    listener = listener_with([[]])
+    assert asyncio.run(listener.wait(0)) is None
+
+
+class NotifyingConnection(FakeConnection):
+    """Notifies the channel of vectorizer 1 every few milliseconds, forever."""
+
+    def __init__(self):
+        super().__init__([])
+
+    async def notifies(self, **_kwargs: float | int | None) -> AsyncIterator[Notify]:
+        await asyncio.sleep(0.01)
+        yield Notify("ai_vectorizer_1", "", 1)
+
+
+def test_notifications_dont_postpone_polling():
+    listener = QueueListener("postgres://unused", debounce=0)
+    listener._conn = NotifyingConnection()  # type: ignore
+    # Vectorizer 2 doesn't notify.
+    listener._channels = {"ai_vectorizer_1": 1}
+    poll_interval = 0.2
+
+    async def run() -> dict[int, float]:
+        # When each vectorizer was first run after the initial poll.
+        processed: dict[int, float] = {}
+        start = time.monotonic()
+        poll_deadline = start + poll_interval
+        while len(processed) < 2 and time.monotonic() - start < 10 * poll_interval:
+            notified_ids = await wait_for_work(listener, poll_deadline)
+            for vectorizer_id in notified_ids or {1, 2}:
+                processed.setdefault(vectorizer_id, time.monotonic() - start)
+        return processed
+
+    processed = asyncio.run(run())
+    assert processed[1] < poll_interval
+    assert poll_interval <= processed[2] < 2 * poll_interval
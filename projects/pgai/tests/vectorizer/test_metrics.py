@@ -0,0 +1,126 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from pgai.vectorizer import metrics
+from pgai.vectorizer.embeddings import BatchApiCaller, EmbeddingResponse, Usage
+from pgai.vectorizer.metrics import WorkerMetrics, for_vectorizer, serve
+
+
+@pytest.fixture
+def worker_metrics(monkeypatch: pytest.MonkeyPatch) -> WorkerMetrics:
+    fresh = WorkerMetrics()
+    monkeypatch.setattr(metrics, "worker_metrics", fresh)
+    monkeypatch.setattr("pgai.vectorizer.embeddings.worker_metrics", fresh)
+    return fresh
+
+
+def test_render_counters_and_histograms():
+    worker_metrics = WorkerMetrics()
+    worker_metrics.items_claimed.inc(3, vectorizer_id=1)
+    worker_metrics.items_claimed.inc(2, vectorizer_id=1)
+    worker_metrics.items_claimed.inc(7, vectorizer_id=2)
+    worker_metrics.queue_pending.set(42, vectorizer_id=2)
+    worker_metrics.copy_duration.observe(0.2, vectorizer_id=1)
+    worker_metrics.copy_duration.observe(3, vectorizer_id=1)
+
+    lines = worker_metrics.render().splitlines()
+
+    assert "# TYPE pgai_vectorizer_items_claimed_total counter" in lines
+    assert 'pgai_vectorizer_items_claimed_total{vectorizer_id="1"} 5' in lines
+    assert 'pgai_vectorizer_items_claimed_total{vectorizer_id="2"} 7' in lines
+    assert 'pgai_vectorizer_queue_pending_items{vectorizer_id="2"} 42' in lines
+    assert "# TYPE pgai_vectorizer_copy_duration_seconds histogram" in lines
+    # Buckets are cumulative.
+    assert (
+        'pgai_vectorizer_copy_duration_seconds_bucket{vectorizer_id="1",le="0.1"} 0'
+        in lines
+    )
+    assert (
+        'pgai_vectorizer_copy_duration_seconds_bucket{vectorizer_id="1",le="0.25"} 1'
+        in lines
+    )
+    assert (
+        'pgai_vectorizer_copy_duration_seconds_bucket{vectorizer_id="1",le="+Inf"} 2'
+        in lines
+    )
+    assert 'pgai_vectorizer_copy_duration_seconds_sum{vectorizer_id="1"} 3.2' in lines
+    assert 'pgai_vectorizer_copy_duration_seconds_count{vectorizer_id="1"} 2' in lines
+
+
+def test_embed_requests_are_attributed_to_the_vectorizer(
+    worker_metrics: WorkerMetrics,
+):
+    async def call_embed_api(documents: list[str]) -> EmbeddingResponse:
+        return EmbeddingResponse(
+            embeddings=[[1.0] for _ in documents],
+            usage=Usage(prompt_tokens=10, total_tokens=10),
+        )
+
+    batcher = BatchApiCaller(2, call_embed_api, max_in_flight=2)
+
+    async def run():
+        with for_vectorizer(7):
+            await batcher.batch_chunks_and_embed(["a", "b", "c"])
+        await batcher.batch_chunks_and_embed(["d"])
+
+    asyncio.run(run())
+
+    assert worker_metrics.tokens.value(7) == 20
+    assert worker_metrics.embed_request_duration.count(7) == 2
+    assert worker_metrics.tokens.value(None) == 10
+
+
+def test_rate_limited_requests_are_counted(worker_metrics: WorkerMetrics):
+    request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+
+    async def call_embed_api(_documents: list[str]) -> EmbeddingResponse:
+        raise openai.RateLimitError(
+            "rate limited",
+            response=httpx.Response(429, request=request),
+            body=None,
+        )
+
+    batcher = BatchApiCaller(2, call_embed_api)
+
+    async def run():
+        with for_vectorizer(3):
+            await batcher.batch_chunks_and_embed(["a"])
+
+    with pytest.raises(openai.RateLimitError):
+        asyncio.run(run())
+
+    assert worker_metrics.rate_limited.value(3) == 1
+    assert worker_metrics.embed_request_duration.count(3) == 0
+
+
+def test_serve_metrics():
+    worker_metrics = WorkerMetrics()
+    worker_metrics.errors.inc(vectorizer_id=1)
+
+    async def get(port: int, path: str) -> bytes:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        return response
+
+    async def run() -> tuple[bytes, bytes]:
+        server = await serve(0, "127.0.0.1", worker_metrics)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await get(port, "/metrics"), await get(port, "/")
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    found, not_found = asyncio.run(run())
+
+    head, body = found.split(b"\r\n\r\n", 1)
+    assert head.startswith(b"HTTP/1.1 200 OK")
+    assert b"Content-Type: text/plain; version=0.0.4" in head
+    assert b'pgai_vectorizer_errors_total{vectorizer_id="1"} 1\n' in body
+    assert not_found.startswith(b"HTTP/1.1 404 Not Found")
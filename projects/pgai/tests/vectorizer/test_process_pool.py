@@ -0,0 +1,42 @@
+import asyncio
+
+from pgai.vectorizer.chunking import LangChainCharacterTextSplitter
+from pgai.vectorizer.formatting import PythonTemplate
+from pgai.vectorizer.process_pool import (
+    ProcessPool,
+    chunk_items,
+    encode_documents,
+)
+
+chunking = LangChainCharacterTextSplitter(
+    implementation="character_text_splitter",
+    separator=" ",
+    chunk_size=20,
+    chunk_column="content",
+    chunk_overlap=0,
+    is_separator_regex=False,
+)
+formatting = PythonTemplate(implementation="python_template", template="$title: $chunk")
+items = [
+    {"id": i, "title": f"post {i}", "content": "lorem ipsum dolor sit amet " * i}
+    for i in range(1, 50)
+]
+
+
+def test_process_pool_matches_event_loop():
+    async def run():
+        pool = ProcessPool(2)
+        try:
+            records, documents = await pool.chunk_items(
+                chunking, formatting, ["id"], items
+            )
+            encoded = await pool.encode_documents("text-embedding-3-small", documents)
+            empty = await pool.chunk_items(chunking, formatting, ["id"], [])
+        finally:
+            pool.close()
+        return records, documents, encoded, empty
+
+    records, documents, encoded, empty = asyncio.run(run())
+    assert (records, documents) == chunk_items(chunking, formatting, ["id"], items)
+    assert encoded == encode_documents("text-embedding-3-small", documents)
+    assert empty == ([], [])
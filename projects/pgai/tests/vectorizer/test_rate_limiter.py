@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from pgai.vectorizer.rate_limiter import RateLimiter, TableBuckets, TokenBucket
+
+
+def test_token_bucket_goes_into_debt():
+    bucket = TokenBucket(per_minute=600)
+    assert bucket.reserve(600) == 0
+    # 60 units in debt at 10 units per second.
+    assert bucket.reserve(60) == pytest.approx(6, abs=0.01)
+
+
+def test_token_bucket_observes_the_remaining_units():
+    bucket = TokenBucket(per_minute=600)
+    bucket.observe(per_minute=60, remaining=30)
+    assert bucket.per_minute == 60
+    assert bucket.reserve(60) == pytest.approx(30, abs=0.01)
+
+
+def test_rate_limiter_learns_the_limits_from_the_headers(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    waits: list[float] = []
+
+    async def sleep(seconds: float):
+        waits.append(seconds)
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+
+    async def run():
+        limiter = RateLimiter("OPENAI_API_KEY")
+        # Nothing is known about the limits before the first response.
+        await limiter.acquire(1_000_000)
+        await limiter.observe(
+            {
+                "x-ratelimit-limit-requests": "3000",
+                "x-ratelimit-limit-tokens": "60000",
+                "x-ratelimit-remaining-requests": "2999",
+                "x-ratelimit-remaining-tokens": "1000",
+            }
+        )
+        await limiter.acquire(500)
+        await limiter.acquire(1500)
+
+    asyncio.run(run())
+    # 1000 tokens in debt at 1000 tokens per second.
+    assert waits == [pytest.approx(1, abs=0.01)]
+
+
+def test_rate_limiter_shares_only_the_known_limits():
+    reserved: list[tuple[float | None, float | None]] = []
+
+    class Buckets(TableBuckets):
+        async def reserve(
+            self,
+            api_key_name: str,  # noqa: ARG002
+            requests_per_minute: float | None,
+            tokens_per_minute: float | None,
+            tokens: float,  # noqa: ARG002
+        ) -> float:
+            reserved.append((requests_per_minute, tokens_per_minute))
+            return 0.0
+
+    async def run():
+        limiter = RateLimiter("OPENAI_API_KEY", Buckets("postgres://"))
+        await limiter.observe({"x-ratelimit-limit-tokens": "60000"})
+        await limiter.acquire(500)
+
+    asyncio.run(run())
+    # The request limit was not reported, so it is not stored.
+    assert reserved == [(None, 60000)]
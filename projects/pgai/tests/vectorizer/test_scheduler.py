@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from pgai.vectorizer.scheduler import FairScheduler, VectorizerQueue
+
+
+class FakeQueues:
+    """Processes items in whole batches, and records the order of the turns."""
+
+    def __init__(self, items: dict[int, int], batch_size: int):
+        self.items = items
+        self.batch_size = batch_size
+        self.turns: list[int] = []
+        self.running = 0
+        self.max_running = 0
+
+    async def run_turn(self, vectorizer_id: int, max_items: int) -> int:
+        self.turns.append(vectorizer_id)
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        processed = 0
+        while processed < max_items and self.items[vectorizer_id] > 0:
+            await asyncio.sleep(0)
+            batch = min(self.batch_size, self.items[vectorizer_id])
+            self.items[vectorizer_id] -= batch
+            processed += batch
+        self.running -= 1
+        return processed
+
+    def queues(self) -> list[VectorizerQueue]:
+        return [
+            VectorizerQueue(vectorizer_id, self.batch_size, pending)
+            for vectorizer_id, pending in self.items.items()
+        ]
+
+
+def test_small_queues_are_not_starved():
+    fake = FakeQueues({1: 1000, 2: 5, 3: 0}, batch_size=10)
+    scheduler = FairScheduler(fake.run_turn, max_concurrency=1, quantum_batches=2)
+    processed = asyncio.run(scheduler.run(fake.queues()))
+    assert processed == {1: 1000, 2: 5, 3: 0}
+    # The small queue is served first, the empty one never.
+    assert fake.turns[0] == 2
+    assert 3 not in fake.turns
+
+
+def test_backlogs_share_the_tasks():
+    fake = FakeQueues({1: 400, 2: 400}, batch_size=10)
+    scheduler = FairScheduler(fake.run_turn, max_concurrency=1, quantum_batches=2)
+    asyncio.run(scheduler.run(fake.queues()))
+    # Turns alternate until both queues are empty.
+    assert fake.turns[:6] == [1, 2, 1, 2, 1, 2]
+    assert fake.items == {1: 0, 2: 0}
+
+
+def test_max_concurrency():
+    fake = FakeQueues({1: 1000, 2: 1000, 3: 1000}, batch_size=10)
+    scheduler = FairScheduler(
+        fake.run_turn, max_concurrency=4, tasks_per_vectorizer=2, quantum_batches=1
+    )
+    processed = asyncio.run(scheduler.run(fake.queues()))
+    assert processed == {1: 1000, 2: 1000, 3: 1000}
+    assert fake.max_running == 4
+
+
+def test_overdrawn_queue_keeps_running():
+    async def run_turn(_vectorizer_id: int, _max_items: int) -> int:
+        # Goes well over its credit, then finds the queue empty.
+        run_turn.calls += 1  # type: ignore
+        return 100 if run_turn.calls == 1 else 0  # type: ignore
+
+    run_turn.calls = 0  # type: ignore
+    scheduler = FairScheduler(run_turn, max_concurrency=1, quantum_batches=1)
+    processed = asyncio.run(scheduler.run([VectorizerQueue(1, 10, 100)]))
+    assert processed == {1: 100}
+    assert run_turn.calls == 2  # type: ignore
+
+
+def test_short_turn_with_pending_items_keeps_running():
+    fake = FakeQueues({1: 100}, batch_size=10)
+
+    async def run_turn(vectorizer_id: int, max_items: int) -> int:
+        if not fake.turns:
+            # The other rows were locked by a concurrent turn.
+            fake.turns.append(vectorizer_id)
+            fake.items[vectorizer_id] -= 10
+            return 10
+        return await fake.run_turn(vectorizer_id, max_items)
+
+    scheduler = FairScheduler(run_turn, max_concurrency=1, quantum_batches=2)
+    processed = asyncio.run(scheduler.run(fake.queues()))
+    assert processed == {1: 100}
+    assert fake.items == {1: 0}
+
+
+def test_failed_turn_stops_its_vectorizer_only():
+    async def run_turn(vectorizer_id: int, _max_items: int) -> int:
+        if vectorizer_id == 1:
+            raise ValueError("boom")
+        return 0
+
+    def queues() -> list[VectorizerQueue]:
+        return [VectorizerQueue(1, 10, 10), VectorizerQueue(2, 10, 20)]
+
+    processed = asyncio.run(FairScheduler(run_turn, 2).run(queues()))
+    assert processed == {1: 0, 2: 0}
+
+    with pytest.raises(ValueError, match="boom"):
+        asyncio.run(FairScheduler(run_turn, 2, fail_fast=True).run(queues()))
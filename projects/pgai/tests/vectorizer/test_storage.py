@@ -0,0 +1,48 @@
+import struct
+
+import numpy as np
+
+from pgai.vectorizer.storage import (
+    bits_to_binary,
+    halfvecs_to_binary,
+    vectors_to_binary,
+)
+
+
+def test_vectors_to_binary_matches_the_pgvector_format():
+    vectors = [np.array([1.5, -2.0, 0.25], dtype=np.float32), [3.0, 4.0, 5.0]]
+
+    binary = vectors_to_binary(vectors)
+
+    assert [bytes(b) for b in binary] == [
+        struct.pack(">HH3f", 3, 0, 1.5, -2.0, 0.25),
+        struct.pack(">HH3f", 3, 0, 3.0, 4.0, 5.0),
+    ]
+    assert vectors_to_binary([]) == []
+
+
+def test_halfvecs_to_binary_matches_the_pgvector_format():
+    vectors = [np.array([1.5, -2.0, 0.25], dtype=np.float32), [3.0, 4.0, 5.0]]
+
+    binary = halfvecs_to_binary(vectors)
+
+    assert [bytes(b) for b in binary] == [
+        struct.pack(">HH3e", 3, 0, 1.5, -2.0, 0.25),
+        struct.pack(">HH3e", 3, 0, 3.0, 4.0, 5.0),
+    ]
+    assert halfvecs_to_binary([]) == []
+
+
+def test_bits_to_binary_quantizes_to_the_sign_of_each_value():
+    vectors = [
+        np.array([0.5, -0.1, 0.0, 2.0, 1.0, -3.0, 0.2, 0.1, -0.4], dtype=np.float32),
+        [-1.0] * 9,
+    ]
+
+    binary = bits_to_binary(vectors)
+
+    assert [bytes(b) for b in binary] == [
+        struct.pack(">i", 9) + bytes([0b10011011, 0b00000000]),
+        struct.pack(">i", 9) + bytes([0, 0]),
+    ]
+    assert bits_to_binary([]) == []
@@ -1,11 +1,16 @@
+import asyncio
 import os
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
 
 import psycopg
 import pytest
 from psycopg.rows import namedtuple_row
 from psycopg.sql import SQL, Identifier
+from psycopg_pool import AsyncConnectionPool
 
 from pgai import cli
+from pgai.vectorizer import Vectorizer, Worker
 
 # skip tests in this module if disabled
 enable_vectorizer_tool_tests = os.getenv("ENABLE_VECTORIZER_TOOL_TESTS")
@@ -32,6 +37,19 @@ def create_database(dbname: str) -> None:
         cur.execute(SQL("create database {dbname}").format(dbname=Identifier(dbname)))
 
 
+T = TypeVar("T")
+
+
+def with_pool(db_url: str, fn: Callable[[AsyncConnectionPool], Awaitable[T]]) -> T:
+    """Runs the cli coroutine `fn` with a connection pool to the database."""
+
+    async def run() -> T:
+        async with AsyncConnectionPool(db_url, min_size=1, open=False) as pool:
+            return await fn(pool)
+
+    return asyncio.run(run())
+
+
 def test_vectorizer_internal():
     db = "vcli0"
     create_database(db)
@@ -41,13 +59,16 @@ def test_vectorizer_internal():
         con.cursor() as cur,
     ):
         cur.execute("create extension if not exists vectorscale cascade")
-        pgai_version = cli.get_pgai_version(cur)
+        pgai_version = with_pool(_db_url, cli.get_pgai_version)
         assert pgai_version is None
         cur.execute("create extension if not exists ai cascade")
-        pgai_version = cli.get_pgai_version(cur)
+        pgai_version = with_pool(_db_url, cli.get_pgai_version)
         assert pgai_version is not None
-        assert len(cli.get_vectorizer_ids(_db_url)) == 0
-        assert len(cli.get_vectorizer_ids(_db_url, [42, 19])) == 0
+        assert len(with_pool(_db_url, cli.get_vectorizer_ids)) == 0
+        assert (
+            len(with_pool(_db_url, lambda pool: cli.get_vectorizer_ids(pool, [42, 19])))
+            == 0
+        )
         cur.execute("create extension if not exists timescaledb")
         cur.execute("drop table if exists note0")
         cur.execute("""
@@ -97,18 +118,36 @@ def test_vectorizer_internal():
         vectorizer_expected = cur.fetchone()
 
         # test cli.get_vectorizer_ids
-        assert len(cli.get_vectorizer_ids(_db_url)) == 1
-        assert len(cli.get_vectorizer_ids(_db_url, [42, 19])) == 0
-        assert len(cli.get_vectorizer_ids(_db_url, [vectorizer_id, 19])) == 1
-        assert len(cli.get_vectorizer_ids(_db_url, [vectorizer_id])) == 1
+        def vectorizer_ids(ids: list[int]) -> list[int]:
+            return with_pool(_db_url, lambda pool: cli.get_vectorizer_ids(pool, ids))
 
-        # test cli.get_vectorizer
-        vectorizer_actual = cli.get_vectorizer(_db_url, vectorizer_id)
+        assert len(with_pool(_db_url, cli.get_vectorizer_ids)) == 1
+        assert len(vectorizer_ids([42, 19])) == 0
+        assert len(vectorizer_ids([vectorizer_id, 19])) == 1
+        assert len(vectorizer_ids([vectorizer_id])) == 1
+
+        # test cli.get_vectorizer and run the vectorizer
+        known_vectorizers: cli.KnownVectorizers = {}
+
+        async def get_and_run(pool: AsyncConnectionPool) -> Vectorizer:
+            vectorizer = await cli.get_vectorizer(
+                pool, vectorizer_id, known_vectorizers
+            )
+            try:
+                processed = await cli.run_vectorizers(
+                    pool,
+                    {vectorizer_id: Worker(pool.conninfo, vectorizer, pool=pool)},
+                    max_concurrency=1,
+                )
+                assert processed == {vectorizer_id: 10}
+            finally:
+                await vectorizer.config.embedding.close()
+            return vectorizer
+
+        vectorizer_actual = with_pool(_db_url, get_and_run)
         assert vectorizer_actual is not None
         assert vectorizer_expected.source_table == vectorizer_actual.source_table  # type: ignore
-
-        # run the vectorizer
-        cli.run_vectorizer(_db_url, vectorizer_actual, 1)
+        assert known_vectorizers[vectorizer_id][1] is vectorizer_actual
 
         # make sure the queue was emptied
         cur.execute("select ai.vectorizer_queue_pending(%s)", (vectorizer_id,))
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 import subprocess
@@ -12,10 +13,11 @@ import pytest
 from click.testing import CliRunner
 from psycopg import Connection, sql
 from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
 from testcontainers.ollama import OllamaContainer  # type: ignore
 from testcontainers.postgres import PostgresContainer  # type: ignore
 
-from pgai.cli import vectorizer_worker
+from pgai.cli import KnownVectorizers, get_vectorizer, vectorizer_worker
 from tests.vectorizer import expected
 
 count = 10000
@@ -93,6 +95,25 @@ def test_worker_no_tasks(cli_db_url: str):
     assert "no vectorizers found" in result.output.lower()
 
 
+def test_worker_pool_too_small():
+    """Test that the pool must fit a connection per batch in flight"""
+    result = CliRunner().invoke(
+        vectorizer_worker,
+        [
+            "--once",
+            "--concurrency",
+            "2",
+            "--pipeline-depth",
+            "2",
+            "--pool-max-size",
+            "3",
+        ],
+    )
+
+    assert result.exit_code == 2
+    assert "--pool-max-size" in result.output
+
+
 @pytest.fixture
 def source_table(
     cli_db: tuple[TestDatabase, Connection], test_params: tuple[int, int, int, str, str]
@@ -305,6 +326,291 @@ class TestWithOpenAiVectorizer:
             cur.execute("SELECT count(*) as count FROM blog_embedding_store;")
             assert cur.fetchone()["count"] == num_items  # type: ignore
 
+    @pytest.mark.parametrize(
+        "test_params",
+        [
+            (
+                4,
+                1,
+                2,
+                "chunking_character_text_splitter('content')",
+                "formatting_python_template('$chunk')",
+            ),
+        ],
+    )
+    def test_process_vectorizer_pipelined(
+        self,
+        cli_db: tuple[TestDatabase, Connection],
+        cli_db_url: str,
+        configured_openai_vectorizer_id: int,
+        vcr_: Any,
+        test_params: tuple[int, int, int, str, str],
+    ):
+        """Test processing of vectorizer tasks with several batches in flight"""
+        num_items, _, batch_size, _, _ = test_params
+        _, conn = cli_db
+
+        cassette = (
+            f"openai-character_text_splitter-chunk_value-"
+            f"items={num_items}-batch_size={batch_size}.yaml"
+        )
+        with vcr_.use_cassette(cassette):
+            result = CliRunner().invoke(
+                vectorizer_worker,
+                [
+                    "--db-url",
+                    cli_db_url,
+                    "--once",
+                    "--vectorizer-id",
+                    str(configured_openai_vectorizer_id),
+                    "--pipeline-depth",
+                    "3",
+                ],
+                catch_exceptions=False,
+            )
+
+        assert not result.exception
+        assert result.exit_code == 0
+
+        with conn.cursor(row_factory=dict_row) as cur:
+            cur.execute("SELECT count(*) as count FROM blog_embedding_store;")
+            assert cur.fetchone()["count"] == num_items  # type: ignore
+            cur.execute(
+                "SELECT ai.vectorizer_queue_pending(%s) as count",
+                (configured_openai_vectorizer_id,),
+            )
+            assert cur.fetchone()["count"] == 0  # type: ignore
+
+    @pytest.mark.parametrize(
+        "test_params",
+        [
+            (
+                4,
+                1,
+                2,
+                "chunking_character_text_splitter('content')",
+                "formatting_python_template('$chunk')",
+            ),
+        ],
+    )
+    def test_process_vectorizer_leased(
+        self,
+        cli_db: tuple[TestDatabase, Connection],
+        cli_db_url: str,
+        source_table: str,
+        vcr_: Any,
+        test_params: tuple[int, int, int, str, str],
+    ):
+        """Test processing of vectorizer tasks claimed with a lease"""
+        num_items, _, batch_size, chunking, formatting = test_params
+        _, conn = cli_db
+        with conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(f"""
+                SELECT ai.create_vectorizer(
+                    '{source_table}'::regclass,
+                    embedding => ai.embedding_openai(
+                        'text-embedding-ada-002',
+                        1536,
+                        api_key_name => 'OPENAI_API_KEY'
+                    ),
+                    chunking => ai.{chunking},
+                    formatting => ai.{formatting},
+                    processing => ai.processing_default(batch_size => {batch_size},
+                                                        lease_seconds => 60)
+                )
+            """)  # type: ignore
+            vectorizer_id = int(cur.fetchone()["create_vectorizer"])  # type: ignore
+            # An item claimed by a worker that stopped is claimed again once
+            # its lease expired.
+            cur.execute(f"""
+                UPDATE ai._vectorizer_q_{vectorizer_id}
+                SET claim_id = gen_random_uuid(),
+                    claimed_until = now() - interval '1 second'
+                WHERE id = 1
+            """)
+
+        cassette = (
+            f"openai-character_text_splitter-chunk_value-"
+            f"items={num_items}-batch_size={batch_size}.yaml"
+        )
+        with vcr_.use_cassette(cassette):
+            result = CliRunner().invoke(
+                vectorizer_worker,
+                [
+                    "--db-url",
+                    cli_db_url,
+                    "--once",
+                    "--vectorizer-id",
+                    str(vectorizer_id),
+                ],
+                catch_exceptions=False,
+            )
+
+        assert not result.exception
+        assert result.exit_code == 0
+
+        with conn.cursor(row_factory=dict_row) as cur:
+            cur.execute("SELECT count(*) as count FROM blog_embedding_store;")
+            assert cur.fetchone()["count"] == num_items  # type: ignore
+            cur.execute(
+                "SELECT ai.vectorizer_queue_pending(%s) as count", (vectorizer_id,)
+            )
+            assert cur.fetchone()["count"] == 0  # type: ignore
+
+    @pytest.mark.parametrize(
+        "test_params",
+        [
+            (
+                4,
+                1,
+                2,
+                "chunking_character_text_splitter('content')",
+                "formatting_python_template('$chunk')",
+            ),
+        ],
+    )
+    def test_process_vectorizer_embedding_cache(
+        self,
+        cli_db: tuple[TestDatabase, Connection],
+        cli_db_url: str,
+        configured_openai_vectorizer_id: int,
+        vcr_: Any,
+        test_params: tuple[int, int, int, str, str],
+    ):
+        """Test that cached embeddings are not requested again"""
+        num_items, _, batch_size, _, _ = test_params
+        _, conn = cli_db
+
+        args = [
+            "--db-url",
+            cli_db_url,
+            "--once",
+            "--vectorizer-id",
+            str(configured_openai_vectorizer_id),
+            "--embedding-cache",
+        ]
+        cassette = (
+            f"openai-character_text_splitter-chunk_value-"
+            f"items={num_items}-batch_size={batch_size}.yaml"
+        )
+        with vcr_.use_cassette(cassette):
+            result = CliRunner().invoke(vectorizer_worker, args, catch_exceptions=False)
+        assert result.exit_code == 0
+
+        # Re-enqueue every item without changing its content.
+        with conn.cursor() as cur:
+            cur.execute("UPDATE blog SET content = content")
+
+        with vcr_.use_cassette(cassette) as second_run:
+            result = CliRunner().invoke(vectorizer_worker, args, catch_exceptions=False)
+        assert result.exit_code == 0
+        assert second_run.play_count == 0
+
+        with conn.cursor(row_factory=dict_row) as cur:
+            cur.execute("SELECT count(*) as count FROM blog_embedding_store;")
+            assert cur.fetchone()["count"] == num_items  # type: ignore
+            cur.execute("SELECT count(*) as count FROM ai.vectorizer_embedding_cache;")
+            assert cur.fetchone()["count"] == num_items  # type: ignore
+
+    @pytest.mark.parametrize(
+        "test_params",
+        [
+            (
+                4,
+                1,
+                2,
+                "chunking_character_text_splitter('content')",
+                "formatting_python_template('$chunk')",
+            ),
+        ],
+    )
+    def test_process_vectorizer_incremental_writes(
+        self,
+        cli_db: tuple[TestDatabase, Connection],
+        cli_db_url: str,
+        configured_openai_vectorizer_id: int,
+        vcr_: Any,
+        test_params: tuple[int, int, int, str, str],
+    ):
+        """Test that unchanged chunks are neither embedded nor rewritten"""
+        num_items, _, batch_size, _, _ = test_params
+        _, conn = cli_db
+
+        args = [
+            "--db-url",
+            cli_db_url,
+            "--once",
+            "--vectorizer-id",
+            str(configured_openai_vectorizer_id),
+            "--incremental-writes",
+        ]
+        cassette = (
+            f"openai-character_text_splitter-chunk_value-"
+            f"items={num_items}-batch_size={batch_size}.yaml"
+        )
+        with vcr_.use_cassette(cassette):
+            result = CliRunner().invoke(vectorizer_worker, args, catch_exceptions=False)
+        assert result.exit_code == 0
+
+        with conn.cursor() as cur:
+            cur.execute("SELECT embedding_uuid FROM blog_embedding_store ORDER BY id")
+            uuids = cur.fetchall()
+            # Re-enqueue every item without changing its content.
+            cur.execute("UPDATE blog SET content = content")
+
+        with vcr_.use_cassette(cassette) as second_run:
+            result = CliRunner().invoke(vectorizer_worker, args, catch_exceptions=False)
+        assert result.exit_code == 0
+        assert second_run.play_count == 0
+
+        with conn.cursor() as cur:
+            cur.execute("SELECT embedding_uuid FROM blog_embedding_store ORDER BY id")
+            assert cur.fetchall() == uuids
+            cur.execute(
+                "SELECT ai.vectorizer_queue_pending(%s)",
+                (configured_openai_vectorizer_id,),
+            )
+            assert cur.fetchone()[0] == 0  # type: ignore
+
+    @pytest.mark.parametrize(
+        "test_params",
+        [
+            (
+                1,
+                1,
+                1,
+                "chunking_character_text_splitter('content')",
+                "formatting_python_template('$chunk')",
+            ),
+        ],
+    )
+    def test_get_vectorizer_reuses_known_vectorizers(
+        self,
+        cli_db_url: str,
+        configured_openai_vectorizer_id: int,
+        test_params: tuple[int, int, int, str, str],  # noqa: ARG002
+    ):
+        """Test that vectorizers, and their embedders, outlive poll cycles"""
+
+        async def load_vectorizers():
+            known_vectorizers: KnownVectorizers = {}
+            async with AsyncConnectionPool(cli_db_url, open=False) as pool:
+                first = await get_vectorizer(
+                    pool, configured_openai_vectorizer_id, known_vectorizers
+                )
+                second = await get_vectorizer(
+                    pool, configured_openai_vectorizer_id, known_vectorizers
+                )
+                os.environ["OPENAI_API_KEY"] = "a rotated key"
+                third = await get_vectorizer(
+                    pool, configured_openai_vectorizer_id, known_vectorizers
+                )
+            return first, second, third
+
+        first, second, third = asyncio.run(load_vectorizers())
+        assert second is first
+        assert third is not first
+
     @pytest.mark.parametrize(
         "test_params",
         [